@@ -7,6 +7,7 @@ from django.utils.text import slugify
 class SlugifiedNameMixin(models.Model):
     name = models.CharField(max_length=255, unique=True)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         abstract = True
@@ -77,7 +78,6 @@ class Medicine(SlugifiedNameMixin):
     image = models.ImageField(upload_to="medicine_images", blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
 
     def get_absolute_url(self):
         return reverse("medicine-detail", kwargs={"slug": self.slug})
@@ -90,3 +90,4 @@ class Achievement(models.Model):
     awarder = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to="achievement_images", blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -1,5 +1,7 @@
 from rest_framework.pagination import PageNumberPagination
+from core.pagination import EstimatedCountPaginator
 
 
 class DefaultPagination(PageNumberPagination):
+    django_paginator_class = EstimatedCountPaginator
     page_size = 20
@@ -1,19 +1,21 @@
 from rest_framework import serializers
+from core.sparse import SparseFieldsMixin
 from .models import *
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ["id", "name", "slug", "description", "image"]
 
 
-class DiseaseSerializer(serializers.ModelSerializer):
+class DiseaseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer()
 
     class Meta:
         model = Disease
         fields = ["id", "name", "slug", "description", "category", "image"]
+        expandable_fields = ["category"]
 
 
 class CreateDiseaseSerializer(serializers.ModelSerializer):
@@ -26,7 +28,7 @@ class CreateDiseaseSerializer(serializers.ModelSerializer):
         fields = ["name", "description", "image"]
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Doctor
         fields = [
@@ -40,12 +42,13 @@ class DoctorSerializer(serializers.ModelSerializer):
         ]
 
 
-class TreatmentSerializer(serializers.ModelSerializer):
+class TreatmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     disease = DiseaseSerializer()
 
     class Meta:
         model = Treatment
         fields = ["id", "name", "slug", "disease", "description", "image"]
+        expandable_fields = ["disease"]
 
 
 class CreateTreatmentSerializer(serializers.ModelSerializer):
@@ -66,7 +69,7 @@ class CreateTreatmentSerializer(serializers.ModelSerializer):
         fields = ["name", "description", "image"]
 
 
-class MedicineSerializer(serializers.ModelSerializer):
+class MedicineSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Medicine
         fields = [
@@ -87,7 +90,7 @@ class MedicineSerializer(serializers.ModelSerializer):
         ]
 
 
-class AchievementSerializer(serializers.ModelSerializer):
+class AchievementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Achievement
         fields = [
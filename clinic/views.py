@@ -1,6 +1,10 @@
 from rest_framework import viewsets
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from core.compiled import CompiledListMixin
+from core.conditional import ConditionalGetMixin
+from core.sparse import SparseFieldsViewMixin
+from search.filters import IndexedSearchFilter
 from .models import *
 from .serializers import *
 from .permissions import IsAdminOrReadOnly
@@ -8,7 +12,7 @@ from .pagination import DefaultPagination
 from .filters import DiseaseFilter
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -16,14 +20,21 @@ class CategoryViewSet(viewsets.ModelViewSet):
     lookup_field = "slug"
 
 
-class DiseaseViewSet(viewsets.ModelViewSet):
+class DiseaseViewSet(ConditionalGetMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Disease.objects.all()
     permission_classes = [IsAdminOrReadOnly]
     pagination_class = DefaultPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
     filterset_class = DiseaseFilter
     search_fields = ["name"]
     lookup_field = "slug"
+    conditional_timestamp_fields = ["updated_at", "category__updated_at"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.field_expanded("category"):
+            queryset = queryset.select_related("category")
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method in ["POST", "PUT", "PATCH"]:
@@ -31,24 +42,42 @@ class DiseaseViewSet(viewsets.ModelViewSet):
         return DiseaseSerializer
 
 
-class DoctorViewSet(viewsets.ModelViewSet):
+class DoctorViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [IsAdminOrReadOnly]
     pagination_class = DefaultPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = ["specializations"]
     search_fields = ["name"]
 
 
-class TreatmentViewSet(viewsets.ModelViewSet):
+class TreatmentViewSet(
+    ConditionalGetMixin,
+    SparseFieldsViewMixin,
+    CompiledListMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Treatment.objects.all()
     permission_classes = [IsAdminOrReadOnly]
     pagination_class = DefaultPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = ["disease"]
     search_fields = ["name"]
     lookup_field = "slug"
+    conditional_timestamp_fields = [
+        "updated_at",
+        "disease__updated_at",
+        "disease__category__updated_at",
+    ]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.field_expanded("disease.category"):
+            queryset = queryset.select_related("disease__category")
+        elif self.field_expanded("disease"):
+            queryset = queryset.select_related("disease")
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method in ["POST", "PUT"]:
@@ -56,19 +85,19 @@ class TreatmentViewSet(viewsets.ModelViewSet):
         return TreatmentSerializer
 
 
-class MedicineViewSet(viewsets.ModelViewSet):
+class MedicineViewSet(ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
     permission_classes = [IsAdminOrReadOnly]
     pagination_class = DefaultPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, OrderingFilter]
     filterset_fields = ["is_prescription_required"]
     search_fields = ["name"]
     ordering_fields = ["expiry_date"]
     lookup_field = "slug"
 
 
-class AchievementViewSet(viewsets.ModelViewSet):
+class AchievementViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Achievement.objects.all()
     serializer_class = AchievementSerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -1,7 +1,45 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User as BaseUser
-from .models import User
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import EmailOutbox, Task, User
+
+
+class LinkedObjectAdminMixin:
+    """
+    Changelist columns for a ``content_obj`` generic foreign key. Objects are
+    prefetched, so a page costs one query per content type instead of one
+    per row. Other foreign keys shown in list_display have to be listed in
+    list_select_related.
+    """
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("content_obj")
+
+    def get_list_select_related(self, request):
+        # The changelist skips list_select_related when get_queryset() already
+        # selected something, so the content type is added here instead.
+        related = super().get_list_select_related(request)
+        if related is True:
+            return related
+        return [*(related or []), "content_type"]
+
+    def linked_object(self, instance):
+        if not (instance.content_type_id and instance.object_id):
+            return "None"
+        obj = instance.content_obj
+        if obj is None:
+            return "Deleted"
+        content_type = instance.content_type
+        url = reverse(
+            f"admin:{content_type.app_label}_{content_type.model}_change",
+            args=[obj.pk],
+        )
+        return format_html('<a href="{}">{}</a>', url, str(obj))
+
+    linked_object.short_description = "Object"
+    linked_object.admin_order_field = "object_id"
 
 
 @admin.register(User)
@@ -26,3 +64,18 @@ class UserAdmin(BaseUserAdmin):
             },
         ),
     )
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ["subject", "to", "status", "attempts", "next_attempt_at"]
+    list_filter = ["status"]
+    search_fields = ["subject"]
+    readonly_fields = ["created_at", "sent_at"]
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ["name", "status", "priority", "attempts", "run_at"]
+    list_filter = ["status", "name"]
+    readonly_fields = ["created_at", "finished_at", "locked_until"]
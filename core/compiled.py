@@ -0,0 +1,276 @@
+from collections import defaultdict
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.relations import PKOnlyObject
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .sparse import get_field_selection
+
+
+class CompileError(Exception):
+    pass
+
+
+def compiled(*columns):
+    """
+    Marks ``compiled_<field>`` serializer methods, which stand in for fields
+    that are not plain columns. The method gets a page of rows holding the
+    listed ``.values()`` columns plus the serializer context, and returns one
+    attribute per row; those still go through the field's to_representation,
+    except for SerializerMethodFields, whose result is used as is.
+    """
+
+    def decorator(method):
+        method.compiled_columns = columns
+        return method
+
+    return decorator
+
+
+def represent(field, value):
+    # Serializer.to_representation checks the primary key of PKOnlyObject.
+    check_for_none = value.pk if isinstance(value, PKOnlyObject) else value
+    return None if check_for_none is None else field.to_representation(value)
+
+
+def get_model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+class SerializerPlan:
+    """
+    Field plan of a read-only serializer over ``.values()`` rows. Every field
+    becomes a step that renders a whole page at once. Nested serializers made
+    of plain columns are read through joins; the others run one query per
+    relation, like prefetch_related, without building models.
+    """
+
+    def __init__(self, serializer, model, queryset=None, prefix=""):
+        self.model = model
+        self.queryset = queryset
+        self.prefix = prefix
+        self.annotations = set()
+        if queryset is not None:
+            self.annotations = set(queryset.query.annotations)
+        self.columns = {f"{prefix}pk"}
+        self.steps = [
+            (name, self.compile_field(serializer, name, field))
+            for name, field in serializer.fields.items()
+            if not field.write_only
+        ]
+
+    @property
+    def joined(self):
+        return self.queryset is None
+
+    def get_column(self, field):
+        name = field.source_attrs[0] if field.source_attrs else None
+        model_field = get_model_field(self.model, name)
+        if name not in self.annotations and not (model_field and model_field.concrete):
+            return None
+        return self.prefix + "__".join(field.source_attrs)
+
+    def compile_field(self, serializer, name, field):
+        hook = getattr(serializer, f"compiled_{name}", None)
+        if hook is not None:
+            if self.joined:
+                raise CompileError(f"Cannot join field '{name}'.")
+            self.columns.update(hook.compiled_columns)
+            if isinstance(field, serializers.SerializerMethodField):
+                return hook
+            return lambda rows, context: [
+                represent(field, value) for value in hook(rows, context)
+            ]
+        if isinstance(field, serializers.ListSerializer):
+            return self.compile_many(field)
+        if isinstance(field, serializers.BaseSerializer):
+            return self.compile_nested(field)
+
+        column = self.get_column(field)
+        if column is None:
+            if field.default is empty:
+                raise CompileError(f"Cannot compile field '{name}'.")
+            value = represent(field, field.get_default())
+            return lambda rows, context: [value] * len(rows)
+
+        if isinstance(field, serializers.SlugRelatedField):
+            column = f"{column}__{field.slug_field}"
+            self.columns.add(column)
+            return lambda rows, context: [row[column] for row in rows]
+        self.columns.add(column)
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            return lambda rows, context: [
+                represent(field, PKOnlyObject(row[column])) for row in rows
+            ]
+        if isinstance(field, serializers.RelatedField):
+            raise CompileError(f"Cannot compile related field '{name}'.")
+        if isinstance(field, serializers.FileField):
+            return self.compile_file(field, column)
+        return lambda rows, context: [represent(field, row[column]) for row in rows]
+
+    def compile_file(self, field, column):
+        storage = self.model._meta.get_field(field.source).storage
+        use_url = getattr(field, "use_url", api_settings.UPLOADED_FILES_USE_URL)
+
+        def render(rows, context):
+            request = context.get("request")
+            values = []
+            for row in rows:
+                name = row[column]
+                if not name:
+                    values.append(None)
+                elif not use_url:
+                    values.append(name)
+                elif request is not None:
+                    values.append(request.build_absolute_uri(storage.url(name)))
+                else:
+                    values.append(storage.url(name))
+            return values
+
+        return render
+
+    def get_related_plan(self, serializer, model):
+        if self.joined:
+            raise CompileError(f"Cannot join relation '{serializer.field_name}'.")
+        queryset = model._default_manager.all()
+        if hasattr(serializer, "get_compiled_queryset"):
+            queryset = serializer.get_compiled_queryset(queryset)
+        return SerializerPlan(serializer, model, queryset)
+
+    def compile_nested(self, field):
+        relation = get_model_field(self.model, field.source)
+        forward = relation is not None and relation.concrete and relation.is_relation
+        if not forward or relation.many_to_many:
+            raise CompileError(f"Cannot compile nested field '{field.field_name}'.")
+        column = self.prefix + field.source
+        self.columns.add(column)
+
+        if not hasattr(field, "get_compiled_queryset"):
+            try:
+                plan = SerializerPlan(
+                    field, relation.related_model, prefix=f"{column}__"
+                )
+            except CompileError:
+                pass
+            else:
+                self.columns.update(plan.columns)
+                return lambda rows, context: [
+                    None if row[column] is None else data
+                    for row, data in zip(rows, plan.serialize(rows, context))
+                ]
+
+        plan = self.get_related_plan(field, relation.related_model)
+
+        def render(rows, context):
+            ids = {row[column] for row in rows if row[column] is not None}
+            related = {
+                row["pk"]: data for row, data in plan.fetch(context, pk__in=ids)
+            }
+            return [
+                None if row[column] is None else related.get(row[column])
+                for row in rows
+            ]
+
+        return render
+
+    def compile_many(self, field):
+        relation = get_model_field(self.model, field.source)
+        if relation is None or not relation.one_to_many:
+            raise CompileError(f"Cannot compile nested field '{field.field_name}'.")
+        remote = relation.field.name
+        plan = self.get_related_plan(field.child, relation.related_model)
+        plan.columns.add(remote)
+
+        def render(rows, context):
+            grouped = defaultdict(list)
+            pks = [row["pk"] for row in rows]
+            for row, data in plan.fetch(context, **{f"{remote}__in": pks}):
+                grouped[row[remote]].append(data)
+            return [grouped[row["pk"]] for row in rows]
+
+        return render
+
+    def values(self, queryset, extra=()):
+        columns = self.columns | set(extra)
+        return queryset.prefetch_related(None).values(*columns)
+
+    def fetch(self, context, **filters):
+        rows = list(self.values(self.queryset.filter(**filters).order_by("pk")))
+        return [(row, data) for row, data in zip(rows, self.serialize(rows, context))]
+
+    def serialize(self, rows, context):
+        names = [name for name, _ in self.steps]
+        columns = [render(rows, context) for _, render in self.steps]
+        return [dict(zip(names, values)) for values in zip(*columns)] if rows else []
+
+
+_plans = {}
+
+
+def get_serializer_plan(serializer, queryset):
+    """
+    Plan for ``serializer`` over ``queryset``, or None when one of its fields
+    cannot be compiled. Plans are cached per serializer class and queryset
+    annotations; sparse fieldset requests get a fresh one.
+    """
+    fields, expand = get_field_selection(serializer.context.get("request"))
+    key = (type(serializer), frozenset(queryset.query.annotations))
+    if fields is None and expand is None and key in _plans:
+        return _plans[key]
+    try:
+        plan = SerializerPlan(serializer, queryset.model, queryset)
+    except CompileError:
+        plan = None
+    if fields is None and expand is None:
+        _plans[key] = plan
+    return plan
+
+
+class CompiledListMixin:
+    """
+    Serves list actions from ``.values()`` rows through a compiled plan of the
+    serializer, so no model instances are built. The output matches the
+    regular serializer; views whose serializer cannot be compiled, or that set
+    ``compiled_list = False``, take the regular path.
+    """
+
+    compiled_list = True
+
+    def get_compiled_ordering_columns(self, queryset):
+        # Keyset pagination reads the ordering columns back from each row.
+        names = ["id", *queryset.model._meta.ordering]
+        names += getattr(self, "ordering", None) or []
+        ordering_fields = getattr(self, "ordering_fields", None)
+        if isinstance(ordering_fields, (list, tuple)):
+            names += ordering_fields
+        annotations = queryset.query.annotations
+        columns = set()
+        for name in names:
+            if not isinstance(name, str):
+                continue
+            name = name.lstrip("-")
+            model_field = get_model_field(queryset.model, name)
+            if name in annotations or (model_field and model_field.concrete):
+                columns.add(name)
+        return columns
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        serializer = self.get_serializer(many=True)
+        plan = None
+        if self.compiled_list:
+            plan = get_serializer_plan(serializer.child, queryset)
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(queryset)
+        rows = plan.values(queryset, self.get_compiled_ordering_columns(queryset))
+        context = serializer.context
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.serialize(page, context))
+        return Response(plan.serialize(list(rows), context))
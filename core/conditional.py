@@ -0,0 +1,82 @@
+import hashlib
+import json
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ConditionalGetMixin:
+    """
+    ETag and Last-Modified support for list and detail GETs. Validators come
+    from one aggregate query over the filtered queryset (latest timestamp of
+    every ``conditional_timestamp_fields`` entry plus the row count), so a
+    matching request gets a 304 without running the serializer.
+
+    Views whose responses are cheap to build, e.g. served from a cache, set
+    ``conditional_etag_from_data`` to hash the response data instead.
+    """
+
+    conditional_timestamp_fields = ["updated_at"]
+    conditional_etag_from_data = False
+
+    def get_conditional_validators(self, request, queryset):
+        aggregates = {
+            f"timestamp_{index}": Max(field)
+            for index, field in enumerate(self.conditional_timestamp_fields)
+        }
+        metadata = queryset.order_by().aggregate(rows=Count("pk"), **aggregates)
+        timestamps = [
+            value for key, value in metadata.items() if key.startswith("timestamp_")
+        ]
+        last_modified = max(filter(None, timestamps), default=None)
+        raw = repr((request.get_host(), request.get_full_path(), metadata))
+        etag = quote_etag(hashlib.md5(raw.encode("utf-8")).hexdigest())
+        return etag, last_modified
+
+    def get_data_etag(self, data):
+        raw = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+        return quote_etag(hashlib.md5(raw.encode("utf-8")).hexdigest())
+
+    def conditional_response(self, request, get_queryset, build_response):
+        if self.conditional_etag_from_data:
+            response = build_response()
+            if response.status_code != 200:
+                return response
+            response["ETag"] = self.get_data_etag(response.data)
+            return get_conditional_response(
+                request._request, etag=response["ETag"], response=response
+            )
+
+        etag, last_modified = self.get_conditional_validators(request, get_queryset())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = build_response()
+            if response.status_code != 200:
+                return response
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        return self.conditional_response(
+            request,
+            lambda: self.filter_queryset(self.get_queryset()),
+            lambda: parent.list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.conditional_response(
+            request,
+            lambda: self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            ),
+            lambda: parent.retrieve(request, *args, **kwargs),
+        )
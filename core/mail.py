@@ -0,0 +1,116 @@
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import EmailOutbox
+
+DEFAULTS = {
+    "BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+    "BATCH_SIZE": 50,
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY": 60,
+    "LEASE": 5 * 60,
+}
+
+
+def get_outbox_settings():
+    return {**DEFAULTS, **getattr(settings, "EMAIL_OUTBOX", {})}
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """
+    Queues messages in EmailOutbox instead of talking to the mail server;
+    the send_queued_mail command delivers them.
+    """
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        try:
+            rows = [EmailOutbox.from_message(message) for message in email_messages]
+            EmailOutbox.objects.bulk_create(rows)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(rows)
+
+
+def claim_queued_mail(batch_size, lease):
+    """
+    Lease up to ``batch_size`` due messages by pushing their next attempt past
+    the lease, so concurrent workers skip them while they are being sent.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.STATUS_QUEUED, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        EmailOutbox.objects.filter(pk__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=lease)
+        )
+    return list(EmailOutbox.objects.filter(pk__in=ids).order_by("pk"))
+
+
+def get_retry_delay(attempts, base_delay):
+    # Exponential backoff with full jitter.
+    return random.uniform(0, base_delay * 2 ** (attempts - 1))
+
+
+def send_queued_mail(batch_size=None):
+    """
+    Send one batch of queued messages over a single mail server connection.
+    Returns (sent, failed); failed messages are retried with backoff until
+    MAX_ATTEMPTS is reached.
+    """
+    options = get_outbox_settings()
+    batch = claim_queued_mail(batch_size or options["BATCH_SIZE"], options["LEASE"])
+    if not batch:
+        return 0, 0
+
+    sent_ids = []
+    failed = 0
+    connection = get_connection(options["BACKEND"])
+    try:
+        for row in batch:
+            try:
+                connection.open()
+                connection.send_messages([row.to_message(connection)])
+            except Exception as e:
+                # The connection may be unusable now; the next message opens
+                # a fresh one.
+                connection.close()
+                row.attempts += 1
+                row.last_error = str(e)
+                if row.attempts >= options["MAX_ATTEMPTS"]:
+                    row.status = EmailOutbox.STATUS_FAILED
+                else:
+                    row.next_attempt_at = timezone.now() + timedelta(
+                        seconds=get_retry_delay(row.attempts, options["RETRY_DELAY"])
+                    )
+                row.save(
+                    update_fields=[
+                        "attempts",
+                        "last_error",
+                        "status",
+                        "next_attempt_at",
+                    ]
+                )
+                failed += 1
+            else:
+                sent_ids.append(row.pk)
+    finally:
+        connection.close()
+        EmailOutbox.objects.filter(pk__in=sent_ids).update(
+            status=EmailOutbox.STATUS_SENT,
+            attempts=F("attempts") + 1,
+            sent_at=timezone.now(),
+        )
+    return len(sent_ids), failed
@@ -0,0 +1,89 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+from clinic.views import MedicineViewSet, TreatmentViewSet
+from core.compiled import get_serializer_plan
+from feedback.views import ReviewViewSet
+from store.views import OrderViewSet, ProductViewSet
+
+VIEWSETS = {
+    "products": ProductViewSet,
+    "medicines": MedicineViewSet,
+    "treatments": TreatmentViewSet,
+    "orders": OrderViewSet,
+    "reviews": ReviewViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the regular list serializers against their compiled plans on "
+        "the rows already in the database, and check both render the same "
+        "JSON. Times include fetching the rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--user", help="Username to list as; defaults to the first superuser."
+        )
+        parser.add_argument(
+            "--endpoint", action="append", choices=list(VIEWSETS), dest="endpoints"
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by("pk")
+        if options["user"]:
+            user = users.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user named '{options['user']}'.")
+        else:
+            user = users.filter(is_superuser=True).first()
+
+        for name in options["endpoints"] or list(VIEWSETS):
+            view = self.get_view(VIEWSETS[name], user)
+            queryset = view.filter_queryset(view.get_queryset())
+            serializer = view.get_serializer(many=True)
+            plan = get_serializer_plan(serializer.child, queryset)
+            if plan is None:
+                self.stdout.write(f"{name:>10}: serializer cannot be compiled")
+                continue
+
+            def regular():
+                page = list(queryset[: options["rows"]])
+                return view.get_serializer(page, many=True).data
+
+            def compiled():
+                rows = list(plan.values(queryset)[: options["rows"]])
+                return plan.serialize(rows, serializer.context)
+
+            regular_time, regular_data = self.measure(regular, options["repeat"])
+            compiled_time, compiled_data = self.measure(compiled, options["repeat"])
+            renderer = JSONRenderer()
+            same = renderer.render(regular_data) == renderer.render(compiled_data)
+            self.stdout.write(
+                f"{name:>10}: {len(regular_data)} rows, "
+                f"regular {regular_time * 1000:.2f}ms, "
+                f"compiled {compiled_time * 1000:.2f}ms "
+                f"({regular_time / compiled_time:.1f}x), "
+                f"output {'identical' if same else 'DIFFERS'}"
+            )
+
+    def get_view(self, viewset, user):
+        request = APIRequestFactory().get("/")
+        if user is not None:
+            force_authenticate(request, user)
+        view = viewset(action_map={"get": "list"}, action="list")
+        view.args, view.kwargs, view.format_kwarg = (), {}, None
+        view.request = view.initialize_request(request)
+        return view
+
+    def measure(self, fn, repeat):
+        data = fn()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat, data
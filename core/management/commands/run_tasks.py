@@ -0,0 +1,68 @@
+import signal
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.utils.module_loading import autodiscover_modules
+from core.tasks import get_task_settings, requeue_expired_tasks, run_pending_tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=2)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1,
+            help="Tasks claimed at once by each thread.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Seconds a thread sleeps when the queue is empty.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once no due tasks remain instead of polling forever.",
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules("tasks")
+        task_settings = get_task_settings()
+        interval = options["interval"] or task_settings["POLL_INTERVAL"]
+        stop = threading.Event()
+
+        def work():
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    if run_pending_tasks(options["batch_size"]):
+                        continue
+                    if options["burst"]:
+                        break
+                    stop.wait(interval)
+            finally:
+                connection.close()
+
+        # Let running tasks finish when the process manager asks us to stop.
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        requeue_expired_tasks()
+        next_requeue = time.monotonic() + task_settings["LEASE"]
+        workers = [threading.Thread(target=work) for _ in range(options["threads"])]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Running tasks with {options['threads']} threads.")
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(min(interval, 1))
+                if time.monotonic() >= next_requeue:
+                    requeue_expired_tasks()
+                    next_requeue = time.monotonic() + task_settings["LEASE"]
+        except KeyboardInterrupt:
+            stop.set()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from core.mail import get_outbox_settings, send_queued_mail
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox email in batches over a reused connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to sleep between polls when running with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] or get_outbox_settings()["BATCH_SIZE"]
+        while True:
+            sent = failed = 0
+            while True:
+                batch_sent, batch_failed = send_queued_mail(batch_size)
+                sent += batch_sent
+                failed += batch_failed
+                if batch_sent + batch_failed < batch_size:
+                    break
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} queued emails, {failed} failed.")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -1,5 +1,9 @@
+import base64
+from email.mime.base import MIMEBase
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.mail import EmailMultiAlternatives
+from django.utils import timezone
 from django.forms import ValidationError
 
 
@@ -39,3 +43,123 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.get_full_name()
+
+
+class EmailOutbox(models.Model):
+    STATUS_QUEUED = "Q"
+    STATUS_SENT = "S"
+    STATUS_FAILED = "F"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    subject = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    content_subtype = models.CharField(max_length=20, default="plain")
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+    # [content, mimetype] pairs, e.g. the HTML part of a multipart message.
+    alternatives = models.JSONField(default=list)
+    # [filename, base64 content, mimetype] triples.
+    attachments = models.JSONField(default=list)
+
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default=STATUS_QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name_plural = "email outbox"
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    @classmethod
+    def from_message(cls, message):
+        attachments = []
+        for attachment in message.attachments:
+            if isinstance(attachment, MIMEBase):
+                raise ValueError("MIME attachments cannot be queued.")
+            filename, content, mimetype = attachment
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            attachments.append(
+                [filename, base64.b64encode(content).decode("ascii"), mimetype]
+            )
+        return cls(
+            subject=message.subject,
+            body=message.body,
+            content_subtype=message.content_subtype,
+            from_email=message.from_email or "",
+            to=list(message.to),
+            cc=list(message.cc),
+            bcc=list(message.bcc),
+            reply_to=list(message.reply_to),
+            headers=dict(message.extra_headers),
+            alternatives=[list(pair) for pair in getattr(message, "alternatives", [])],
+            attachments=attachments,
+        )
+
+    def to_message(self, connection=None):
+        message = EmailMultiAlternatives(
+            subject=self.subject,
+            body=self.body,
+            from_email=self.from_email or None,
+            to=self.to,
+            cc=self.cc,
+            bcc=self.bcc,
+            reply_to=self.reply_to,
+            headers=self.headers,
+            alternatives=[tuple(pair) for pair in self.alternatives],
+            connection=connection,
+        )
+        message.content_subtype = self.content_subtype
+        for filename, content, mimetype in self.attachments:
+            message.attach(filename, base64.b64decode(content), mimetype)
+        return message
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
+
+
+class Task(models.Model):
+    STATUS_QUEUED = "Q"
+    STATUS_RUNNING = "R"
+    STATUS_DONE = "D"
+    STATUS_DEAD = "X"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_DEAD, "Dead"),
+    ]
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # Higher priorities are claimed first.
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default=STATUS_QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "priority", "run_at"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
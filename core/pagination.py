@@ -0,0 +1,307 @@
+import datetime
+import json
+from base64 import b64decode, b64encode
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections
+from django.db.models import F, Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates to milliseconds, which would make rows
+        # sharing a millisecond reappear on the next page.
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def estimate_table_rows(model, using="default"):
+    """
+    Row count from the engine's table statistics, or None when the backend
+    keeps none. InnoDB and PostgreSQL estimates can be off by a wide margin.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == "mysql":
+        sql = (
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+        )
+    elif connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)"
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    # PostgreSQL reports -1 for tables that were never analyzed.
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids an exact COUNT(*) over large tables. Querysets are
+    counted up to ``count_cap`` rows with a LIMITed subquery; past the cap,
+    unfiltered ones report the table statistics and filtered ones the cap,
+    so their later pages are not reachable.
+    """
+
+    count_cap = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+        count = queryset.order_by()[: self.count_cap + 1].count()
+        if count <= self.count_cap:
+            return count
+        if not queryset.query.where and not queryset.query.distinct:
+            # Statistics can lag behind the table, never report fewer rows
+            # than were just counted.
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_cap:
+                return estimate
+        return self.count_cap
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over the view's ordering with ``id`` as a tiebreaker.
+    Each page is fetched with a ``WHERE (a, id) > (last_a, last_id)`` style
+    filter instead of an OFFSET, and no COUNT(*) is run, so deep pages cost
+    the same as the first one.
+    """
+
+    page_size = 20
+    cursor_query_param = "cursor"
+    tiebreaker = "id"
+    invalid_cursor_message = "Invalid cursor"
+    ranked_results_message = (
+        "Results ranked by relevance cannot be paged with a cursor, "
+        "pass an ordering or use page numbers"
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_ranked(request, queryset, view):
+            raise ParseError(self.ranked_results_message)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [(name, not descending) for name, descending in ordering]
+        queryset = queryset.order_by(
+            *[
+                (
+                    F(name).desc(nulls_last=True)
+                    if descending
+                    else F(name).asc(nulls_first=True)
+                )
+                for name, descending in ordering
+            ]
+        )
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(ordering, position))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.next_position = self.get_position(results[-1]) if results else None
+        self.previous_position = self.get_position(results[0]) if results else None
+        return results
+
+    def is_ranked(self, request, queryset, view):
+        """
+        Whether the queryset is ordered by an expression a cursor cannot
+        encode, such as the relevance order of IndexedSearchFilter.
+        """
+        return not request.query_params.get(api_settings.ORDERING_PARAM) and any(
+            not isinstance(field, str) for field in queryset.query.order_by
+        )
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, "filter_backends", []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = [
+                field
+                for field in (queryset.query.order_by or queryset.model._meta.ordering)
+                if isinstance(field, str)
+            ]
+        if not ordering:
+            ordering = getattr(view, "ordering", None) or []
+        if isinstance(ordering, str):
+            ordering = [ordering]
+
+        fields = [(field.lstrip("-"), field.startswith("-")) for field in ordering]
+        names = [name for name, _ in fields]
+        if self.tiebreaker not in names and "pk" not in names:
+            fields.append((self.tiebreaker, fields[0][1] if fields else False))
+        return fields
+
+    def get_position_filter(self, ordering, position):
+        # (a, b, id) > (x, y, z) expands to a > x OR (a = x AND b > y) OR ...
+        # NULLs sort first ascending and last descending, matching order_by().
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending), value in zip(ordering, position):
+            if value is None:
+                after = (
+                    Q(**{f"{name}__isnull": False}) if not descending else Q(pk__in=[])
+                )
+                same = Q(**{f"{name}__isnull": True})
+            else:
+                if descending:
+                    after = Q(**{f"{name}__lt": value}) | Q(**{f"{name}__isnull": True})
+                else:
+                    after = Q(**{f"{name}__gt": value})
+                same = Q(**{name: value})
+            condition |= equal & after
+            equal &= same
+        return condition
+
+    def get_position(self, instance):
+        position = []
+        for name, _ in self.ordering:
+            if isinstance(instance, dict):
+                # Rows of a compiled list action.
+                position.append(instance[name])
+                continue
+            value = instance
+            for attr in name.split("__"):
+                value = getattr(value, attr, None)
+            position.append(getattr(value, "pk", value))
+        return position
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({"p": position, "r": int(reverse)}, cls=CursorEncoder)
+        cursor = b64encode(payload.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(b64decode(encoded.encode("ascii")).decode("utf-8"))
+            position = payload["p"]
+            if len(position) != len(self.ordering):
+                raise ValueError
+            position = [
+                None if value is None else self.get_field(model, name).to_python(value)
+                for (name, _), value in zip(self.ordering, position)
+            ]
+            return position, bool(payload.get("r"))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_field(self, model, name):
+        if name == "pk":
+            return model._meta.pk
+        *relations, name = name.split("__")
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        field = model._meta.get_field(name)
+        return getattr(field, "target_field", field)
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class SelectablePagination(PageNumberPagination):
+    """
+    Page-number pagination that switches to KeysetPagination when a request
+    carries a ``cursor`` or ``?pagination=cursor``. Views can also opt in for
+    every request with ``keyset_pagination = True``; they keep page numbers
+    for results ranked by relevance, which a cursor cannot follow.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+    mode_query_param = "pagination"
+    keyset_pagination_class = KeysetPagination
+
+    def use_keyset(self, request, queryset, view):
+        if (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.keyset_pagination_class.cursor_query_param in request.query_params
+        ):
+            return True
+        return getattr(
+            view, "keyset_pagination", False
+        ) and not self.keyset_pagination_class().is_ranked(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request, queryset, view):
+            self.keyset = self.keyset_pagination_class()
+            self.keyset.page_size = self.get_page_size(request) or self.page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_previous_link()
+        return super().get_previous_link()
@@ -6,6 +6,7 @@ from djoser.serializers import (
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from feedback.models import Review
 from feedback.serializers import CreateReviewSerializer, ReviewSerializer
+from .sparse import SparseFieldsMixin
 
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -39,7 +40,7 @@ class UserSerializer(BaseUserSerializer):
         read_only_fields = ("username", "email", "mobile_number", "is_staff")
 
 
-class DisplayUserSerializer(BaseUserSerializer):
+class DisplayUserSerializer(SparseFieldsMixin, BaseUserSerializer):
     class Meta(BaseUserSerializer.Meta):
         fields = ["username", "first_name", "last_name"]
 
@@ -47,6 +48,9 @@ class DisplayUserSerializer(BaseUserSerializer):
 class ProductReviewSerializer(ReviewSerializer):
     user = DisplayUserSerializer(read_only=True)
 
+    class Meta(ReviewSerializer.Meta):
+        expandable_fields = ["user"]
+
 
 class CreateProductReviewSerializer(CreateReviewSerializer):
     def save(self, **kwargs):
@@ -0,0 +1,110 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_QUERY_PARAM = "fields"
+EXPAND_QUERY_PARAM = "expand"
+
+
+def parse_field_paths(value):
+    """
+    Turn ``"id,cart_items.quantity,cart_items.product.name"`` into
+    ``{"id": {}, "cart_items": {"quantity": {}, "product": {"name": {}}}}``.
+    """
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split("."))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def get_field_selection(request):
+    """
+    The parsed ``fields`` and ``expand`` trees of a read request, each None
+    when the parameter is absent. Writes always get the full representation.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    selection = []
+    for param in [FIELDS_QUERY_PARAM, EXPAND_QUERY_PARAM]:
+        value = request.query_params.get(param)
+        selection.append(None if value is None else parse_field_paths(value))
+    return tuple(selection)
+
+
+def descend(fields, expand, name):
+    # A field listed without sub-paths is returned whole; once ``expand`` is
+    # given, relations below it stay collapsed unless named as well.
+    if fields is not None:
+        fields = fields.get(name) or None
+    if expand is not None:
+        expand = expand.get(name, {})
+    return fields, expand
+
+
+def is_requested(fields, expand, path, expandable=False):
+    names = path.split(".")
+    for name in names:
+        if fields is not None and name not in fields:
+            return False
+        if expandable and expand is not None and name not in expand:
+            return False
+        fields, expand = descend(fields, expand, name)
+    return True
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for ``?fields=`` and ``?expand=``. ``fields`` keeps only
+    the listed fields, with dotted paths reaching into nested serializers.
+    Nested relations named in ``Meta.expandable_fields`` are embedded by
+    default; once ``expand`` is present, those it does not name are rendered
+    as their primary key instead.
+    """
+
+    def get_field_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return reversed(path)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected, expand = get_field_selection(self.context.get("request"))
+        if selected is None and expand is None:
+            return fields
+        for name in self.get_field_path():
+            selected, expand = descend(selected, expand, name)
+
+        if selected is not None:
+            fields = {name: field for name, field in fields.items() if name in selected}
+        if expand is not None:
+            for name in getattr(self.Meta, "expandable_fields", []):
+                if name in fields and name not in expand:
+                    fields[name] = serializers.PrimaryKeyRelatedField(
+                        source=fields[name].source, read_only=True
+                    )
+        return fields
+
+
+class SparseFieldsViewMixin:
+    """
+    Lets ``get_queryset`` skip the joins and prefetches that only feed fields
+    the request left out.
+    """
+
+    def field_requested(self, path):
+        fields, expand = get_field_selection(self.request)
+        return is_requested(fields, expand, path)
+
+    def field_expanded(self, path):
+        fields, expand = get_field_selection(self.request)
+        return is_requested(fields, expand, path, expandable=True)
+
+    def requested_fields(self, prefix=None):
+        if not prefix:
+            return self.field_requested
+        return lambda name: self.field_requested(f"{prefix}.{name}")
@@ -0,0 +1,162 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Task
+
+DEFAULTS = {
+    "LEASE": 5 * 60,
+    "POLL_INTERVAL": 1,
+    "EAGER": False,
+}
+
+registry = {}
+
+
+def get_task_settings():
+    return {**DEFAULTS, **getattr(settings, "TASKS", {})}
+
+
+class TaskFunction:
+    def __init__(self, func, priority=0, max_attempts=5, retry_delay=30):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return self.enqueue(args, kwargs)
+
+    def enqueue(self, args=(), kwargs=None, run_at=None, priority=None):
+        """
+        Queue a call. The row is written in the caller's transaction, so a
+        task queued from a request only becomes visible once it commits.
+        """
+        if get_task_settings()["EAGER"]:
+            self.func(*args, **(kwargs or {}))
+            return None
+        return Task.objects.create(
+            name=self.name,
+            args=list(args),
+            kwargs=kwargs or {},
+            run_at=run_at or timezone.now(),
+            priority=self.priority if priority is None else priority,
+            max_attempts=self.max_attempts,
+        )
+
+    def get_retry_delay(self, attempts):
+        # Exponential backoff with full jitter.
+        return random.uniform(0, self.retry_delay * 2 ** (attempts - 1))
+
+
+def task(func=None, **options):
+    """
+    Register a function as a background task:
+
+        @task(priority=10, max_attempts=3)
+        def resync(pk): ...
+
+        resync.delay(pk)
+    """
+
+    def register(func):
+        task_function = TaskFunction(func, **options)
+        registry[task_function.name] = task_function
+        return task_function
+
+    return register(func) if func is not None else register
+
+
+def requeue_expired_tasks():
+    """
+    Give tasks whose worker died mid-run back to the queue, or dead-letter
+    them if that was their last attempt.
+    """
+    now = timezone.now()
+    expired = Task.objects.filter(status=Task.STATUS_RUNNING, locked_until__lt=now)
+    dead = expired.filter(attempts__gte=F("max_attempts")).update(
+        status=Task.STATUS_DEAD, finished_at=now, last_error="Lease expired"
+    )
+    return expired.update(status=Task.STATUS_QUEUED, locked_until=None) + dead
+
+
+def claim_tasks(limit=1):
+    """
+    Claim up to ``limit`` due tasks, highest priority first. Databases with
+    SKIP LOCKED let concurrent workers pass over each other's rows; elsewhere
+    (SQLite) each candidate is claimed with a guarded UPDATE instead.
+    """
+    now = timezone.now()
+    claim = {
+        "status": Task.STATUS_RUNNING,
+        "locked_until": now + timedelta(seconds=get_task_settings()["LEASE"]),
+        "attempts": F("attempts") + 1,
+    }
+    due = Task.objects.filter(status=Task.STATUS_QUEUED, run_at__lte=now).order_by(
+        "-priority", "run_at", "pk"
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list("pk", flat=True)[:limit])
+            Task.objects.filter(pk__in=ids).update(**claim)
+    else:
+        # Each guarded UPDATE commits on its own; wrapping them in one
+        # transaction would make SQLite writers fail with "database is locked".
+        ids = [
+            pk
+            for pk in due.values_list("pk", flat=True)[:limit]
+            if Task.objects.filter(pk=pk, status=Task.STATUS_QUEUED).update(**claim)
+        ]
+    return list(Task.objects.filter(pk__in=ids).order_by("-priority", "run_at", "pk"))
+
+
+def run_task(job):
+    now = timezone.now
+    task_function = registry.get(job.name)
+    if task_function is None:
+        Task.objects.filter(pk=job.pk).update(
+            status=Task.STATUS_DEAD,
+            finished_at=now(),
+            last_error=f"Unknown task {job.name}",
+        )
+        return False
+    try:
+        task_function.func(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logging.warning(f"Task {job.name} ({job.pk}) failed: {error}")
+        if job.attempts >= job.max_attempts:
+            Task.objects.filter(pk=job.pk).update(
+                status=Task.STATUS_DEAD, finished_at=now(), last_error=error
+            )
+        else:
+            Task.objects.filter(pk=job.pk).update(
+                status=Task.STATUS_QUEUED,
+                locked_until=None,
+                last_error=error,
+                run_at=now()
+                + timedelta(seconds=task_function.get_retry_delay(job.attempts)),
+            )
+        return False
+    Task.objects.filter(pk=job.pk).update(
+        status=Task.STATUS_DONE, locked_until=None, finished_at=now()
+    )
+    return True
+
+
+def run_pending_tasks(limit=1):
+    """Claim and run one batch. Returns the number of tasks claimed."""
+    jobs = claim_tasks(limit)
+    for job in jobs:
+        run_task(job)
+    return len(jobs)
@@ -1,3 +1,348 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from smtplib import SMTPException
+from unittest import mock
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from clinic.models import Category, Disease, Medicine, Treatment
+from clinic.views import MedicineViewSet, TreatmentViewSet
+from feedback.models import Review
+from store.models import Order, OrderItem, Product, ShippingDetail
+from store.views import OrderViewSet, ProductViewSet
+from .compiled import SerializerPlan
+from .mail import send_queued_mail
+from .models import EmailOutbox, Task, User
+from .pagination import EstimatedCountPaginator
+from .tasks import requeue_expired_tasks, run_pending_tasks, task
 
-# Create your tests here.
+
+def setUpModule():
+    # Resolved at startup, possibly against another database.
+    Product._cached_allowed_content_types = None
+
+
+calls = []
+
+
+@task(max_attempts=2, retry_delay=0)
+def record_call(value):
+    calls.append(value)
+
+
+@task(max_attempts=2, retry_delay=0)
+def fail():
+    raise ValueError("Broken")
+
+
+@override_settings(TASKS={"EAGER": False})
+class TaskTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_delay_queues_the_call(self):
+        record_call.delay(1)
+
+        self.assertEqual(calls, [])
+        self.assertEqual(run_pending_tasks(), 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Task.objects.get().status, Task.STATUS_DONE)
+
+    @override_settings(TASKS={"EAGER": True})
+    def test_eager_tasks_run_inline(self):
+        record_call.delay(1)
+
+        self.assertEqual(calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+    def test_higher_priorities_run_first(self):
+        record_call.enqueue([1])
+        record_call.enqueue([2], priority=5)
+
+        run_pending_tasks(limit=2)
+
+        self.assertEqual(calls, [2, 1])
+
+    def test_future_tasks_wait(self):
+        record_call.enqueue([1], run_at=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(run_pending_tasks(), 0)
+
+    def test_failed_tasks_are_retried_then_dead_lettered(self):
+        fail.delay()
+
+        with self.assertLogs(level="WARNING"):
+            run_pending_tasks()
+        job = Task.objects.get()
+        self.assertEqual(job.status, Task.STATUS_QUEUED)
+        self.assertIn("Broken", job.last_error)
+
+        with self.assertLogs(level="WARNING"):
+            run_pending_tasks()
+        self.assertEqual(Task.objects.get().status, Task.STATUS_DEAD)
+
+    def test_tasks_of_dead_workers_are_requeued(self):
+        record_call.delay(1)
+        Task.objects.update(
+            status=Task.STATUS_RUNNING,
+            attempts=1,
+            locked_until=timezone.now() - timedelta(seconds=1),
+        )
+
+        self.assertEqual(requeue_expired_tasks(), 1)
+        self.assertEqual(Task.objects.get().status, Task.STATUS_QUEUED)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException("Connection refused")
+
+
+@override_settings(
+    EMAIL_BACKEND="core.mail.OutboxEmailBackend",
+    EMAIL_OUTBOX={"BACKEND": "django.core.mail.backends.locmem.EmailBackend"},
+)
+class EmailOutboxTests(TestCase):
+    def queue(self, subject="Order shipped"):
+        message = mail.EmailMultiAlternatives(
+            subject, "Plain body", "shop@example.com", ["buyer@example.com"]
+        )
+        message.attach_alternative("<p>HTML body</p>", "text/html")
+        message.attach("invoice.txt", "Total: 100", "text/plain")
+        message.send()
+
+    def test_messages_are_queued_not_sent(self):
+        self.queue()
+
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.STATUS_QUEUED)
+
+    def test_queued_messages_are_sent_intact(self):
+        self.queue()
+
+        self.assertEqual(send_queued_mail(), (1, 0))
+
+        [message] = mail.outbox
+        self.assertEqual(message.subject, "Order shipped")
+        self.assertEqual(message.to, ["buyer@example.com"])
+        self.assertEqual(message.alternatives, [("<p>HTML body</p>", "text/html")])
+        self.assertEqual(
+            message.attachments, [("invoice.txt", "Total: 100", "text/plain")]
+        )
+        row = EmailOutbox.objects.get()
+        self.assertEqual(row.status, EmailOutbox.STATUS_SENT)
+        self.assertEqual(row.attempts, 1)
+
+    def test_leased_messages_are_skipped(self):
+        self.queue()
+        EmailOutbox.objects.update(next_attempt_at=timezone.now() + timedelta(1))
+
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+    @override_settings(
+        EMAIL_OUTBOX={"BACKEND": "core.tests.FailingEmailBackend", "MAX_ATTEMPTS": 2}
+    )
+    def test_failed_messages_are_retried_then_given_up(self):
+        self.queue()
+
+        self.assertEqual(send_queued_mail(), (0, 1))
+        row = EmailOutbox.objects.get()
+        self.assertEqual(row.status, EmailOutbox.STATUS_QUEUED)
+        self.assertEqual(row.last_error, "Connection refused")
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_mail(), (0, 1))
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.STATUS_FAILED)
+
+
+class ConditionalGetTests(APITestCase):
+    def get(self, url, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def create_product(self, name):
+        medicine = Medicine.objects.create(name=name)
+        return Product.objects.create(
+            content_type=ContentType.objects.get_for_model(Medicine),
+            object_id=medicine.pk,
+            unit_price=Decimal("100.00"),
+            stock=5,
+        )
+
+    def test_unchanged_list_is_not_modified(self):
+        Category.objects.create(name="Skin")
+        etag = self.get("/api/clinic/categories/")["ETag"]
+
+        self.assertEqual(self.get("/api/clinic/categories/", etag).status_code, 304)
+
+        Category.objects.create(name="Hair")
+        self.assertEqual(self.get("/api/clinic/categories/", etag).status_code, 200)
+
+    def test_edits_change_the_validators(self):
+        category = Category.objects.create(name="Skin")
+        etag = self.get(f"/api/clinic/categories/{category.slug}/")["ETag"]
+
+        category.description = "Eczema and psoriasis"
+        category.save()
+
+        response = self.get(f"/api/clinic/categories/{category.slug}/", etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unchanged_products_are_not_modified(self):
+        product = self.create_product("Arnica")
+        etag = self.get("/api/store/products/")["ETag"]
+
+        self.assertEqual(self.get("/api/store/products/", etag).status_code, 304)
+
+        product.save()
+        self.assertEqual(self.get("/api/store/products/", etag).status_code, 304)
+
+    def test_product_validators_follow_live_stock(self):
+        product = self.create_product("Arnica")
+        etag = self.get(f"/api/store/products/{product.slug}/")["ETag"]
+
+        Product.objects.filter(pk=product.pk).update(stock=0)
+
+        response = self.get(f"/api/store/products/{product.slug}/", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["stock"], 0)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        for name in ["Skin", "Hair", "Joints", "Digestion"]:
+            Category.objects.create(name=name)
+
+    def count(self, queryset, estimate):
+        paginator = EstimatedCountPaginator(queryset, per_page=2)
+        paginator.count_cap = 3
+        with mock.patch(
+            "core.pagination.estimate_table_rows", return_value=estimate
+        ) as estimate_table_rows:
+            return paginator.count, estimate_table_rows.called
+
+    def test_small_results_are_counted_exactly(self):
+        queryset = Category.objects.filter(name__in=["Skin", "Hair"])
+
+        self.assertEqual(self.count(queryset, 1000), (2, False))
+
+    def test_stale_estimates_fall_back_to_the_cap(self):
+        self.assertEqual(self.count(Category.objects.all(), 2), (3, True))
+
+    def test_large_tables_use_the_estimate(self):
+        self.assertEqual(self.count(Category.objects.all(), 1000), (1000, True))
+
+    def test_large_filtered_results_are_capped(self):
+        queryset = Category.objects.exclude(name="Skin")
+        Category.objects.create(name="Eyes")
+
+        self.assertEqual(self.count(queryset, 1000), (3, False))
+
+
+class CompiledListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="buyer", email="buyer@example.com", mobile_number="9000000001"
+        )
+        self.client.force_authenticate(self.user)
+        disease = Disease.objects.create(
+            name="Eczema", category=Category.objects.create(name="Skin")
+        )
+        detox = Treatment.objects.create(name="Detox", disease=disease)
+        cleanse = Treatment.objects.create(name="Cleanse")
+        arnica = Medicine.objects.create(
+            name="Arnica", image="medicine_images/arnica.png"
+        )
+        products = [
+            self.create_product(arnica, stock=5),
+            self.create_product(detox, stock=0),
+            self.create_product(cleanse, stock=2, discount=Decimal("10.00")),
+        ]
+        Review.objects.create(
+            user=self.user,
+            content_type=ContentType.objects.get_for_model(Product),
+            object_id=products[0].pk,
+            rating=4,
+        )
+        shipping_details = ShippingDetail.objects.create(
+            full_name="Buyer",
+            phone="9000000001",
+            address_line="1 Main Road",
+            city="Kochi",
+            state="Kerala",
+            pincode="682001",
+        )
+        for shipping_details in [shipping_details, None]:
+            order = Order.objects.create(
+                user=self.user,
+                total_price=Decimal("100.00"),
+                shipping_details=shipping_details,
+            )
+            for quantity, product in enumerate(products[:2], start=1):
+                item = OrderItem(order=order, product=product, quantity=quantity)
+                # Lines of the second order predate snapshots.
+                if shipping_details:
+                    item.snapshot_product()
+                item.save()
+
+    def create_product(self, obj, **fields):
+        return Product.objects.create(
+            content_type=ContentType.objects.get_for_model(obj),
+            object_id=obj.pk,
+            unit_price=Decimal("100.00"),
+            **fields,
+        )
+
+    def assertMatchesRegularList(self, view, url):
+        cache.clear()
+        with mock.patch.object(
+            SerializerPlan,
+            "serialize",
+            autospec=True,
+            side_effect=SerializerPlan.serialize,
+        ) as serialize:
+            compiled = self.client.get(url)
+        self.assertTrue(serialize.called, "The list was not compiled.")
+
+        cache.clear()
+        with mock.patch.object(view, "compiled_list", False):
+            regular = self.client.get(url)
+
+        self.assertEqual(compiled.status_code, 200)
+        self.assertEqual(compiled.json(), regular.json())
+
+    def test_product_lists_match(self):
+        for query in [
+            "",
+            "?fields=id,name,stock,is_available,rating_histogram",
+            "?fields=product_url,content_type",
+            "?pagination=cursor&ordering=net_price",
+        ]:
+            with self.subTest(query=query):
+                self.assertMatchesRegularList(
+                    ProductViewSet, f"/api/store/products/{query}"
+                )
+
+    def test_clinic_lists_match(self):
+        for query in ["", "?expand=", "?expand=disease", "?fields=disease.category"]:
+            with self.subTest(query=query):
+                self.assertMatchesRegularList(
+                    TreatmentViewSet, f"/api/clinic/treatments/{query}"
+                )
+        self.assertMatchesRegularList(MedicineViewSet, "/api/clinic/medicines/")
+
+    def test_order_lists_match(self):
+        for query in [
+            "",
+            "?expand=",
+            "?expand=shipping_details",
+            "?fields=id,order_items.name,order_items.price,shipping_details",
+        ]:
+            with self.subTest(query=query):
+                self.assertMatchesRegularList(
+                    OrderViewSet, f"/api/store/orders/{query}"
+                )
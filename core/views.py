@@ -33,6 +33,8 @@ class ProductReviewViewSet(FeedbackReviewViewSet):
     def get_queryset(self):
         queryset = super().get_queryset()
         product_slug = self.kwargs.get("product_slug")
+        if self.field_expanded("user"):
+            queryset = queryset.select_related("user")
         models = [cls.model_class() for cls in Review.get_allowed_content_types()]
         if Product not in models:
             raise ValueError("Product is not a valid content type for reviews.")
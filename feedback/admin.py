@@ -2,8 +2,8 @@ from django.contrib import admin
 from django import forms
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
-from django.urls import reverse
-from django.utils.html import format_html
+from core.admin import LinkedObjectAdminMixin
+from core.pagination import EstimatedCountPaginator
 
 from .models import Review
 
@@ -48,30 +48,16 @@ class ReviewAdminForm(forms.ModelForm):
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LinkedObjectAdminMixin, admin.ModelAdmin):
     form = ReviewAdminForm
 
     list_display = ["user", "item_type", "linked_object", "rating"]
+    list_select_related = ["user"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def item_type(self, review):
         return str(review.content_type)
 
     item_type.short_description = "Item Type"
     item_type.admin_order_field = "content_type"
-
-    def linked_object(self, review):
-        if review.content_type and review.object_id:
-            model = review.content_type.model_class()
-            try:
-                obj = model.objects.get(pk=review.object_id)
-            except model.DoesNotExist:
-                return "Deleted"
-            url = reverse(
-                f"admin:{review.content_type.app_label}_{review.content_type.model}_change",
-                args=[obj.pk],
-            )
-            return format_html('<a href="{}">{}</a>', url, str(obj))
-        return "None"
-
-    linked_object.short_description = "Object"
-    linked_object.admin_order_field = "object_id"
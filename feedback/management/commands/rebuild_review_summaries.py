@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from feedback.models import ReviewSummary
+
+
+class Command(BaseCommand):
+    help = "Recompute rating averages, counts and histograms for every reviewed object."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = ReviewSummary.objects.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(f"Rebuilt {count} review summaries.")
@@ -0,0 +1,44 @@
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import migrations, models
+
+
+def rebuild_summaries(apps, schema_editor):
+    Review = apps.get_model("feedback", "Review")
+    ReviewSummary = apps.get_model("feedback", "ReviewSummary")
+    histogram = {
+        f"rating_{rating}": models.Count("id", filter=models.Q(rating=rating))
+        for rating in range(1, 6)
+    }
+    rows = (
+        Review.objects.order_by()
+        .values("content_type_id", "object_id")
+        .annotate(
+            rating_count=models.Count("id"),
+            rating_total=models.Sum("rating"),
+            **histogram,
+        )
+    )
+    ReviewSummary.objects.all().delete()
+    ReviewSummary.objects.bulk_create(
+        [
+            ReviewSummary(
+                rating_avg=(
+                    Decimal(row["rating_total"]) / row["rating_count"]
+                ).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
+                **row,
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0002_reviewsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_summaries, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import IntegrityError, models, transaction
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.core.exceptions import ValidationError
@@ -61,6 +62,136 @@ class Review(models.Model):
                 f"Linked object with id {self.object_id} does not exist."
             )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the summary currently counts for this review so
+        # updates and deletes can be applied as deltas.
+        instance._remember_summarized()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_summarized()
+
+    def _remember_summarized(self):
+        if {"content_type_id", "object_id", "rating"}.issubset(self.__dict__):
+            self._summarized = (self.content_type_id, self.object_id, self.rating)
+
     def save(self, *args, **kwargs):
         self.full_clean()
         return super().save(*args, **kwargs)
+
+
+class ReviewSummaryQuerySet(models.QuerySet):
+    def rebuild(self, reviews=None, batch_size=500):
+        """
+        Recompute summaries from scratch with one grouped query. Without
+        ``reviews`` every summary is rebuilt; otherwise only the objects those
+        reviews belong to.
+        """
+        if reviews is None:
+            reviews = Review.objects.all()
+            stale = self.all()
+        else:
+            stale = self.none()
+            for content_type_id, object_id in reviews.values_list(
+                "content_type_id", "object_id"
+            ).distinct():
+                stale |= self.filter(
+                    content_type_id=content_type_id, object_id=object_id
+                )
+        histogram = {
+            f"rating_{rating}": models.Count("id", filter=models.Q(rating=rating))
+            for rating in range(1, 6)
+        }
+        rows = (
+            reviews.order_by()
+            .values("content_type_id", "object_id")
+            .annotate(
+                rating_count=models.Count("id"),
+                rating_total=models.Sum("rating"),
+                **histogram,
+            )
+        )
+        summaries = [
+            ReviewSummary(
+                rating_avg=(Decimal(row["rating_total"]) / row["rating_count"]).quantize(
+                    Decimal("0.01"), rounding=ROUND_HALF_UP
+                ),
+                **row,
+            )
+            for row in rows
+        ]
+        with transaction.atomic():
+            stale.delete()
+            self.bulk_create(summaries, batch_size=batch_size)
+        return len(summaries)
+
+    def apply_rating(self, content_type_id, object_id, rating, delta):
+        """
+        Add (delta=1) or remove (delta=-1) one rating from the summary of the
+        reviewed object without reading it back first. An object without a
+        summary yet, e.g. one reviewed before summaries existed, is recounted
+        from its saved reviews instead; returns True in that case.
+        """
+        summary = self.filter(content_type_id=content_type_id, object_id=object_id)
+        changes = {
+            "rating_count": models.F("rating_count") + delta,
+            "rating_total": models.F("rating_total") + delta * rating,
+        }
+        if 1 <= rating <= 5:
+            changes[f"rating_{rating}"] = models.F(f"rating_{rating}") + delta
+        if summary.update(**changes):
+            rebuilt = False
+        else:
+            try:
+                self.rebuild(
+                    Review.objects.filter(
+                        content_type_id=content_type_id, object_id=object_id
+                    )
+                )
+                rebuilt = True
+            except IntegrityError:
+                # A concurrent transaction created the row first; its count
+                # cannot include this uncommitted change.
+                summary.update(**changes)
+                rebuilt = False
+        summary.update(
+            rating_avg=models.Case(
+                models.When(
+                    rating_count__gt=0,
+                    then=models.ExpressionWrapper(
+                        models.F("rating_total") * 1.0 / models.F("rating_count"),
+                        output_field=models.DecimalField(),
+                    ),
+                ),
+                default=models.Value(0),
+                output_field=models.DecimalField(max_digits=3, decimal_places=2),
+            )
+        )
+        return rebuilt
+
+
+class ReviewSummary(models.Model):
+    content_type = models.ForeignKey(to=ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_obj = GenericForeignKey("content_type", "object_id")
+
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    objects = ReviewSummaryQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [["content_type", "object_id"]]
+
+    @property
+    def histogram(self):
+        return {str(rating): getattr(self, f"rating_{rating}") for rating in range(1, 6)}
@@ -1,9 +1,10 @@
 from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
+from core.sparse import SparseFieldsMixin
 from . import models
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Review
         fields = [
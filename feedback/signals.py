@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .models import Review, ReviewSummary
+
+# Sent with content_type_id and object_id after a summary row changes.
+review_summary_changed = Signal()
+
+
+def _apply(content_type_id, object_id, rating, delta):
+    rebuilt = ReviewSummary.objects.apply_rating(
+        content_type_id, object_id, rating, delta
+    )
+    review_summary_changed.send(
+        sender=ReviewSummary, content_type_id=content_type_id, object_id=object_id
+    )
+    return rebuilt
+
+
+@receiver(post_save, sender=Review)
+def update_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    current = (instance.content_type_id, instance.object_id, instance.rating)
+    previous = None if created else getattr(instance, "_summarized", None)
+    if previous == current:
+        return
+    if previous is None and not created:
+        # The instance was loaded without the fields the summary needs, so
+        # the old values are unknown: recount this object instead.
+        ReviewSummary.objects.rebuild(
+            Review.objects.filter(
+                content_type_id=instance.content_type_id, object_id=instance.object_id
+            )
+        )
+        review_summary_changed.send(
+            sender=ReviewSummary,
+            content_type_id=instance.content_type_id,
+            object_id=instance.object_id,
+        )
+        instance._summarized = current
+        return
+    with transaction.atomic():
+        recounted = None
+        if previous is not None and _apply(*previous, delta=-1):
+            recounted = previous[:2]
+        # A recount already includes the saved review.
+        if recounted != current[:2]:
+            _apply(*current, delta=1)
+    instance._summarized = current
+
+
+@receiver(post_delete, sender=Review)
+def update_summary_on_delete(sender, instance, **kwargs):
+    summarized = getattr(
+        instance,
+        "_summarized",
+        (instance.content_type_id, instance.object_id, instance.rating),
+    )
+    _apply(*summarized, delta=-1)
@@ -1,3 +1,178 @@
-from django.test import TestCase
+from decimal import Decimal
+from importlib import import_module
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from clinic.models import Medicine
+from core.models import User
+from store.models import Product
+from .models import Review, ReviewSummary
 
-# Create your tests here.
+
+def setUpModule():
+    # Resolved at startup, possibly against another database.
+    Product._cached_allowed_content_types = None
+    Review._cached_allowed_content_types = None
+
+
+class ReviewFixturesMixin:
+    def setUp(self):
+        self.products = [self.create_product(name) for name in ["Arnica", "Sulphur"]]
+        self.content_type = ContentType.objects.get_for_model(Product)
+        self.users = [
+            User.objects.create(
+                username=f"reviewer{index}",
+                email=f"reviewer{index}@example.com",
+                mobile_number=f"900000000{index}",
+            )
+            for index in range(3)
+        ]
+
+    def create_product(self, name):
+        medicine = Medicine.objects.create(name=name)
+        return Product.objects.create(
+            content_type=ContentType.objects.get_for_model(Medicine),
+            object_id=medicine.pk,
+            unit_price=Decimal("100.00"),
+        )
+
+    def review(self, user, product, rating):
+        return Review.objects.create(
+            user=user,
+            content_type=self.content_type,
+            object_id=product.pk,
+            rating=rating,
+        )
+
+
+class ReviewSummaryTests(ReviewFixturesMixin, TestCase):
+    def get_summary(self, product):
+        return ReviewSummary.objects.get(
+            content_type=self.content_type, object_id=product.pk
+        )
+
+    def assertSummary(self, product, count, average, histogram):
+        summary = self.get_summary(product)
+        self.assertEqual(summary.rating_count, count)
+        self.assertEqual(summary.rating_avg, Decimal(average))
+        self.assertEqual(summary.histogram, histogram)
+
+    def test_new_reviews_are_added(self):
+        self.review(self.users[0], self.products[0], 5)
+        self.review(self.users[1], self.products[0], 2)
+
+        self.assertSummary(
+            self.products[0], 2, "3.50", {"1": 0, "2": 1, "3": 0, "4": 0, "5": 1}
+        )
+
+    def test_edited_rating_replaces_the_old_one(self):
+        review = self.review(self.users[0], self.products[0], 5)
+        self.review(self.users[1], self.products[0], 3)
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 1
+        review.save()
+
+        self.assertSummary(
+            self.products[0], 2, "2.00", {"1": 1, "2": 0, "3": 1, "4": 0, "5": 0}
+        )
+
+    def test_review_moved_to_another_object(self):
+        review = self.review(self.users[0], self.products[0], 4)
+
+        review.object_id = self.products[1].pk
+        review.save()
+
+        self.assertEqual(self.get_summary(self.products[0]).rating_count, 0)
+        self.assertSummary(
+            self.products[1], 1, "4.00", {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0}
+        )
+
+    def test_deleted_review_is_removed(self):
+        review = self.review(self.users[0], self.products[0], 4)
+        self.review(self.users[1], self.products[0], 2)
+
+        review.delete()
+
+        self.assertSummary(
+            self.products[0], 1, "2.00", {"1": 0, "2": 1, "3": 0, "4": 0, "5": 0}
+        )
+
+    def test_object_without_a_summary_is_recounted(self):
+        review = self.review(self.users[0], self.products[0], 4)
+        self.review(self.users[1], self.products[0], 2)
+        ReviewSummary.objects.all().delete()
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 5
+        review.save()
+        self.review(self.users[2], self.products[0], 5)
+
+        self.assertSummary(
+            self.products[0], 3, "4.00", {"1": 0, "2": 1, "3": 0, "4": 0, "5": 2}
+        )
+
+    def test_deltas_match_a_rebuild(self):
+        for index, rating in enumerate([5, 4, 1]):
+            self.review(self.users[index], self.products[index % 2], rating)
+        Review.objects.filter(rating=4).delete()
+        # Deltas keep emptied summaries, a rebuild drops them.
+        summaries = list(
+            ReviewSummary.objects.filter(rating_count__gt=0)
+            .order_by("object_id")
+            .values("object_id", "rating_count", "rating_total", "rating_avg")
+        )
+
+        ReviewSummary.objects.rebuild()
+
+        self.assertEqual(
+            list(
+                ReviewSummary.objects.order_by("object_id").values(
+                    "object_id", "rating_count", "rating_total", "rating_avg"
+                )
+            ),
+            summaries,
+        )
+
+    def test_backfill_migration_counts_existing_reviews(self):
+        self.review(self.users[0], self.products[0], 5)
+        self.review(self.users[1], self.products[0], 2)
+        ReviewSummary.objects.all().delete()
+        migration = import_module("feedback.migrations.0003_backfill_review_summaries")
+
+        migration.rebuild_summaries(apps, None)
+
+        self.assertSummary(
+            self.products[0], 2, "3.50", {"1": 0, "2": 1, "3": 0, "4": 0, "5": 1}
+        )
+
+
+# Database sessions would be deleted on login, which the product deletion
+# guard in store.signals cannot handle on SQLite.
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+class ReviewAdminTests(ReviewFixturesMixin, TestCase):
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/feedback/review/")
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(
+            User.objects.create(
+                username="admin",
+                email="admin@example.com",
+                mobile_number="9000000009",
+                is_staff=True,
+                is_superuser=True,
+            )
+        )
+        self.review(self.users[0], self.products[0], 5)
+        expected = self.count_queries()
+
+        self.review(self.users[1], self.products[0], 4)
+        self.review(self.users[2], self.products[1], 3)
+
+        self.assertEqual(self.count_queries(), expected)
@@ -3,11 +3,13 @@ from rest_framework import permissions
 from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 
+from core.compiled import CompiledListMixin
+from core.sparse import SparseFieldsViewMixin
 from store.pagination import DefaultPagination
 from . import serializers, models
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseFieldsViewMixin, CompiledListMixin, viewsets.ModelViewSet):
     http_method_names = ["get", "post", "put", "patch", "delete"]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     pagination_class = DefaultPagination
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
     "clinic",
     "store",
     "feedback",
+    "search",
     "cloudinary",
     "cloudinary_storage",
 ]
@@ -214,7 +215,22 @@ DJOSER = {
     "PROTOCOL": "https",
 }
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+TASKS = {
+    # Seconds a claimed task may run before another worker may retry it.
+    "LEASE": 5 * 60,
+    "POLL_INTERVAL": 1,
+    # Run tasks inline in .delay(), e.g. during local development.
+    "EAGER": os.getenv("TASKS_EAGER", "") == "1",
+}
+
+# Requests only queue email; `manage.py send_queued_mail` delivers it.
+EMAIL_BACKEND = "core.mail.OutboxEmailBackend"
+EMAIL_OUTBOX = {
+    "BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+    "BATCH_SIZE": 50,
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY": 60,
+}
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT = os.getenv("EMAIL_PORT")
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
@@ -225,7 +241,58 @@ ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
 
 RAZORPAY_API_KEY = os.getenv("RAZORPAY_API_KEY")
 RAZORPAY_API_SECRET = os.getenv("RAZORPAY_API_SECRET")
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+
+# Shared by every process, so cache invalidations made by one web worker or
+# background command reach all of them. Create the table with
+# `manage.py createcachetable`.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+    }
+}
 
-STORE_APP = {"ALLOWED_PRODUCT_MODELS": ["clinic.treatment", "clinic.medicine"]}
+STORE_APP = {
+    "ALLOWED_PRODUCT_MODELS": ["clinic.treatment", "clinic.medicine"],
+    "CATALOG_CACHE_TIMEOUT": 5 * 60,
+    "STOCK_HOLD_TTL": 15 * 60,
+    "PRICE_FACET_BOUNDS": [0, 100, 250, 500, 1000],
+    "PAYMENT_GATEWAY": {
+        # Point this at `manage.py run_fake_gateway` to test without Razorpay.
+        "BASE_URL": os.getenv("RAZORPAY_BASE_URL"),
+        "CONNECT_TIMEOUT": 3.05,
+        "READ_TIMEOUT": 10,
+        "RETRIES": 2,
+        "POOL_SIZE": 10,
+        "FAILURE_THRESHOLD": 5,
+        "RESET_TIMEOUT": 30,
+    },
+}
 
 FEEDBACK_APP = {"ALLOWED_REVIEW_ITEM_MODELS": ["store.product"]}
+
+SEARCH_APP = {
+    # Field paths and their weights; "content_obj." follows a product to the
+    # Treatment or Medicine it sells.
+    "INDEXED_MODELS": {
+        "store.product": {
+            "name": 5,
+            "content_obj.description": 1,
+            "content_obj.composition": 2,
+            "content_obj.brand": 3,
+        },
+        "clinic.disease": {"name": 5, "description": 1},
+        "clinic.doctor": {"name": 5, "qualifications": 2, "description": 1},
+        "clinic.treatment": {"name": 5, "description": 1},
+        "clinic.medicine": {
+            "name": 5,
+            "description": 1,
+            "composition": 2,
+            "brand": 3,
+            "manufacturer": 2,
+        },
+    },
+    "MAX_RESULTS": 1000,
+    "TRIGRAM_SIMILARITY": 0.3,
+}
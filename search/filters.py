@@ -0,0 +1,31 @@
+from django.db.models import Case, IntegerField, When
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+from .index import get_indexed_models, search
+
+
+class IndexedSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for SearchFilter backed by the search index. Results
+    are ranked by relevance unless the request asks for an explicit ordering;
+    models without an index fall back to SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if queryset.model not in get_indexed_models():
+            return super().filter_queryset(request, queryset, view)
+
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+
+        ranked_ids = search(queryset.model, query)
+        queryset = queryset.filter(pk__in=ranked_ids)
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return queryset
+        return queryset.order_by(
+            Case(
+                *[When(pk=pk, then=rank) for rank, pk in enumerate(ranked_ids)],
+                output_field=IntegerField(),
+            )
+        )
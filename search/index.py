@@ -0,0 +1,174 @@
+import re
+from collections import Counter
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from .models import SearchPosting, SearchTerm, SearchTrigram
+
+TOKEN_RE = re.compile(r"\w+")
+MAX_TERM_LENGTH = 64
+EXACT_MATCH_BOOST = 1.0
+PREFIX_MATCH_BOOST = 0.6
+TRIGRAM_MATCH_BOOST = 0.4
+
+
+def get_indexed_models():
+    indexed = {}
+    for label, fields in settings.SEARCH_APP.get("INDEXED_MODELS", {}).items():
+        app_label, model_name = label.split(".")
+        indexed[apps.get_model(app_label, model_name)] = fields
+    return indexed
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(str(text).lower())]
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def resolve_field(instance, path):
+    value = instance
+    for attr in path.split("."):
+        value = getattr(value, attr, None)
+        if value is None:
+            return ""
+    return value
+
+
+def build_document(instance, fields):
+    weights = Counter()
+    for path, weight in fields.items():
+        for token in tokenize(resolve_field(instance, path)):
+            weights[token] += weight
+    return weights
+
+
+def get_or_create_terms(tokens):
+    terms = dict(SearchTerm.objects.filter(term__in=tokens).values_list("term", "pk"))
+    missing = [token for token in tokens if token not in terms]
+    if missing:
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=token) for token in missing], ignore_conflicts=True
+        )
+        created = dict(
+            SearchTerm.objects.filter(term__in=missing).values_list("term", "pk")
+        )
+        SearchTrigram.objects.bulk_create(
+            [
+                SearchTrigram(trigram=trigram, term_id=term_id)
+                for term, term_id in created.items()
+                for trigram in trigrams(term)
+            ],
+            ignore_conflicts=True,
+        )
+        terms.update(created)
+    return terms
+
+
+def index_instance(instance, fields=None):
+    if fields is None:
+        fields = get_indexed_models().get(type(instance))
+        if fields is None:
+            return
+    document = build_document(instance, fields)
+    content_type = ContentType.objects.get_for_model(instance)
+    with transaction.atomic():
+        SearchPosting.objects.filter(
+            content_type=content_type, object_id=instance.pk
+        ).delete()
+        if not document:
+            return
+        terms = get_or_create_terms(list(document))
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(
+                    term_id=terms[token],
+                    content_type=content_type,
+                    object_id=instance.pk,
+                    weight=weight,
+                )
+                for token, weight in document.items()
+            ]
+        )
+
+
+def remove_instance(instance):
+    SearchPosting.objects.filter(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+    ).delete()
+
+
+def match_terms(token):
+    """
+    Return {term_id: boost} for a query token: the exact term, terms it is a
+    prefix of, or failing both, the closest terms by trigram similarity.
+    """
+    matches = {
+        term_id: EXACT_MATCH_BOOST if term == token else PREFIX_MATCH_BOOST
+        for term_id, term in SearchTerm.objects.filter(term__startswith=token)
+        .order_by("term")
+        .values_list("pk", "term")[: settings.SEARCH_APP.get("MAX_PREFIX_TERMS", 50)]
+    }
+    if matches:
+        return matches
+
+    query_trigrams = trigrams(token)
+    shared = Counter(
+        SearchTrigram.objects.filter(trigram__in=query_trigrams).values_list(
+            "term_id", flat=True
+        )
+    )
+    if not shared:
+        return {}
+    term_ids = [term_id for term_id, _ in shared.most_common(100)]
+    threshold = settings.SEARCH_APP.get("TRIGRAM_SIMILARITY", 0.3)
+    for term_id, term in SearchTerm.objects.filter(pk__in=term_ids).values_list(
+        "pk", "term"
+    ):
+        common = shared[term_id]
+        similarity = common / (len(query_trigrams) + len(trigrams(term)) - common)
+        if similarity >= threshold:
+            matches[term_id] = TRIGRAM_MATCH_BOOST * similarity
+    return matches
+
+
+def search(model, query, limit=None):
+    """
+    Rank objects of ``model`` against ``query``. Every query token has to
+    match; scores add up the indexed field weights scaled by how closely each
+    token matched. Returns a list of primary keys, best match first.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+    limit = limit or settings.SEARCH_APP.get("MAX_RESULTS", 1000)
+
+    boosts = []
+    for token in tokens:
+        matches = match_terms(token)
+        if not matches:
+            return []
+        boosts.append(matches)
+
+    scores = Counter()
+    matched_tokens = {}
+    postings = SearchPosting.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        term_id__in={term_id for matches in boosts for term_id in matches},
+    ).values_list("object_id", "term_id", "weight")
+    for object_id, term_id, weight in postings:
+        for position, matches in enumerate(boosts):
+            if term_id in matches:
+                scores[object_id] += weight * matches[term_id]
+                matched_tokens.setdefault(object_id, set()).add(position)
+
+    return [
+        object_id
+        for object_id, _ in scores.most_common()
+        if len(matched_tokens[object_id]) == len(tokens)
+    ][:limit]
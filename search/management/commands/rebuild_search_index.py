@@ -0,0 +1,28 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from search.index import get_indexed_models, index_instance
+from search.models import SearchPosting, SearchTerm
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index for every indexed model."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model, fields in get_indexed_models().items():
+            SearchPosting.objects.filter(
+                content_type=ContentType.objects.get_for_model(model)
+            ).delete()
+            queryset = model._default_manager.order_by("pk")
+            if any(path.startswith("content_obj.") for path in fields):
+                queryset = queryset.prefetch_related("content_obj")
+            count = 0
+            for instance in queryset.iterator(chunk_size=options["batch_size"]):
+                index_instance(instance, fields)
+                count += 1
+            self.stdout.write(f"Indexed {count} {model._meta.verbose_name_plural}.")
+
+        deleted, _ = SearchTerm.objects.filter(postings__isnull=True).delete()
+        self.stdout.write(f"Pruned {deleted} unused terms and trigrams.")
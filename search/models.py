@@ -0,0 +1,32 @@
+from django.db import models
+from django.contrib.contenttypes.models import ContentType
+
+
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=64, unique=True)
+
+    def __str__(self):
+        return self.term
+
+
+class SearchTrigram(models.Model):
+    trigram = models.CharField(max_length=3)
+    term = models.ForeignKey(
+        to=SearchTerm, on_delete=models.CASCADE, related_name="trigrams"
+    )
+
+    class Meta:
+        unique_together = [["trigram", "term"]]
+
+
+class SearchPosting(models.Model):
+    term = models.ForeignKey(
+        to=SearchTerm, on_delete=models.CASCADE, related_name="postings"
+    )
+    content_type = models.ForeignKey(to=ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = [["term", "content_type", "object_id"]]
+        indexes = [models.Index(fields=["content_type", "object_id"])]
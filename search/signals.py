@@ -0,0 +1,24 @@
+import logging
+from django.db.models.signals import post_delete, post_save
+from django.db.utils import OperationalError, ProgrammingError
+from .index import get_indexed_models, index_instance, remove_instance
+
+
+def connect_index_signals():
+    def create_save_handler(fields):
+        def handler(sender, instance, raw=False, **kwargs):
+            if raw:
+                return
+            try:
+                index_instance(instance, fields)
+            except (ProgrammingError, OperationalError) as e:
+                logging.warning(f"Skipped search indexing, DB not ready yet: {e}")
+
+        return handler
+
+    def delete_handler(sender, instance, **kwargs):
+        remove_instance(instance)
+
+    for model, fields in get_indexed_models().items():
+        post_save.connect(create_save_handler(fields), sender=model, weak=False)
+        post_delete.connect(delete_handler, sender=model, weak=False)
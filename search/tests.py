@@ -0,0 +1,94 @@
+from decimal import Decimal
+from io import StringIO
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APITestCase
+from clinic.models import Medicine
+from store.models import Product
+from .index import search
+from .models import SearchPosting
+
+
+def setUpModule():
+    # Resolved at startup, possibly against another database.
+    Product._cached_allowed_content_types = None
+
+
+def create_medicine(name, **fields):
+    return Medicine.objects.create(name=name, **fields)
+
+
+class IndexTests(TestCase):
+    def setUp(self):
+        self.arnica = create_medicine("Arnica Montana", brand="Reckeweg")
+        self.belladonna = create_medicine(
+            "Belladonna", composition="Arnica extract", brand="Schwabe"
+        )
+
+    def test_saves_keep_the_index_current(self):
+        self.arnica.name = "Calendula"
+        self.arnica.save()
+
+        self.assertEqual(search(Medicine, "arnica"), [self.belladonna.pk])
+        self.assertEqual(search(Medicine, "calendula"), [self.arnica.pk])
+
+    def test_deleted_objects_leave_the_index(self):
+        self.belladonna.delete()
+
+        self.assertFalse(
+            SearchPosting.objects.filter(object_id=self.belladonna.pk).exists()
+        )
+
+    def test_heavier_fields_rank_first(self):
+        self.assertEqual(
+            search(Medicine, "arnica"), [self.arnica.pk, self.belladonna.pk]
+        )
+
+    def test_prefixes_and_typos_match(self):
+        self.assertEqual(search(Medicine, "bella"), [self.belladonna.pk])
+        self.assertEqual(search(Medicine, "beladonna"), [self.belladonna.pk])
+
+    def test_every_token_has_to_match(self):
+        self.assertEqual(search(Medicine, "arnica schwabe"), [self.belladonna.pk])
+        self.assertEqual(search(Medicine, "arnica nothing"), [])
+
+    def test_rebuild_restores_the_index(self):
+        SearchPosting.objects.all().delete()
+
+        call_command("rebuild_search_index", stdout=StringIO())
+
+        self.assertEqual(
+            search(Medicine, "arnica"), [self.arnica.pk, self.belladonna.pk]
+        )
+
+
+class ProductSearchTests(APITestCase):
+    def create_product(self, name, **fields):
+        medicine = create_medicine(name, **fields)
+        return Product.objects.create(
+            content_type=ContentType.objects.get_for_model(Medicine),
+            object_id=medicine.pk,
+            unit_price=Decimal("100.00"),
+        )
+
+    def test_results_are_ranked_by_relevance(self):
+        brand = self.create_product("Calendula", brand="Arnica Labs")
+        name = self.create_product("Arnica")
+        self.create_product("Belladonna")
+
+        response = self.client.get("/api/store/products/", {"search": "arnica"})
+
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            [name.pk, brand.pk],
+        )
+
+    def test_linked_object_text_is_searchable(self):
+        product = self.create_product("Calendula", composition="Marigold tincture")
+
+        response = self.client.get("/api/store/products/", {"search": "marigold"})
+
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]], [product.pk]
+        )
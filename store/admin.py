@@ -1,10 +1,12 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
-from django.urls import reverse
-from django.utils.html import format_html
-from . import models
+from django.db.models import F
+from django.http import HttpResponseRedirect
+from core.admin import LinkedObjectAdminMixin
+from core.pagination import EstimatedCountPaginator
+from . import models, stock
 
 
 class ProductAdminForm(forms.ModelForm):
@@ -44,10 +46,13 @@ class ProductAdminForm(forms.ModelForm):
             id__in=[ct.id for ct in ALLOWED_CONTENT_TYPES]
         )
         self.fields["content_type"].choices = CONTENT_TYPE_CHOICES
+        if self.instance.pk:
+            # Edit the total across shards; ProductAdmin.save_model spreads it.
+            self.initial["stock"] = self.instance.current_stock
 
 
 @admin.register(models.Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LinkedObjectAdminMixin, admin.ModelAdmin):
     form = ProductAdminForm
 
     list_display = [
@@ -55,11 +60,28 @@ class ProductAdmin(admin.ModelAdmin):
         "unit_price",
         "discount",
         "net_price",
-        "stock",
+        "current_stock",
         "product_type",
         "linked_object",
         "trending",
     ]
+    readonly_fields = ["shard_count"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stock_totals()
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        obj.save_details()
+        if "stock" in form.changed_data:
+            stock.set_stock(obj, form.cleaned_data["stock"])
+
+    def current_stock(self, product):
+        return product.current_stock
+
+    current_stock.short_description = "Stock"
+    current_stock.admin_order_field = "stock_total"
 
     def product_type(self, product):
         return str(product.content_type)
@@ -67,23 +89,6 @@ class ProductAdmin(admin.ModelAdmin):
     product_type.short_description = "Product Type"
     product_type.admin_order_field = "content_type"
 
-    def linked_object(self, product):
-        if product.content_type and product.object_id:
-            model = product.content_type.model_class()
-            try:
-                obj = model.objects.get(pk=product.object_id)
-            except model.DoesNotExist:
-                return "Deleted"
-            url = reverse(
-                f"admin:{product.content_type.app_label}_{product.content_type.model}_change",
-                args=[obj.pk],
-            )
-            return format_html('<a href="{}">{}</a>', url, str(obj))
-        return "None"
-
-    linked_object.short_description = "Object"
-    linked_object.admin_order_field = "object_id"
-
 
 class CartItemInline(admin.StackedInline):
     model = models.CartItem
@@ -101,6 +106,13 @@ class OrderItemInline(admin.StackedInline):
     extra = 0
 
 
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = models.Order
+        fields = "__all__"
+        widgets = {"version": forms.HiddenInput}
+
+
 @admin.register(models.Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -111,4 +123,54 @@ class OrderAdmin(admin.ModelAdmin):
         "delivered_at",
         "cancelled_at",
     ]
+    list_select_related = ["user"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [OrderItemInline]
+    form = OrderAdminForm
+    # State changes go through store.transitions, which checks the version.
+    readonly_fields = [
+        "order_status",
+        "payment_status",
+        "payment_method",
+        "refund_status",
+        "refund_id",
+        "razorpay_order_id",
+        "razorpay_payment_id",
+        "razorpay_signature",
+        "delivered_at",
+        "cancelled_at",
+        "refunded_at",
+    ]
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Write only the edited columns, and only over the version the form
+        # was loaded at, so concurrent transitions are neither undone nor lost.
+        fields = [field for field in form.changed_data if field != "version"]
+        obj._conflict = not models.Order.objects.filter(
+            pk=obj.pk, version=obj.version
+        ).update(
+            **{field: getattr(obj, field) for field in fields}, version=F("version") + 1
+        )
+        if obj._conflict:
+            self.message_user(
+                request,
+                "The order was changed by another request while you edited it. "
+                "Review the current values and save your changes again.",
+                messages.ERROR,
+            )
+
+    def response_change(self, request, obj):
+        if obj._conflict:
+            return HttpResponseRedirect(request.path)
+        return super().response_change(request, obj)
+
+
+@admin.register(models.PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ["event_id", "event", "status", "received_at", "processed_at"]
+    list_filter = ["status", "event"]
+    search_fields = ["event_id"]
+    readonly_fields = ["received_at", "processed_at"]
@@ -0,0 +1,105 @@
+import hashlib
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "store:catalog:version"
+
+
+def get_catalog_timeout():
+    return settings.STORE_APP.get("CATALOG_CACHE_TIMEOUT", 5 * 60)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid4().hex, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    # A fresh token rather than cache.incr(), which the database backend runs
+    # as a read and a write, so two concurrent bumps could collapse into one.
+    version = uuid4().hex
+    cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def catalog_cache_key(prefix, request):
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    raw = repr((request.get_host(), request.path, params))
+    digest = hashlib.md5(raw.encode("utf-8")).hexdigest()
+    return f"store:catalog:{get_catalog_version()}:{prefix}:{digest}"
+
+
+def get_cached_items(data):
+    if isinstance(data, dict):
+        return data["results"] if isinstance(data.get("results"), list) else [data]
+    return data if isinstance(data, list) else []
+
+
+class CatalogCacheMixin:
+    """
+    Read-through cache for catalog list and detail responses. Keys include the
+    query string (filters, search, ordering, page) and the catalog version, so
+    bumping the version invalidates every cached page at once.
+
+    ``live_fields`` change too often to invalidate the whole catalog for, so
+    they are read again on every cache hit through ``get_live_values``.
+    """
+
+    live_fields = []
+
+    def get_live_values(self, ids):
+        """{id: {field: value}} for the ``live_fields`` of the given objects."""
+        return {}
+
+    def is_cacheable(self, data):
+        # Live values are matched to cached objects by id.
+        return all(
+            "id" in item or not set(self.live_fields) & set(item)
+            for item in get_cached_items(data)
+        )
+
+    def apply_live_values(self, data):
+        items = [
+            item
+            for item in get_cached_items(data)
+            if "id" in item and set(self.live_fields) & set(item)
+        ]
+        if not items:
+            return data
+        values = self.get_live_values([item["id"] for item in items])
+        for item in items:
+            for field, value in values.get(item["id"], {}).items():
+                if field in item:
+                    item[field] = value
+        return data
+
+    def cached_response(self, prefix, request, build_response):
+        key = catalog_cache_key(prefix, request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(self.apply_live_values(data))
+        response = build_response()
+        if response.status_code == 200 and self.is_cacheable(response.data):
+            cache.set(key, response.data, timeout=get_catalog_timeout())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        return self.cached_response(
+            "list", request, lambda: parent.list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super()
+        return self.cached_response(
+            "detail", request, lambda: parent.retrieve(request, *args, **kwargs)
+        )
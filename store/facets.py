@@ -0,0 +1,110 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import BooleanField, Case, Count, IntegerField, Q, Value, When
+
+
+def get_price_buckets():
+    bounds = [
+        Decimal(str(bound))
+        for bound in settings.STORE_APP.get(
+            "PRICE_FACET_BOUNDS", [0, 100, 250, 500, 1000]
+        )
+    ]
+    return [
+        (lower, bounds[index + 1] if index + 1 < len(bounds) else None)
+        for index, lower in enumerate(bounds)
+    ]
+
+
+# ProductFilter filters narrowing each facet's dimension.
+FACET_FILTERS = {
+    "type": ["type"],
+    "price": ["min_price", "max_price"],
+    "trending": ["trending"],
+}
+
+
+def get_facet_conditions(filterset):
+    """
+    {facet: Q} for the facet filters set on a validated ``filterset``.
+    """
+    conditions = {}
+    for facet, names in FACET_FILTERS.items():
+        for name in names:
+            value = filterset.form.cleaned_data.get(name)
+            if value is None or value == "":
+                continue
+            field = filterset.filters[name]
+            condition = Q(**{f"{field.field_name}__{field.lookup_expr}": value})
+            conditions[facet] = conditions.get(facet, Q()) & condition
+    return conditions
+
+
+def _passes(row, *facets):
+    # Rows without a match flag for a facet are not filtered on it.
+    return all(row.get(f"matches_{facet}", True) for facet in facets)
+
+
+def get_product_facets(queryset, conditions=None):
+    """
+    Count products per content type, price bucket and trending flag with a
+    single grouped query over ``queryset``. ``conditions`` are the facet
+    filters ({facet: Q}); each facet is counted with every filter but its
+    own, so the other values of a filtered facet keep their counts.
+    """
+    conditions = conditions or {}
+    buckets = get_price_buckets()
+    price_bucket = Case(
+        *[
+            When(
+                net_price__gte=lower,
+                **({"net_price__lt": upper} if upper is not None else {}),
+                then=Value(index),
+            )
+            for index, (lower, upper) in enumerate(buckets)
+        ],
+        default=None,
+        output_field=IntegerField(),
+    )
+    matches = {
+        f"matches_{facet}": Case(
+            When(condition, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+        for facet, condition in conditions.items()
+    }
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket, **matches)
+        .values("content_type__model", "price_bucket", "trending", *matches)
+        .annotate(count=Count("pk"))
+    )
+
+    types, prices, trending, total = {}, {}, {}, 0
+    for row in rows:
+        if _passes(row, "type", "price", "trending"):
+            total += row["count"]
+        if _passes(row, "price", "trending"):
+            model = row["content_type__model"]
+            types[model] = types.get(model, 0) + row["count"]
+        if _passes(row, "type", "trending") and row["price_bucket"] is not None:
+            prices[row["price_bucket"]] = (
+                prices.get(row["price_bucket"], 0) + row["count"]
+            )
+        if _passes(row, "type", "price"):
+            trending[row["trending"]] = trending.get(row["trending"], 0) + row["count"]
+
+    return {
+        "count": total,
+        "type": [
+            {"value": model, "count": count} for model, count in sorted(types.items())
+        ],
+        "price": [
+            {"min": lower, "max": upper, "count": prices.get(index, 0)}
+            for index, (lower, upper) in enumerate(buckets)
+        ],
+        "trending": [
+            {"value": value, "count": trending.get(value, 0)} for value in (True, False)
+        ],
+    }
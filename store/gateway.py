@@ -0,0 +1,168 @@
+import threading
+import time
+from functools import partial
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULTS = {
+    "BASE_URL": None,
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    "RETRIES": 2,
+    "BACKOFF_FACTOR": 0.3,
+    "BACKOFF_JITTER": 0.3,
+    "POOL_SIZE": 10,
+    "FAILURE_THRESHOLD": 5,
+    "RESET_TIMEOUT": 30,
+}
+
+
+def get_gateway_settings():
+    return {**DEFAULTS, **settings.STORE_APP.get("PAYMENT_GATEWAY", {})}
+
+
+class GatewayUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls
+    for ``reset_timeout`` seconds. After that a single probe call is let
+    through; its outcome closes the breaker again or restarts the timeout.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise GatewayUnavailable("Payment gateway is unavailable.")
+            self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class TimeoutSession(requests.Session):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(options):
+    session = TimeoutSession(
+        timeout=(options["CONNECT_TIMEOUT"], options["READ_TIMEOUT"])
+    )
+    # urllib3 retries read errors and 5xx only for idempotent methods by
+    # default, which would leave out every Razorpay call. POST is allowed too:
+    # a duplicate gateway order is never paid, since checkout attaches only
+    # one with a guarded UPDATE, and refunds carry an idempotency key.
+    # Connection errors are retried for every method, the request never
+    # reached the gateway.
+    retry = Retry(
+        total=options["RETRIES"],
+        connect=options["RETRIES"],
+        read=options["RETRIES"],
+        status=options["RETRIES"],
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"},
+        backoff_factor=options["BACKOFF_FACTOR"],
+        backoff_jitter=options["BACKOFF_JITTER"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=options["POOL_SIZE"], max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PaymentGateway:
+    """
+    Razorpay client sharing one keep-alive connection pool, with timeouts,
+    retries and a circuit breaker around every call.
+    """
+
+    failure_exceptions = (
+        requests.RequestException,
+        razorpay.errors.GatewayError,
+        razorpay.errors.ServerError,
+    )
+
+    def __init__(self, key, secret, options=None):
+        options = options or get_gateway_settings()
+        client_options = {}
+        if options["BASE_URL"]:
+            client_options["base_url"] = options["BASE_URL"]
+        self.client = razorpay.Client(
+            session=build_session(options), auth=(key, secret), **client_options
+        )
+        self.breaker = CircuitBreaker(
+            options["FAILURE_THRESHOLD"], options["RESET_TIMEOUT"]
+        )
+
+    def call(self, method, *args):
+        self.breaker.before_call()
+        try:
+            response = method(*args)
+        except self.failure_exceptions:
+            self.breaker.record_failure()
+            raise
+        except razorpay.errors.BadRequestError:
+            # The gateway is up, it just rejected this request.
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def create_order(self, data):
+        return self.call(self.client.order.create, data)
+
+    def refund_payment(self, payment_id, data, idempotency_key=None):
+        # Razorpay processes one refund per key, so retrying it is safe.
+        headers = {"X-Refund-Idempotency": idempotency_key} if idempotency_key else {}
+        return self.call(
+            partial(self.client.payment.refund, headers=headers), payment_id, data
+        )
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = PaymentGateway(
+                    settings.RAZORPAY_API_KEY, settings.RAZORPAY_API_SECRET
+                )
+    return _gateway
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from store.models import OrderItem
+
+SNAPSHOT_FIELDS = [
+    "name",
+    "slug",
+    "unit_price",
+    "discount",
+    "net_price",
+    "preview_image_url",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy product details onto order lines placed before checkout started "
+        "snapshotting them. The products' current prices are used, since the "
+        "price paid for those lines was never recorded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backfilled = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                items = list(
+                    OrderItem.objects.select_related("product")
+                    .filter(net_price__isnull=True, pk__gt=last_pk)
+                    .order_by("pk")[: options["batch_size"]]
+                )
+                if not items:
+                    break
+                for item in items:
+                    item.snapshot_product()
+                OrderItem.objects.bulk_update(items, SNAPSHOT_FIELDS)
+            backfilled += len(items)
+            last_pk = items[-1].pk
+        self.stdout.write(f"Backfilled {backfilled} order lines.")
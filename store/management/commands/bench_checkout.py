@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+from uuid import uuid4
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, DatabaseError
+from clinic.models import Medicine
+from store.models import Order, Product
+from store.services import attach_razorpay_order
+from store.stock import InsufficientStockError, hold_stock
+
+
+class LatencyGateway:
+    """Stands in for PaymentGateway; every create_order sleeps first."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create_order(self, data):
+        time.sleep(self.latency)
+        return {
+            "id": f"order_bench{uuid4().hex[:12]}",
+            "amount": data["amount"],
+            "currency": data["currency"],
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare checkout throughput with the gateway call inside the checkout "
+        "transaction against the two-phase pipeline, using a local gateway "
+        "stub with injected latency. Creates temporary rows and removes them "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--checkouts", type=int, default=10, help="Per thread.")
+        parser.add_argument(
+            "--latency", type=float, default=200, help="Gateway latency in ms."
+        )
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        checkouts = options["checkouts"]
+        gateway = LatencyGateway(options["latency"] / 1000)
+        user = get_user_model().objects.create(
+            username=f"checkout-bench-{uuid4().hex[:12]}",
+            email=f"{uuid4().hex}@bench.invalid",
+            mobile_number="".join(random.choices("0123456789", k=10)),
+        )
+        medicine = Medicine.objects.create(
+            name=f"Checkout benchmark {uuid4().hex[:12]}"
+        )
+        product = Product.objects.create(
+            content_type=ContentType.objects.get_for_model(Medicine),
+            object_id=medicine.pk,
+            unit_price=1,
+            stock=2 * threads * checkouts,
+        )
+        try:
+            for label, inline in [("inline", True), ("two-phase", False)]:
+                elapsed, errors = self.run_checkouts(
+                    product.pk, user, gateway, inline, threads, checkouts
+                )
+                completed = threads * checkouts - errors
+                self.stdout.write(
+                    f"{label:>9}: {completed} checkouts in {elapsed:.2f}s "
+                    f"({completed / elapsed:.1f}/s), {errors} errors"
+                )
+        finally:
+            Order.objects.filter(user=user).delete()
+            product.delete()
+            medicine.delete()
+            user.delete()
+
+    def checkout(self, product_id, user, gateway, inline):
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                payment_status=Order.PAYMENT_STATUS_AWAITING_GATEWAY,
+                delivery_method=Order.DELIVERY_METHOD_PICKUP,
+                total_price=1,
+            )
+            hold_stock(order, [(product_id, 1)])
+            if inline:
+                # The old behaviour: the stock row stays locked for the whole
+                # gateway round trip.
+                attach_razorpay_order(order, gateway)
+        if not inline:
+            attach_razorpay_order(order, gateway)
+
+    def run_checkouts(self, product_id, user, gateway, inline, threads, checkouts):
+        errors = []
+        barrier = threading.Barrier(threads + 1)
+
+        def buyer():
+            barrier.wait()
+            try:
+                for _ in range(checkouts):
+                    try:
+                        self.checkout(product_id, user, gateway, inline)
+                    except (InsufficientStockError, DatabaseError):
+                        errors.append(1)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buyer) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - started, len(errors)
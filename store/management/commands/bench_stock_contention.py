@@ -0,0 +1,80 @@
+import threading
+import time
+from uuid import uuid4
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, DatabaseError
+from clinic.models import Medicine
+from store.models import Product
+from store.stock import InsufficientStockError, reserve_stock, shard_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare checkout throughput on a single stock row against sharded "
+        "stock counters. Creates temporary products and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--checkouts", type=int, default=50, help="Per thread.")
+        parser.add_argument("--shards", type=int, default=8)
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        checkouts = options["checkouts"]
+        stock = threads * checkouts
+        medicines = []
+        products = []
+        try:
+            for label, shards in [("single row", 0), ("sharded", options["shards"])]:
+                medicine = Medicine.objects.create(
+                    name=f"Stock benchmark {uuid4().hex[:12]}"
+                )
+                medicines.append(medicine)
+                product = Product.objects.create(
+                    content_type=ContentType.objects.get_for_model(Medicine),
+                    object_id=medicine.pk,
+                    unit_price=1,
+                    stock=stock,
+                )
+                products.append(product)
+                if shards:
+                    shard_stock(product, shards)
+                elapsed, errors = self.run_checkouts(product.pk, threads, checkouts)
+                completed = threads * checkouts - errors
+                remaining = Product.objects.with_stock_totals().get(pk=product.pk)
+                self.stdout.write(
+                    f"{label:>10}: {completed} checkouts in {elapsed:.2f}s "
+                    f"({completed / elapsed:.1f}/s), {errors} errors, "
+                    f"{remaining.current_stock} left"
+                )
+        finally:
+            for product in products:
+                product.delete()
+            for medicine in medicines:
+                medicine.delete()
+
+    def run_checkouts(self, product_id, threads, checkouts):
+        errors = []
+        barrier = threading.Barrier(threads + 1)
+
+        def buyer():
+            barrier.wait()
+            try:
+                for _ in range(checkouts):
+                    try:
+                        reserve_stock([(product_id, 1)])
+                    except (InsufficientStockError, DatabaseError):
+                        errors.append(1)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buyer) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - started, len(errors)
@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from store.services import process_payment_events
+
+
+class Command(BaseCommand):
+    help = "Apply stored Razorpay webhook events to their orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep consuming instead of exiting once no events are pending.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to sleep between passes when running with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = 0
+            while True:
+                count = process_payment_events(batch_size=options["batch_size"])
+                processed += count
+                if count < options["batch_size"]:
+                    break
+            if processed:
+                self.stdout.write(f"Processed {processed} payment events.")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from store.rollups import rebuild_rollups
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups of a date range from the orders. "
+        "The range is split into chunks rebuilt in parallel, each in its own "
+        "transaction. Days still taking orders may race with live updates, so "
+        "prefer rebuilding closed days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day, YYYY-MM-DD.")
+        parser.add_argument("--end", help="Last day, YYYY-MM-DD; defaults to today.")
+        parser.add_argument("--chunk-days", type=int, default=7)
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        end = parse_date(options["end"]) if options["end"] else timezone.localdate()
+        start = parse_date(options["start"]) if options["start"] else end
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+        if options["chunk_days"] < 1 or options["workers"] < 1:
+            raise CommandError("--chunk-days and --workers must be positive.")
+
+        chunks = []
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(
+                chunk_start + timedelta(days=options["chunk_days"] - 1), end
+            )
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+
+        def rebuild(chunk):
+            try:
+                return chunk, rebuild_rollups(*chunk)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            for (chunk_start, chunk_end), rows in executor.map(rebuild, chunks):
+                self.stdout.write(f"{chunk_start} to {chunk_end}: {rows} rollup rows.")
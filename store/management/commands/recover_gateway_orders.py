@@ -0,0 +1,43 @@
+import time
+from django.core.management.base import BaseCommand
+from store.services import recover_awaiting_gateway_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Create Razorpay orders for checkouts that were committed locally but "
+        "never got a gateway order attached."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=60,
+            help="Only recover orders placed at least this many seconds ago.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep recovering instead of exiting after one pass.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30,
+            help="Seconds to sleep between passes when running with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            recovered, failed = recover_awaiting_gateway_orders(
+                grace=options["grace"], batch_size=options["batch_size"]
+            )
+            if recovered or failed:
+                self.stdout.write(
+                    f"Attached {recovered} gateway orders, {failed} failed."
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
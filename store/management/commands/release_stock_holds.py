@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from store.stock import release_expired_stock_holds
+
+
+class Command(BaseCommand):
+    help = "Return stock held by orders whose online payment was never completed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Orders to sweep per transaction.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep sweeping instead of exiting once no expired holds remain.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30,
+            help="Seconds to sleep between sweeps when running with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = 0
+            while True:
+                count = release_expired_stock_holds(batch_size=options["batch_size"])
+                released += count
+                if count < options["batch_size"]:
+                    break
+            if released:
+                self.stdout.write(f"Released stock held by {released} orders.")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
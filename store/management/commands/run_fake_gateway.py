@@ -0,0 +1,118 @@
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+from django.core.management.base import BaseCommand
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    """
+    Serves the subset of the Razorpay API used by the store: order creation
+    and payment refunds. Latency and failures are injected per request.
+    """
+
+    protocol_version = "HTTP/1.1"
+    routes = [
+        ("POST", re.compile(r"^/v1/orders$"), "create_order"),
+        ("POST", re.compile(r"^/v1/payments/(?P<id>[\w]+)/refund$"), "refund"),
+    ]
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.latency)
+        if random.random() < self.server.failure_rate:
+            return self.respond(
+                500, {"error": {"code": "SERVER_ERROR", "description": "Injected"}}
+            )
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(self.path)
+            if route_method == method and match:
+                payload = getattr(self, handler)(body, **match.groupdict())
+                return self.respond(200, payload)
+        self.respond(
+            404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Not found"}}
+        )
+
+    def create_order(self, body):
+        return {
+            "id": f"order_{uuid4().hex[:14]}",
+            "entity": "order",
+            "amount": body.get("amount"),
+            "currency": body.get("currency", "INR"),
+            "status": "created",
+            "notes": body.get("notes", {}),
+            "created_at": int(time.time()),
+        }
+
+    def refund(self, body, id):
+        # Like Razorpay, a repeated idempotency key returns the first refund.
+        key = self.headers.get("X-Refund-Idempotency")
+        if key in self.server.refunds:
+            return self.server.refunds[key]
+        refund = {
+            "id": f"rfnd_{uuid4().hex[:14]}",
+            "entity": "refund",
+            "payment_id": id,
+            "amount": body.get("amount"),
+            "status": "processed",
+            "created_at": int(time.time()),
+        }
+        if key:
+            self.server.refunds[key] = refund
+        return refund
+
+    def respond(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the Razorpay API. Set RAZORPAY_BASE_URL to "
+        "http://<host>:<port> to send payment calls to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--latency", type=float, default=0, help="Delay per request in ms."
+        )
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0,
+            help="Fraction of requests answered with a 500 error.",
+        )
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(
+            (options["host"], options["port"]), FakeGatewayHandler
+        )
+        server.latency = options["latency"] / 1000
+        server.failure_rate = options["failure_rate"]
+        server.refunds = {}
+        server.verbose = options["verbosity"] > 1
+        self.stdout.write(
+            f"Fake gateway listening on http://{options['host']}:{options['port']}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
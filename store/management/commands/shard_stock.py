@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.models import Product
+from store.stock import shard_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Split a product's stock across counter rows for high-contention sales, "
+        "or fold it back with --shards 0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("slug", help="Slug of the product to (un)shard.")
+        parser.add_argument("--shards", type=int, default=8)
+
+    def handle(self, *args, **options):
+        if options["shards"] < 0:
+            raise CommandError("--shards must not be negative.")
+        try:
+            product = Product.objects.get(slug=options["slug"])
+        except Product.DoesNotExist:
+            raise CommandError(f"No product with slug '{options['slug']}'.")
+        shard_stock(product, options["shards"])
+        product = Product.objects.with_stock_totals().get(pk=product.pk)
+        self.stdout.write(
+            f"{product.name}: {product.shard_count} shards, "
+            f"{product.current_stock} in stock."
+        )
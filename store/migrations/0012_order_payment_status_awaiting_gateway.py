@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-16 22:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_shard_count_stockshard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='payment_status',
+            field=models.CharField(choices=[('G', 'Awaiting Gateway'), ('P', 'Pending'), ('S', 'Successful'), ('U', 'Unsuccessful'), ('R', 'Refunded')], default='P', max_length=1),
+        ),
+    ]
@@ -1,14 +1,123 @@
 from decimal import Decimal, ROUND_HALF_UP
 from django.db import models
-from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce
 from uuid import uuid4
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_content_objects(self):
+        # GenericForeignKey prefetching groups rows by content_type_id and
+        # loads each linked model with a single IN query.
+        return self.select_related("content_type").prefetch_related("content_obj")
+
+    def with_review_summary(self):
+        # review_summaries is unique per product, so this is a plain LEFT JOIN.
+        histogram = {
+            f"rating_{rating}": Coalesce(
+                models.F(f"review_summaries__rating_{rating}"), models.Value(0)
+            )
+            for rating in range(1, 6)
+        }
+        return self.annotate(
+            rating_avg=Coalesce(
+                models.F("review_summaries__rating_avg"),
+                models.Value(Decimal("0")),
+                output_field=models.DecimalField(max_digits=3, decimal_places=2),
+            ),
+            rating_count=Coalesce(
+                models.F("review_summaries__rating_count"), models.Value(0)
+            ),
+            **histogram,
+        )
+
+    def with_stock_totals(self):
+        shard_totals = (
+            StockShard.objects.filter(product=models.OuterRef("pk"))
+            .values("product")
+            .annotate(total=models.Sum("stock"))
+            .values("total")
+        )
+        return self.annotate(
+            stock_total=models.Case(
+                models.When(shard_count=0, then=models.F("stock")),
+                default=models.F("stock")
+                + Coalesce(models.Subquery(shard_totals), models.Value(0)),
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+
+    def for_fields(self, requested=None):
+        """
+        Apply only the joins, prefetches and annotations that the serialized
+        fields accepted by ``requested(name)`` read; all of them by default.
+        """
+        requested = requested or (lambda name: True)
+        queryset = self
+        if requested("product_url"):
+            queryset = queryset.with_content_objects()
+        elif requested("content_type"):
+            queryset = queryset.select_related("content_type")
+        if requested("stock") or requested("is_available"):
+            queryset = queryset.with_stock_totals()
+        summary_fields = ["rating_avg", "rating_count", "rating_histogram"]
+        if any(requested(name) for name in summary_fields):
+            queryset = queryset.with_review_summary()
+        return queryset
+
+
+def price_field():
+    return models.DecimalField(max_digits=10, decimal_places=2)
+
+
+def line_price(net_price="product__net_price"):
+    return models.ExpressionWrapper(
+        models.F(net_price) * models.F("quantity"),
+        output_field=price_field(),
+    )
+
+
+def line_price_sum(net_price="product__net_price"):
+    return models.Sum(line_price(net_price), output_field=price_field())
+
+
+def items_total(item_model, parent_field):
+    # A correlated subquery keeps GROUP BY out of the parent query, so the
+    # total composes with its other annotations, filters and orderings.
+    totals = (
+        item_model.objects.filter(**{parent_field: models.OuterRef("pk")})
+        .values(parent_field)
+        .annotate(total=line_price_sum(item_model.net_price_lookup))
+        .values("total")
+    )
+    return Coalesce(
+        models.Subquery(totals), models.Value(Decimal("0")), output_field=price_field()
+    )
+
+
+class LineItemQuerySet(models.QuerySet):
+    def with_line_price(self):
+        return self.annotate(line_price=line_price(self.model.net_price_lookup))
+
+
+class CartQuerySet(models.QuerySet):
+    def with_items_total(self):
+        return self.annotate(items_total=items_total(CartItem, "cart"))
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_items_total(self):
+        return self.annotate(items_total=items_total(OrderItem, "order"))
+
+
+def prefetch_products(lookup, requested=None):
+    return models.Prefetch(lookup, queryset=Product.objects.for_fields(requested))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255, unique=True, blank=True)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
@@ -25,11 +134,19 @@ class Product(models.Model):
     content_type = models.ForeignKey(to=ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_obj = GenericForeignKey("content_type", "object_id")
+    review_summaries = GenericRelation("feedback.ReviewSummary")
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     track_stock = models.BooleanField(default=True)
+    # When greater than zero, most of the stock lives in StockShard rows so
+    # concurrent checkouts do not all contend on this row.
+    shard_count = models.PositiveSmallIntegerField(default=0)
+    # Only changed through the guarded UPDATEs in store.stock.
+    STOCK_FIELDS = ["stock", "shard_count"]
+
+    objects = ProductQuerySet.as_manager()
 
     _cached_allowed_content_types = None
 
@@ -86,6 +203,19 @@ class Product(models.Model):
         self.update_from_content_obj()
         super().save(*args, **kwargs)
 
+    def save_details(self):
+        """
+        Save an existing product without its stock counters, which checkouts
+        may have moved since the row was read.
+        """
+        self.save(
+            update_fields=[
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STOCK_FIELDS
+            ]
+        )
+
     def update_from_content_obj(self):
         if not self.content_obj:
             raise ValidationError("Content object must be set before saving.")
@@ -102,9 +232,20 @@ class Product(models.Model):
                 self.preview_image = candidate
                 break
 
+    @property
+    def current_stock(self):
+        total = getattr(self, "stock_total", None)
+        if total is None:
+            total = self.stock
+            if self.shard_count:
+                total += (
+                    self.stock_shards.aggregate(total=models.Sum("stock"))["total"] or 0
+                )
+        return total
+
     @property
     def is_available(self):
-        return self.stock > 0
+        return self.current_stock > 0
 
     @property
     def availability_status(self):
@@ -121,22 +262,21 @@ class Product(models.Model):
             return self.content_obj.get_absolute_url()
         return None
 
-    def consume_stock(self, quantity=1):
-        if self.track_stock:
-            if self.stock < quantity:
-                raise ValidationError(f"Not enough stock to consume for {self.name}")
-            self.stock -= quantity
-            self.save()
-
-    def restore_stock(self, quantity=1):
-        if self.track_stock:
-            self.stock += quantity
-            self.save()
-
     def __str__(self):
         return self.name or str(self.content_obj)
 
 
+class StockShard(models.Model):
+    product = models.ForeignKey(
+        to=Product, on_delete=models.CASCADE, related_name="stock_shards"
+    )
+    index = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [["product", "index"]]
+
+
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     user = models.OneToOneField(
@@ -144,9 +284,14 @@ class Cart(models.Model):
     )
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     @property
     def total_price(self):
-        return sum(item.price for item in self.cart_items.all())
+        total = getattr(self, "items_total", None)
+        if total is None:
+            total = self.cart_items.aggregate(total=line_price_sum())["total"]
+        return total or Decimal("0")
 
 
 class CartItem(models.Model):
@@ -156,9 +301,15 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = LineItemQuerySet.as_manager()
+    net_price_lookup = "product__net_price"
+
     @property
     def price(self):
-        return self.product.get_net_price() * self.quantity
+        price = getattr(self, "line_price", None)
+        if price is None:
+            price = self.product.net_price * self.quantity
+        return price
 
     class Meta:
         unique_together = [["cart", "product"]]
@@ -181,11 +332,13 @@ class ShippingDetail(models.Model):
 
 class Order(models.Model):
     user = models.ForeignKey(to=settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    PAYMENT_STATUS_AWAITING_GATEWAY = "G"
     PAYMENT_STATUS_PENDING = "P"
     PAYMENT_STATUS_SUCCESSFUL = "S"
     PAYMENT_STATUS_UNSUCCESSFUL = "U"
     PAYMENT_STATUS_REFUNDED = "R"
     PAYMENT_STATUS_CHOICES = [
+        (PAYMENT_STATUS_AWAITING_GATEWAY, "Awaiting Gateway"),
         (PAYMENT_STATUS_PENDING, "Pending"),
         (PAYMENT_STATUS_SUCCESSFUL, "Successful"),
         (PAYMENT_STATUS_UNSUCCESSFUL, "Unsuccessful"),
@@ -260,6 +413,8 @@ class Order(models.Model):
     )
     delivered_at = models.DateTimeField(blank=True, null=True)
     cancelled_at = models.DateTimeField(blank=True, null=True)
+    # Bumped by every state transition; see store.transitions.
+    version = models.PositiveIntegerField(default=0)
 
     def get_delivery_charge(self, delivery_method="home"):
         if delivery_method == "home":
@@ -268,20 +423,31 @@ class Order(models.Model):
             return Decimal("0.00")
         return Decimal("60.00")
 
+    objects = OrderQuerySet.as_manager()
+
     def get_total_price(self):
-        return sum(item.price for item in self.order_items.all()) + self.delivery_charge
+        total = getattr(self, "items_total", None)
+        if total is None:
+            total = self.order_items.aggregate(
+                total=line_price_sum(OrderItem.net_price_lookup)
+            )["total"]
+        return (total or Decimal("0")) + self.delivery_charge
 
     def can_be_cancelled(self):
         return self.order_status == self.ORDER_STATUS_PROCESSING
 
+    def transition(self, name, **fields):
+        # store.transitions imports this module.
+        from .transitions import apply
+
+        return apply(self, name, **fields)
+
     def mark_as_cancelled(self):
-        self.order_status = self.ORDER_STATUS_CANCELLED
-        self.cancelled_at = timezone.now()
-        self.save()
+        self.transition("cancel")
 
     def cancel(self):
         if not self.can_be_cancelled():
-            return ValidationError("Order can not be cancelled now.")
+            raise ValidationError("Order can not be cancelled now.")
         self.mark_as_cancelled()
 
     def can_be_refunded(self):
@@ -292,28 +458,16 @@ class Order(models.Model):
         )
 
     def mark_as_refunded(self, refund_id):
-        self.refund_id = refund_id
-        self.refunded_at = timezone.now()
-        self.refund_status = self.REFUND_STATUS_SUCCESSFUL
-        self.payment_status = self.PAYMENT_STATUS_REFUNDED
-        self.save()
+        self.transition("refund", refund_id=refund_id)
 
     def mark_refund_failed(self):
-        self.refund_status = self.REFUND_STATUS_FAILED
-        self.save()
+        self.transition("refund_failed")
 
     def mark_payment_as_failed(self):
-        self.payment_status = self.PAYMENT_STATUS_UNSUCCESSFUL
-        self.save()
-
-    def update_order_status(self, order_status):
-        self.order_status = order_status
-        self.save()
+        self.transition("fail_payment")
 
     def mark_as_completed(self):
-        self.order_status = self.ORDER_STATUS_COMPLETED
-        self.delivered_at = timezone.now()
-        self.save()
+        self.transition("complete")
 
 
 class OrderItem(models.Model):
@@ -323,9 +477,145 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(default=1)
 
+    # The product as it was sold, copied at checkout, so order history keeps
+    # the price paid and never reads the product row.
+    name = models.CharField(max_length=255, blank=True)
+    slug = models.SlugField(max_length=255, blank=True)
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2, null=True)
+    discount = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    net_price = models.DecimalField(max_digits=6, decimal_places=2, null=True)
+    preview_image_url = models.CharField(max_length=500, blank=True)
+
+    objects = LineItemQuerySet.as_manager()
+    net_price_lookup = "net_price"
+
     @property
     def price(self):
-        return self.product.get_net_price() * self.quantity
+        price = getattr(self, "line_price", None)
+        if price is None and self.net_price is not None:
+            price = self.net_price * self.quantity
+        return price
+
+    def snapshot_product(self):
+        product = self.product
+        self.name = product.name
+        self.slug = product.slug
+        self.unit_price = product.unit_price
+        self.discount = product.discount
+        self.net_price = product.net_price
+        self.preview_image_url = (
+            product.preview_image.url if product.preview_image else ""
+        )
+
+    class Meta:
+        unique_together = [["order", "product"]]
+
+
+class StockHold(models.Model):
+    order = models.ForeignKey(
+        to=Order, on_delete=models.CASCADE, related_name="stock_holds"
+    )
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
 
     class Meta:
         unique_together = [["order", "product"]]
+
+
+def amount_field():
+    return models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+
+class SalesRollup(models.Model):
+    """
+    Order metrics for one day, kept current as orders are completed,
+    cancelled and refunded (see store.rollups). Completed orders count on the
+    day they were delivered, cancellations and refunds on the day they
+    happened.
+    """
+
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = amount_field()
+    cancelled_orders = models.PositiveIntegerField(default=0)
+    cancelled_units = models.PositiveIntegerField(default=0)
+    cancelled_amount = amount_field()
+    refunded_orders = models.PositiveIntegerField(default=0)
+    refunded_units = models.PositiveIntegerField(default=0)
+    refunded_amount = amount_field()
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    class Meta:
+        verbose_name_plural = "daily sales"
+        constraints = [
+            models.UniqueConstraint(fields=["date"], name="unique_daily_sales")
+        ]
+
+
+class DailyProductSales(SalesRollup):
+    # Amounts are line prices, so they leave out delivery charges.
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+
+    class Meta:
+        verbose_name_plural = "daily product sales"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "product"], name="unique_daily_product_sales"
+            )
+        ]
+
+
+class DailyMethodSales(SalesRollup):
+    payment_method = models.CharField(
+        max_length=20, choices=Order.PAYMENT_METHOD_CHOICES
+    )
+    delivery_method = models.CharField(
+        max_length=10, choices=Order.DELIVERY_METHOD_CHOICES
+    )
+
+    class Meta:
+        verbose_name_plural = "daily method sales"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "payment_method", "delivery_method"],
+                name="unique_daily_method_sales",
+            )
+        ]
+
+
+class PaymentEvent(models.Model):
+    """A Razorpay webhook as received, applied to its order later in batches."""
+
+    STATUS_PENDING = "P"
+    STATUS_PROCESSED = "D"
+    STATUS_IGNORED = "I"
+    # Money moved that no order could take; needs a manual refund or review.
+    STATUS_FLAGGED = "F"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSED, "Processed"),
+        (STATUS_IGNORED, "Ignored"),
+        (STATUS_FLAGGED, "Flagged"),
+    ]
+
+    # Razorpay's X-Razorpay-Event-Id; redeliveries of an event share it.
+    event_id = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "received_at"])]
+
+    def __str__(self):
+        return f"{self.event} ({self.event_id})"
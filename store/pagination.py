@@ -1,5 +1,5 @@
-from rest_framework.pagination import PageNumberPagination
+from core.pagination import SelectablePagination
 
 
-class DefaultPagination(PageNumberPagination):
+class DefaultPagination(SelectablePagination):
     page_size = 20
@@ -0,0 +1,173 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from .models import (
+    DailyMethodSales,
+    DailyProductSales,
+    DailySales,
+    Order,
+    OrderItem,
+)
+
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+REFUNDED = "refunded"
+
+# Metric columns each event adds to, as (orders, units, amount).
+EVENT_FIELDS = {
+    COMPLETED: ("orders", "units", "revenue"),
+    CANCELLED: ("cancelled_orders", "cancelled_units", "cancelled_amount"),
+    REFUNDED: ("refunded_orders", "refunded_units", "refunded_amount"),
+}
+EVENT_TIMESTAMPS = {
+    COMPLETED: "delivered_at",
+    CANCELLED: "cancelled_at",
+    REFUNDED: "refunded_at",
+}
+ROLLUP_MODELS = [DailySales, DailyProductSales, DailyMethodSales]
+
+
+def accumulate(orders, lines, event):
+    """
+    Group the metrics ``event`` adds for ``orders`` (values() rows with a
+    ``date``) and their ``lines`` into {(model, keys): {field: delta}}.
+    """
+    orders_field, units_field, amount_field = EVENT_FIELDS[event]
+    deltas = defaultdict(lambda: defaultdict(int))
+    order_units = defaultdict(int)
+    dates = {}
+    for order in orders:
+        dates[order["pk"]] = order["date"]
+    for line in lines:
+        order_units[line["order_id"]] += line["quantity"]
+        keys = (
+            ("date", dates[line["order_id"]]),
+            ("product_id", line["product_id"]),
+        )
+        product = deltas[DailyProductSales, keys]
+        product[orders_field] += 1
+        product[units_field] += line["quantity"]
+        product[amount_field] += (line["net_price"] or 0) * line["quantity"]
+    for order in orders:
+        day = (("date", order["date"]),)
+        method = day + (
+            ("payment_method", order["payment_method"]),
+            ("delivery_method", order["delivery_method"]),
+        )
+        for key in [(DailySales, day), (DailyMethodSales, method)]:
+            metrics = deltas[key]
+            metrics[orders_field] += 1
+            metrics[units_field] += order_units[order["pk"]]
+            metrics[amount_field] += order["total_price"]
+    return deltas
+
+
+def load_event(order_filter, event):
+    timestamp = EVENT_TIMESTAMPS[event]
+    orders = list(
+        Order.objects.filter(order_filter).values(
+            "pk", "payment_method", "delivery_method", "total_price", timestamp
+        )
+    )
+    for order in orders:
+        order["date"] = timezone.localdate(order.pop(timestamp))
+    lines = OrderItem.objects.filter(
+        order_id__in=[order["pk"] for order in orders]
+    ).values("order_id", "product_id", "quantity", "net_price")
+    return accumulate(orders, lines, event)
+
+
+def increment(model, keys, deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Another transaction created the row first.
+        model.objects.filter(**keys).update(**changes)
+
+
+def record_orders(order_ids, event):
+    """
+    Add ``event`` for the given orders to the rollups of the day it happened.
+    Call it in the transaction that changes the orders' state.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    deltas = load_event(Q(pk__in=order_ids), event)
+    # A fixed lock order keeps concurrent updates from deadlocking.
+    for (model, keys), metrics in sorted(
+        deltas.items(), key=lambda item: (ROLLUP_MODELS.index(item[0][0]), item[0][1])
+    ):
+        increment(model, dict(keys), metrics)
+
+
+def rebuild_rollups(start, end):
+    """
+    Recompute the rollups of ``start`` to ``end`` (inclusive) from the orders,
+    replacing whatever was recorded for those days.
+    """
+    tz = timezone.get_current_timezone()
+    since = timezone.make_aware(datetime.combine(start, time.min), tz)
+    until = timezone.make_aware(
+        datetime.combine(end + timedelta(days=1), time.min), tz
+    )
+    with transaction.atomic():
+        for model in ROLLUP_MODELS:
+            model.objects.filter(date__range=(start, end)).delete()
+        rows = defaultdict(lambda: defaultdict(int))
+        for event, timestamp in EVENT_TIMESTAMPS.items():
+            order_filter = Q(
+                **{f"{timestamp}__gte": since, f"{timestamp}__lt": until}
+            )
+            for key, metrics in load_event(order_filter, event).items():
+                for field, delta in metrics.items():
+                    rows[key][field] += delta
+        for model in ROLLUP_MODELS:
+            model.objects.bulk_create(
+                [
+                    model(**dict(keys), **metrics)
+                    for (row_model, keys), metrics in rows.items()
+                    if row_model is model
+                ]
+            )
+    return len(rows)
+
+
+METRIC_FIELDS = [field for fields in EVENT_FIELDS.values() for field in fields]
+REPORT_GROUPINGS = {
+    "day": (DailySales, ["date"]),
+    "product": (DailyProductSales, ["product_id"]),
+    "method": (DailyMethodSales, ["payment_method", "delivery_method"]),
+}
+
+
+def sales_report(start, end, group_by="day"):
+    """Metrics of ``start`` to ``end`` read from the rollups alone."""
+    model, keys = REPORT_GROUPINGS[group_by]
+    sums = {f"sum_{metric}": Sum(metric) for metric in METRIC_FIELDS}
+
+    def metrics(row):
+        return {metric: row[f"sum_{metric}"] or 0 for metric in METRIC_FIELDS}
+
+    rows = (
+        model.objects.filter(date__range=(start, end))
+        .values(*keys)
+        .annotate(**sums)
+        .order_by(*keys)
+    )
+    totals = DailySales.objects.filter(date__range=(start, end)).aggregate(**sums)
+    return {
+        "start": start,
+        "end": end,
+        "group_by": group_by,
+        "totals": metrics(totals),
+        "results": [
+            {**{key: row[key] for key in keys}, **metrics(row)} for row in rows
+        ],
+    }
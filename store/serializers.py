@@ -1,16 +1,109 @@
-from django.conf import settings
+import logging
+from collections import defaultdict
+from datetime import timedelta
 from django.contrib.contenttypes.models import ContentType
-from django.db import transaction
-import razorpay
+from django.db import connections, transaction
+from django.db.models import (
+    Case,
+    OuterRef,
+    PositiveIntegerField,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from rest_framework import serializers
-from . import models
-
-
-class ProductSerializer(serializers.ModelSerializer):
+from core.compiled import compiled
+from core.sparse import SparseFieldsMixin
+from . import models, services, stock, transitions
+
+
+class ProductStockField(serializers.IntegerField):
+    def get_attribute(self, instance):
+        # Sharded products keep their stock across counter rows, so read the
+        # aggregated total; ProductStockWriteMixin writes it back the same way.
+        return instance.current_stock
+
+
+class ProductStockWriteMixin:
+    """
+    Updates set ``stock`` as the total across the product's shards and leave
+    the counters out of the row save, so concurrent checkouts are not undone.
+    """
+
+    def update(self, instance, validated_data):
+        quantity = validated_data.pop("stock", None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save_details()
+        if quantity is not None:
+            stock.set_stock(instance, quantity)
+            instance.refresh_from_db(fields=models.Product.STOCK_FIELDS)
+            instance.__dict__.pop("stock_total", None)
+        return instance
+
+
+class ProductSerializer(
+    SparseFieldsMixin, ProductStockWriteMixin, serializers.ModelSerializer
+):
     content_type = serializers.SlugRelatedField(
         queryset=ContentType.objects.all(), slug_field="model"
     )
+    stock = ProductStockField(min_value=0, required=False)
     product_url = serializers.SerializerMethodField()
+    rating_avg = serializers.DecimalField(
+        max_digits=3, decimal_places=2, read_only=True, default=0
+    )
+    rating_count = serializers.IntegerField(read_only=True, default=0)
+    rating_histogram = serializers.SerializerMethodField()
+
+    def get_compiled_queryset(self, queryset):
+        return queryset.for_fields(lambda name: name in self.fields)
+
+    @compiled("stock_total")
+    def compiled_stock(self, rows, context):
+        return [row["stock_total"] for row in rows]
+
+    @compiled("stock_total")
+    def compiled_is_available(self, rows, context):
+        return [row["stock_total"] > 0 for row in rows]
+
+    @compiled(*[f"rating_{rating}" for rating in range(1, 6)])
+    def compiled_rating_histogram(self, rows, context):
+        return [
+            {str(rating): row[f"rating_{rating}"] for rating in range(1, 6)}
+            for row in rows
+        ]
+
+    @compiled("content_type", "object_id")
+    def compiled_product_url(self, rows, context):
+        # Load the linked objects one content type at a time, as the
+        # GenericForeignKey prefetch does.
+        object_ids = defaultdict(set)
+        for row in rows:
+            object_ids[row["content_type"]].add(row["object_id"])
+        urls = {}
+        for content_type_id, ids in object_ids.items():
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            for obj in content_type.get_all_objects_for_this_type(pk__in=ids):
+                if hasattr(obj, "get_absolute_url"):
+                    urls[content_type_id, obj.pk] = obj.get_absolute_url()
+
+        request = context.get("request")
+        values = []
+        for row in rows:
+            url = urls.get((row["content_type"], row["object_id"]))
+            if url and request is not None:
+                url = request.build_absolute_uri(url)
+            values.append(url or None)
+        return values
+
+    def get_rating_histogram(self, product):
+        return {
+            str(rating): getattr(product, f"rating_{rating}", 0)
+            for rating in range(1, 6)
+        }
 
     def get_product_url(self, product):
         url = product.get_product_url()
@@ -37,10 +130,13 @@ class ProductSerializer(serializers.ModelSerializer):
             "content_type",
             "product_url",
             "track_stock",
+            "rating_avg",
+            "rating_count",
+            "rating_histogram",
         ]
 
 
-class CreateProductSerializer(serializers.ModelSerializer):
+class CreateProductSerializer(ProductStockWriteMixin, serializers.ModelSerializer):
     content_type = serializers.SlugRelatedField(
         queryset=ContentType.objects.all(), slug_field="model"
     )
@@ -81,23 +177,24 @@ class CreateProductSerializer(serializers.ModelSerializer):
         ]
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer()
 
     class Meta:
         model = models.CartItem
         fields = ["id", "product", "quantity", "price"]
+        expandable_fields = ["product"]
 
 
 class AddCartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField()
 
     def validate_product_id(self, value):
-        product = models.Product.objects.filter(pk=value).first()
+        product = models.Product.objects.with_stock_totals().filter(pk=value).first()
         if not product:
             raise serializers.ValidationError("No Product with given id exists.")
         quantity = self.initial_data.get("quantity", 1)
-        if product.stock < int(quantity):
+        if product.current_stock < int(quantity):
             raise serializers.ValidationError(
                 "Requested quantity exceeds available stock."
             )
@@ -132,13 +229,140 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         fields = ["quantity"]
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartItemOperationSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class BulkCartItemSerializer(serializers.Serializer):
+    MODE_ADD = "add"
+    MODE_SET = "set"
+    MODE_CHOICES = [(MODE_ADD, "Add to cart quantity"), (MODE_SET, "Set quantity")]
+
+    mode = serializers.ChoiceField(choices=MODE_CHOICES, default=MODE_ADD)
+    items = CartItemOperationSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        quantities = {}
+        for item in data["items"]:
+            quantity = item["quantity"]
+            if data["mode"] == self.MODE_ADD:
+                quantity += quantities.get(item["product_id"], 0)
+            quantities[item["product_id"]] = quantity
+
+        in_cart = models.CartItem.objects.filter(
+            cart_id=self.context["cart_id"], product=OuterRef("pk")
+        ).values("quantity")
+        products = {
+            product["id"]: product
+            for product in models.Product.objects.with_stock_totals()
+            .filter(pk__in=quantities)
+            .annotate(in_cart=Coalesce(Subquery(in_cart), Value(0)))
+            .values("id", "name", "track_stock", "stock_total", "in_cart")
+        }
+        missing = [pk for pk in quantities if pk not in products]
+        if missing:
+            raise serializers.ValidationError(
+                {"items": [f"No Product with id {pk} exists." for pk in missing]}
+            )
+
+        insufficient = []
+        for product_id, quantity in quantities.items():
+            product = products[product_id]
+            if data["mode"] == self.MODE_ADD:
+                quantity += product["in_cart"]
+            if product["track_stock"] and quantity > product["stock_total"]:
+                insufficient.append(
+                    {
+                        "product_id": product_id,
+                        "name": product["name"],
+                        "requested": quantity,
+                        "available": product["stock_total"],
+                    }
+                )
+        if insufficient:
+            raise serializers.ValidationError({"items": insufficient})
+
+        data["quantities"] = quantities
+        return data
+
+    def save(self, **kwargs):
+        cart_id = self.context["cart_id"]
+        mode = self.validated_data["mode"]
+        quantities = self.validated_data["quantities"]
+
+        with transaction.atomic():
+            existing = dict(
+                models.CartItem.objects.select_for_update()
+                .filter(cart_id=cart_id, product_id__in=quantities)
+                .values_list("product_id", "quantity")
+            )
+            if mode == self.MODE_ADD:
+                quantities = {
+                    product_id: existing.get(product_id, 0) + quantity
+                    for product_id, quantity in quantities.items()
+                }
+            removed = [pk for pk, quantity in quantities.items() if not quantity]
+            if removed:
+                models.CartItem.objects.filter(
+                    cart_id=cart_id, product_id__in=removed
+                ).delete()
+            upsert_cart_items(
+                cart_id,
+                {pk: quantity for pk, quantity in quantities.items() if quantity},
+                existing,
+            )
+
+
+def upsert_cart_items(cart_id, quantities, existing):
+    """
+    Write the final quantity of each product in one INSERT ... ON CONFLICT /
+    ON DUPLICATE KEY UPDATE statement. Backends without upserts get a single
+    UPDATE for the rows in ``existing`` and a bulk INSERT for the rest.
+    """
+    if not quantities:
+        return
+    features = connections[models.CartItem.objects.db].features
+    if features.supports_update_conflicts:
+        options = {"update_conflicts": True, "update_fields": ["quantity"]}
+        if features.supports_update_conflicts_with_target:
+            options["unique_fields"] = ["cart", "product"]
+        models.CartItem.objects.bulk_create(
+            [
+                models.CartItem(cart_id=cart_id, product_id=pk, quantity=quantity)
+                for pk, quantity in quantities.items()
+            ],
+            **options,
+        )
+        return
+
+    updated = {pk: quantity for pk, quantity in quantities.items() if pk in existing}
+    if updated:
+        models.CartItem.objects.filter(cart_id=cart_id, product_id__in=updated).update(
+            quantity=Case(
+                *[
+                    When(product_id=pk, then=Value(quantity))
+                    for pk, quantity in updated.items()
+                ],
+                output_field=PositiveIntegerField(),
+            )
+        )
+    models.CartItem.objects.bulk_create(
+        [
+            models.CartItem(cart_id=cart_id, product_id=pk, quantity=quantity)
+            for pk, quantity in quantities.items()
+            if pk not in existing
+        ]
+    )
+
+
+class CartSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     cart_items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self, cart):
-        return sum([item.price for item in cart.cart_items.all()])
+        return cart.total_price
 
     class Meta:
         model = models.Cart
@@ -152,7 +376,7 @@ class CreateCartSerializer(serializers.Serializer):
         return cart
 
 
-class ShippingDetailSerializer(serializers.ModelSerializer):
+class ShippingDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.ShippingDetail
         fields = [
@@ -166,15 +390,49 @@ class ShippingDetailSerializer(serializers.ModelSerializer):
         ]
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    product = serializers.PrimaryKeyRelatedField(read_only=True)
+    preview_image_url = serializers.SerializerMethodField()
+
+    def get_preview_image_url(self, item):
+        return self.build_image_url(item.preview_image_url, self.context)
+
+    def build_image_url(self, url, context):
+        if not url:
+            return None
+        request = context.get("request")
+        if request is None:
+            return url
+        return request.build_absolute_uri(url)
+
+    def get_compiled_queryset(self, queryset):
+        return queryset.with_line_price()
+
+    @compiled("line_price")
+    def compiled_price(self, rows, context):
+        return [row["line_price"] for row in rows]
+
+    @compiled("preview_image_url")
+    def compiled_preview_image_url(self, rows, context):
+        return [self.build_image_url(row["preview_image_url"], context) for row in rows]
 
     class Meta:
         model = models.OrderItem
-        fields = ["id", "product", "quantity", "price"]
+        fields = [
+            "id",
+            "product",
+            "name",
+            "slug",
+            "unit_price",
+            "discount",
+            "net_price",
+            "preview_image_url",
+            "quantity",
+            "price",
+        ]
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True)
     shipping_details = ShippingDetailSerializer()
 
@@ -196,13 +454,33 @@ class OrderSerializer(serializers.ModelSerializer):
             "refunded_at",
             "shipping_details",
             "razorpay_order_id",
+            "version",
         ]
+        expandable_fields = ["shipping_details"]
 
 
 class UpdateOrderSerializer(serializers.ModelSerializer):
+    transition = serializers.ChoiceField(
+        choices=transitions.STAFF_TRANSITIONS, write_only=True
+    )
+    version = serializers.IntegerField(required=False)
+
     class Meta:
         model = models.Order
-        fields = ["payment_status", "order_status"]
+        fields = ["transition", "payment_status", "order_status", "version"]
+        read_only_fields = ["payment_status", "order_status"]
+
+    def validate(self, attrs):
+        if "transition" not in attrs:
+            raise serializers.ValidationError(
+                {"transition": self.fields["transition"].error_messages["required"]}
+            )
+        return attrs
+
+    def update(self, instance, validated_data):
+        # Clients may send the version they last read.
+        instance.version = validated_data.get("version", instance.version)
+        return instance.transition(validated_data["transition"])
 
 
 class CreateOrderSerializer(serializers.Serializer):
@@ -237,6 +515,21 @@ class CreateOrderSerializer(serializers.Serializer):
         return data
 
     def save(self, **kwargs):
+        order = self.place_order()
+        if order.payment_method == models.Order.PAYMENT_METHOD_RAZORPAY:
+            # The gateway round trip happens after the order, its stock holds
+            # and the cart removal are committed, so no locks are held while
+            # waiting on Razorpay. Orders left awaiting gateway are picked up
+            # by the recover_gateway_orders command.
+            try:
+                services.attach_razorpay_order(order)
+            except Exception as e:
+                logging.warning(
+                    f"Razorpay order creation failed for order {order.pk}: {e}"
+                )
+        return order
+
+    def place_order(self):
         with transaction.atomic():
             cart_id = self.validated_data.get("cart_id")
             shipping_data = self.validated_data.get("shipping_details")
@@ -252,6 +545,11 @@ class CreateOrderSerializer(serializers.Serializer):
                 shipping_details=shipping_obj,
                 delivery_method=delivery_method,
                 payment_method=payment_method,
+                payment_status=(
+                    models.Order.PAYMENT_STATUS_AWAITING_GATEWAY
+                    if payment_method == models.Order.PAYMENT_METHOD_RAZORPAY
+                    else models.Order.PAYMENT_STATUS_PENDING
+                ),
             )
             order.delivery_charge = order.get_delivery_charge(delivery_method)
             cart_items = models.CartItem.objects.select_related("product").filter(
@@ -263,25 +561,20 @@ class CreateOrderSerializer(serializers.Serializer):
                 )
                 for item in cart_items
             ]
-
-            for item in cart_items:
-                item.product.consume_stock(item.quantity)
+            for order_item in order_items:
+                order_item.snapshot_product()
+
+            stock_lines = [(item.product_id, item.quantity) for item in cart_items]
+            try:
+                if payment_method == models.Order.PAYMENT_METHOD_RAZORPAY:
+                    stock.hold_stock(order, stock_lines)
+                else:
+                    stock.reserve_stock(stock_lines)
+            except stock.InsufficientStockError as e:
+                raise serializers.ValidationError({"cart_items": e.lines})
 
             models.OrderItem.objects.bulk_create(order_items)
             order.total_price = order.get_total_price()
-
-            if payment_method == models.Order.PAYMENT_METHOD_RAZORPAY:
-                client = razorpay.Client(
-                    auth=(settings.RAZORPAY_API_KEY, settings.RAZORPAY_API_SECRET)
-                )
-                razorpay_order = client.order.create(
-                    {
-                        "amount": int(order.total_price * 100),  # Amount in paise
-                        "currency": "INR",
-                        "payment_capture": 1,  # Auto capture
-                    }
-                )
-                order.razorpay_order_id = razorpay_order["id"]
             order.save()
 
             models.Cart.objects.get(pk=cart_id).delete()
@@ -289,6 +582,31 @@ class CreateOrderSerializer(serializers.Serializer):
             return order
 
 
+class BulkOrderTransitionSerializer(serializers.Serializer):
+    MAX_ORDERS = 500
+
+    transition = serializers.ChoiceField(choices=transitions.FULFILLMENT_TRANSITIONS)
+    order_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=MAX_ORDERS
+    )
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    GROUP_BY_CHOICES = ["day", "product", "method"]
+    DEFAULT_DAYS = 30
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=GROUP_BY_CHOICES, default="day")
+
+    def validate(self, data):
+        data.setdefault("end", timezone.localdate())
+        data.setdefault("start", data["end"] - timedelta(days=self.DEFAULT_DAYS - 1))
+        if data["start"] > data["end"]:
+            raise serializers.ValidationError("start must not be after end.")
+        return data
+
+
 class RazorpayPaymentVerifySerializer(serializers.Serializer):
     order_id = serializers.IntegerField()
     razorpay_order_id = serializers.CharField()
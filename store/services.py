@@ -1,22 +1,28 @@
 import hashlib
 import hmac
+import logging
+from collections import defaultdict
+from datetime import timedelta
 import razorpay
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
-from .models import Order
-
-client = razorpay.Client(auth=(settings.RAZORPAY_API_KEY, settings.RAZORPAY_API_SECRET))
+from .gateway import get_gateway
+from .models import Order, OrderItem, PaymentEvent
+from . import stock, tasks, transitions
 
 
 def refund_payment(order: Order):
     if not order.can_be_refunded():
         return {"success": False, "error": "Order is not eligible for refund."}
     try:
-        response = client.payment.refund(
+        response = get_gateway().refund_payment(
             order.razorpay_payment_id,
             {
                 "amount": int(order.total_price * 100),
             },
+            idempotency_key=f"refund-{order.razorpay_payment_id}",
         )
 
         return {"success": True, "refund": response}
@@ -28,9 +34,43 @@ def refund_payment(order: Order):
         return {"success": False, "error": f"Unexpected error: {str(e)}"}
 
 
+def settle_paid_order(order: Order):
+    """Keep the held stock of a paid order and complete it if all digital."""
+    stock.commit_stock_holds(order)
+    if not OrderItem.objects.filter(order=order, product__is_digital=False).exists():
+        order.transition("complete_digital")
+
+
+def capture_payment(order: Order, payment_id, **fields):
+    """
+    Record that ``payment_id`` paid ``order`` and settle the order. A payment
+    captured after the order was cancelled is refunded instead, since its
+    stock was already released; the refund is queued in the same transaction
+    and runs outside it. Returns False when that payment was already
+    recorded; raises InvalidTransition when the order cannot take it.
+    """
+    if (
+        order.payment_status == Order.PAYMENT_STATUS_SUCCESSFUL
+        and order.razorpay_payment_id == payment_id
+    ):
+        return False
+    with transaction.atomic():
+        if order.order_status == Order.ORDER_STATUS_CANCELLED:
+            order.transition("pay_late", razorpay_payment_id=payment_id, **fields)
+            tasks.refund_order.delay(order.pk)
+            logging.warning(
+                f"Payment {payment_id} was captured after order {order.pk} was "
+                "cancelled, refunding it."
+            )
+        else:
+            order.transition("pay", razorpay_payment_id=payment_id, **fields)
+            settle_paid_order(order)
+    return True
+
+
 def verify_razorpay_signature(data: dict, order: Order):
     expected_signature = hmac.new(
-        key=bytes(settings.RAZORPAY_KEY_SECRET, "utf-8"),
+        key=bytes(settings.RAZORPAY_API_SECRET, "utf-8"),
         msg=bytes(
             data["razorpay_order_id"] + "|" + data["razorpay_payment_id"], "utf-8"
         ),
@@ -38,19 +78,20 @@ def verify_razorpay_signature(data: dict, order: Order):
     ).hexdigest()
 
     if expected_signature == data["razorpay_signature"]:
-        order.razorpay_payment_id = data["razorpay_payment_id"]
-        order.razorpay_signature = data["razorpay_signature"]
-        order.payment_status = Order.PAYMENT_STATUS_SUCCESSFUL
-        order.save()
+        capture_payment(
+            order,
+            data["razorpay_payment_id"],
+            razorpay_signature=data["razorpay_signature"],
+        )
         return True
     else:
-        order.payment_status = Order.PAYMENT_STATUS_UNSUCCESSFUL
-        order.save()
+        if order.payment_status == Order.PAYMENT_STATUS_PENDING:
+            order.transition("fail_payment")
         return False
 
 
-def create_razorpay_order(order: Order):
-    response = client.order.create(
+def create_razorpay_order(order: Order, gateway=None):
+    response = (gateway or get_gateway()).create_order(
         {
             "amount": int(order.total_price * 100),
             "currency": "INR",
@@ -59,3 +100,187 @@ def create_razorpay_order(order: Order):
         }
     )
     return response
+
+
+def attach_razorpay_order(order: Order, gateway=None):
+    """
+    Second checkout phase: create the gateway order for an order committed as
+    awaiting gateway, outside any transaction. The versioned transition makes a
+    late or repeated call a no-op once another attempt has attached an order.
+    """
+    razorpay_order = create_razorpay_order(order, gateway)
+    try:
+        order.transition("attach_gateway", razorpay_order_id=razorpay_order["id"])
+    except (transitions.InvalidTransition, transitions.OrderConflict):
+        return False
+    return True
+
+
+def recover_awaiting_gateway_orders(grace=60, batch_size=100):
+    """
+    Attach gateway orders to checkouts that committed locally but never
+    completed the second phase. Returns (recovered, failed).
+    """
+    orders = Order.objects.filter(
+        payment_status=Order.PAYMENT_STATUS_AWAITING_GATEWAY,
+        order_status=Order.ORDER_STATUS_PROCESSING,
+        placed_at__lte=timezone.now() - timedelta(seconds=grace),
+    ).order_by("placed_at")[:batch_size]
+    recovered = failed = 0
+    for order in orders:
+        try:
+            if attach_razorpay_order(order):
+                stock.extend_stock_holds(order)
+                recovered += 1
+        except Exception as e:
+            logging.warning(f"Razorpay order creation failed for order {order.pk}: {e}")
+            failed += 1
+    return recovered, failed
+
+
+def transition_orders(order_ids, transition):
+    """
+    Apply a fulfillment transition to many orders with one read and one
+    compare-and-swap UPDATE. Returns a result per requested id; completed
+    orders share one ``delivered_at``.
+    """
+    errors, applied, changes = transitions.apply_many(order_ids, transition)
+    results = {
+        order_id: {"id": order_id, "error": error} for order_id, error in errors.items()
+    }
+    for order_id in applied:
+        results[order_id] = {
+            "id": order_id,
+            "order_status": changes["order_status"],
+            "delivered_at": changes.get("delivered_at"),
+        }
+    return [results[order_id] for order_id in dict.fromkeys(order_ids)]
+
+
+def verify_webhook_signature(body: bytes, signature: str):
+    secret = settings.RAZORPAY_WEBHOOK_SECRET
+    if not secret or not signature:
+        return False
+    expected_signature = hmac.new(
+        key=bytes(secret, "utf-8"), msg=body, digestmod=hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected_signature, signature)
+
+
+# Webhook events applied to orders, and the transition each one makes.
+PAYMENT_EVENT_TRANSITIONS = {
+    "payment.captured": "pay",
+    "order.paid": "pay",
+    "payment.failed": "fail_payment",
+    "refund.processed": "refund",
+    "refund.failed": "refund_failed",
+}
+
+
+def get_payment_event_entity(event: PaymentEvent):
+    """
+    The payment or refund the event is about, and the order column that
+    references it: payments carry the gateway order id, refunds the payment.
+    """
+    payload = event.payload.get("payload", {})
+    if event.event.startswith("refund."):
+        entity = payload.get("refund", {}).get("entity", {})
+        return entity, ("razorpay_payment_id", entity.get("payment_id"))
+    entity = payload.get("payment", {}).get("entity", {})
+    return entity, ("razorpay_order_id", entity.get("order_id"))
+
+
+def apply_payment_event(event: PaymentEvent, entity, order):
+    """Apply one event to its order and return the event's new status."""
+    transition = PAYMENT_EVENT_TRANSITIONS.get(event.event)
+    if transition is None:
+        return PaymentEvent.STATUS_IGNORED
+    if order is None:
+        if transition != "pay":
+            return PaymentEvent.STATUS_IGNORED
+        logging.error(
+            f"Payment {entity.get('id')} captured for an unknown gateway order "
+            f"{entity.get('order_id')} (event {event.event_id})."
+        )
+        return PaymentEvent.STATUS_FLAGGED
+    try:
+        if transition == "pay":
+            if not capture_payment(order, entity.get("id")):
+                # The browser verified this payment first.
+                return PaymentEvent.STATUS_IGNORED
+        elif transition == "refund":
+            order.transition(transition, refund_id=entity.get("id"))
+        else:
+            order.transition(transition)
+    except transitions.InvalidTransition as e:
+        if transition != "pay":
+            # Already applied, or superseded by a later state.
+            return PaymentEvent.STATUS_IGNORED
+        logging.error(
+            f"Payment {entity.get('id')} captured for order {order.pk} that "
+            f"cannot take it: {e.detail} (event {event.event_id})."
+        )
+        return PaymentEvent.STATUS_FLAGGED
+    except transitions.OrderConflict:
+        return PaymentEvent.STATUS_PENDING
+    return PaymentEvent.STATUS_PROCESSED
+
+
+def process_payment_events(batch_size=100):
+    """
+    Apply one batch of stored webhook events to their orders, oldest first.
+    The orders of the whole batch are read in one query, then each event is
+    applied and marked in its own transaction; refunds an event calls for
+    are queued there and reach the gateway only after it commits. Events
+    that lose a race with another change to their order stay pending for
+    the next batch. Returns the number of events handled.
+    """
+    events = list(
+        PaymentEvent.objects.filter(status=PaymentEvent.STATUS_PENDING).order_by("pk")[
+            :batch_size
+        ]
+    )
+    if not events:
+        return 0
+
+    entities = [get_payment_event_entity(event) for event in events]
+    references = defaultdict(set)
+    for _, (column, value) in entities:
+        if value:
+            references[column].add(value)
+    orders = {}
+
+    def index(order):
+        for column in ["razorpay_order_id", "razorpay_payment_id"]:
+            if getattr(order, column):
+                orders[column, getattr(order, column)] = order
+
+    if references:
+        lookup = Q()
+        for column, values in references.items():
+            lookup |= Q(**{f"{column}__in": values})
+        for order in Order.objects.filter(lookup):
+            index(order)
+
+    handled = 0
+    for event, (entity, reference) in zip(events, entities):
+        with transaction.atomic():
+            claim = PaymentEvent.objects.filter(
+                pk=event.pk, status=PaymentEvent.STATUS_PENDING
+            )
+            if connection.features.has_select_for_update_skip_locked:
+                claim = claim.select_for_update(skip_locked=True)
+            if not claim:
+                # Another processor has it.
+                continue
+            order = orders.get(reference)
+            status = apply_payment_event(event, entity, order)
+            if status != PaymentEvent.STATUS_PENDING:
+                PaymentEvent.objects.filter(pk=event.pk).update(
+                    status=status, processed_at=timezone.now()
+                )
+        handled += 1
+        if order is not None:
+            # A payment applied earlier in the batch can be refunded later.
+            index(order)
+    return handled
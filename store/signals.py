@@ -7,7 +7,10 @@ from django.conf import settings
 from django.db.models import ProtectedError
 from django.dispatch import receiver
 import logging
+from feedback.signals import review_summary_changed
 from .models import Product, Cart
+from .cache import bump_catalog_version
+from .tasks import resync_product
 
 
 def connect_content_object_signals():
@@ -15,10 +18,10 @@ def connect_content_object_signals():
         def handler(sender, instance, **kwargs):
             try:
                 ct = ContentType.objects.get_for_model(sender)
-                product = Product.objects.get(content_type=ct, object_id=instance.id)
-                product.save()
-            except Product.DoesNotExist:
-                pass
+                if Product.objects.filter(
+                    content_type=ct, object_id=instance.id
+                ).exists():
+                    resync_product.delay(ct.id, instance.id)
             except (ProgrammingError, OperationalError) as e:
                 logging.warning(f"Skipped signal connection, DB not ready yet: {e}")
 
@@ -33,6 +36,18 @@ def connect_content_object_signals():
         logging.warning(f"Skipped signal connection, DB not ready yet: {e}")
 
 
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(review_summary_changed)
+def invalidate_catalog_cache_on_review(sender, content_type_id, **kwargs):
+    if content_type_id == ContentType.objects.get_for_model(Product).id:
+        bump_catalog_version()
+
+
 @receiver(post_delete, sender=Cart)
 def create_cart_after_deletion(sender, instance, **kwargs):
     user = instance.user
@@ -0,0 +1,283 @@
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .models import Order, Product, StockHold, StockShard
+from .transitions import apply_many
+
+
+class InsufficientStockError(ValidationError):
+    def __init__(self, lines):
+        self.lines = lines
+        super().__init__(
+            [f"Not enough stock to consume for {line['name']}" for line in lines]
+        )
+
+
+def _merge_lines(lines):
+    quantities = {}
+    for product, quantity in lines:
+        product_id = getattr(product, "pk", product)
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _reserve_row(product_id, quantity, now):
+    return (
+        Product.objects.filter(pk=product_id)
+        .filter(models.Q(track_stock=False) | models.Q(stock__gte=quantity))
+        .update(
+            stock=Case(
+                When(track_stock=True, then=F("stock") - quantity),
+                default=F("stock"),
+                output_field=models.PositiveIntegerField(),
+            ),
+            updated_at=now,
+        )
+    )
+
+
+def _reserve_sharded(product_id, shard_count, quantity, now):
+    # Start from a random shard so concurrent buyers spread over different
+    # rows; the product row itself acts as one more counter.
+    for index in random.sample(range(shard_count), shard_count):
+        if StockShard.objects.filter(
+            product_id=product_id, index=index, stock__gte=quantity
+        ).update(stock=F("stock") - quantity):
+            return True
+    if _reserve_row(product_id, quantity, now):
+        return True
+
+    # No single counter can cover the quantity: drain them under lock.
+    shards = list(
+        StockShard.objects.select_for_update()
+        .filter(product_id=product_id)
+        .order_by("index")
+    )
+    product_stock = (
+        Product.objects.select_for_update()
+        .values_list("stock", flat=True)
+        .get(pk=product_id)
+    )
+    if product_stock + sum(shard.stock for shard in shards) < quantity:
+        return False
+    remaining = quantity
+    for shard in shards:
+        taken = min(shard.stock, remaining)
+        if taken:
+            StockShard.objects.filter(pk=shard.pk).update(stock=F("stock") - taken)
+            remaining -= taken
+    if remaining:
+        Product.objects.filter(pk=product_id).update(
+            stock=F("stock") - remaining, updated_at=now
+        )
+    return True
+
+
+def reserve_stock(lines):
+    """
+    Decrement stock for every (product, quantity) line with guarded
+    ``UPDATE ... SET stock = stock - n WHERE stock >= n`` statements. Either
+    every line is reserved or none is, and InsufficientStockError lists the
+    lines that could not be satisfied.
+    """
+    quantities = _merge_lines(lines)
+    now = timezone.now()
+    failed = []
+    with transaction.atomic():
+        sharded = dict(
+            Product.objects.filter(
+                pk__in=quantities, track_stock=True, shard_count__gt=0
+            ).values_list("pk", "shard_count")
+        )
+        # Locking rows in primary key order keeps concurrent checkouts from
+        # deadlocking on each other.
+        for product_id in sorted(quantities):
+            quantity = quantities[product_id]
+            if product_id in sharded:
+                reserved = _reserve_sharded(
+                    product_id, sharded[product_id], quantity, now
+                )
+            else:
+                reserved = _reserve_row(product_id, quantity, now)
+            if not reserved:
+                failed.append(product_id)
+        if failed:
+            found = {
+                product["id"]: product
+                for product in Product.objects.with_stock_totals()
+                .filter(pk__in=failed)
+                .values("id", "name", "stock_total")
+            }
+            raise InsufficientStockError(
+                [
+                    {
+                        "product_id": product_id,
+                        "name": found.get(product_id, {}).get("name", ""),
+                        "requested": quantities[product_id],
+                        "available": found.get(product_id, {}).get("stock_total", 0),
+                    }
+                    for product_id in failed
+                ]
+            )
+
+
+def release_stock(lines):
+    """
+    Return stock for every (product, quantity) line in a single set-based
+    UPDATE. Products that do not track stock are left untouched; for sharded
+    products the product row counts towards the total like any shard.
+    """
+    quantities = _merge_lines(lines)
+    if not quantities:
+        return 0
+    with transaction.atomic():
+        updated = Product.objects.filter(pk__in=quantities, track_stock=True).update(
+            stock=F("stock")
+            + Case(
+                *[
+                    When(pk=product_id, then=Value(quantity))
+                    for product_id, quantity in quantities.items()
+                ],
+                default=Value(0),
+                output_field=models.PositiveIntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+    return updated
+
+
+def shard_stock(product, shard_count):
+    """
+    Spread a product's stock evenly over ``shard_count`` StockShard rows, or
+    fold it back into the product row when ``shard_count`` is 0.
+    """
+    product_id = getattr(product, "pk", product)
+    with transaction.atomic():
+        product_stock = (
+            Product.objects.select_for_update()
+            .values_list("stock", flat=True)
+            .get(pk=product_id)
+        )
+        shards = StockShard.objects.select_for_update().filter(product_id=product_id)
+        total = product_stock + (
+            shards.aggregate(total=models.Sum("stock"))["total"] or 0
+        )
+        shards.delete()
+        if shard_count:
+            per_shard, extra = divmod(total, shard_count)
+            StockShard.objects.bulk_create(
+                [
+                    StockShard(
+                        product_id=product_id,
+                        index=index,
+                        stock=per_shard + (1 if index < extra else 0),
+                    )
+                    for index in range(shard_count)
+                ]
+            )
+            total = 0
+        Product.objects.filter(pk=product_id).update(
+            stock=total, shard_count=shard_count, updated_at=timezone.now()
+        )
+
+
+def set_stock(product, quantity):
+    """
+    Set a product's total stock, spread over its shards when it has any.
+    """
+    product_id = getattr(product, "pk", product)
+    with transaction.atomic():
+        shard_count = (
+            Product.objects.select_for_update()
+            .values_list("shard_count", flat=True)
+            .get(pk=product_id)
+        )
+        StockShard.objects.filter(product_id=product_id).delete()
+        Product.objects.filter(pk=product_id).update(
+            stock=quantity, updated_at=timezone.now()
+        )
+        if shard_count:
+            shard_stock(product_id, shard_count)
+
+
+def get_hold_expiry():
+    ttl = settings.STORE_APP.get("STOCK_HOLD_TTL", 15 * 60)
+    return timezone.now() + timedelta(seconds=ttl)
+
+
+def hold_stock(order, lines):
+    """
+    Reserve stock for an order awaiting online payment. The reservation is
+    recorded as StockHold rows that expire unless the payment is verified.
+    """
+    quantities = _merge_lines(lines)
+    expires_at = get_hold_expiry()
+    with transaction.atomic():
+        reserve_stock(quantities.items())
+        StockHold.objects.bulk_create(
+            [
+                StockHold(
+                    order=order,
+                    product_id=product_id,
+                    quantity=quantity,
+                    expires_at=expires_at,
+                )
+                for product_id, quantity in quantities.items()
+            ]
+        )
+
+
+def extend_stock_holds(order):
+    return StockHold.objects.filter(order=order).update(expires_at=get_hold_expiry())
+
+
+def commit_stock_holds(order):
+    """
+    Turn an order's holds into a permanent deduction. The stock was already
+    decremented when the hold was placed, so only the hold rows go away.
+    """
+    deleted, _ = StockHold.objects.filter(order=order).delete()
+    return deleted
+
+
+def release_expired_stock_holds(batch_size=500, now=None):
+    """
+    Return the stock held by one batch of orders with expired holds and cancel
+    the orders whose payment never went through. An order's holds are always
+    swept together. Returns the number of orders processed.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        order_ids = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(
+                pk__in=StockHold.objects.filter(expires_at__lte=now).values("order_id")
+            )
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return 0
+
+        holds = list(
+            StockHold.objects.select_for_update()
+            .filter(order_id__in=order_ids)
+            .values("id", "order_id", "product_id", "quantity")
+        )
+        # Orders paid or cancelled meanwhile fail the transition and keep
+        # their stock.
+        _, expired_order_ids, _ = apply_many(order_ids, "expire", now=now)
+        expired_order_ids = set(expired_order_ids)
+        release_stock(
+            (hold["product_id"], hold["quantity"])
+            for hold in holds
+            if hold["order_id"] in expired_order_ids
+        )
+        # Holds left on paid orders are stale: their stock was kept. Cancelled
+        # orders drop their holds before restoring stock, see CancelOrderView.
+        StockHold.objects.filter(pk__in=[hold["id"] for hold in holds]).delete()
+    return len(order_ids)
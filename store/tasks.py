@@ -0,0 +1,34 @@
+from core.tasks import task
+from .models import Order, Product
+from . import services
+
+
+class RefundFailed(Exception):
+    pass
+
+
+@task(max_attempts=3)
+def resync_product(content_type_id, object_id):
+    """Refresh a product's name, slug and image from the object it sells."""
+    product = Product.objects.filter(
+        content_type_id=content_type_id, object_id=object_id
+    ).first()
+    if product:
+        product.save_details()
+
+
+@task(priority=10, max_attempts=8, retry_delay=60)
+def refund_order(order_id):
+    """
+    Refund an order's payment. Queue it in the transaction that cancels the
+    order so the gateway call runs after the commit; retries reuse the
+    payment's idempotency key, so the gateway refunds it at most once.
+    """
+    order = Order.objects.get(pk=order_id)
+    if not order.can_be_refunded():
+        return
+    response = services.refund_payment(order)
+    if not response["success"]:
+        order.mark_refund_failed()
+        raise RefundFailed(response["error"])
+    order.mark_as_refunded(response["refund"]["id"])
@@ -1,3 +1,1519 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from clinic.models import Medicine, Treatment
+from core.models import Task, User
+from core.tasks import run_pending_tasks
+from . import rollups, serializers, services, stock, tasks, transitions
+from .gateway import GatewayUnavailable, PaymentGateway, get_gateway_settings
+from .management.commands.run_fake_gateway import FakeGatewayHandler
+from .models import (
+    Cart,
+    CartItem,
+    DailySales,
+    Order,
+    OrderItem,
+    PaymentEvent,
+    Product,
+    ShippingDetail,
+    StockHold,
+    StockShard,
+)
 
-# Create your tests here.
+
+def setUpModule():
+    # Resolved at startup, possibly against another database.
+    Product._cached_allowed_content_types = None
+
+
+def create_product(name, stock=10, model=Medicine, **fields):
+    content_obj = model.objects.create(name=name)
+    fields.setdefault("unit_price", Decimal("100.00"))
+    return Product.objects.create(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id=content_obj.pk,
+        stock=stock,
+        **fields,
+    )
+
+
+def get_stock(product):
+    return Product.objects.with_stock_totals().get(pk=product.pk).stock_total
+
+
+def create_order(user, product, quantity=1, **fields):
+    order = Order.objects.create(user=user, total_price=Decimal("100.00"), **fields)
+    create_order_item(order, product, quantity)
+    return order
+
+
+def create_order_item(order, product, quantity=1):
+    item = OrderItem(order=order, product=product, quantity=quantity)
+    item.snapshot_product()
+    item.save()
+    return item
+
+
+def create_user(username="buyer", mobile_number="9000000001", **fields):
+    return User.objects.create(
+        username=username,
+        email=f"{username}@example.com",
+        mobile_number=mobile_number,
+        **fields,
+    )
+
+
+class QueryCountMixin:
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+# Database sessions would be deleted on login, which the product deletion
+# guard in store.signals cannot handle on SQLite.
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+class ProductAdminTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(
+            create_user("admin", "9000000009", is_staff=True, is_superuser=True)
+        )
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        create_product("Arnica")
+        create_product("Detox", model=Treatment)
+        expected = self.count_queries("/admin/store/product/")
+
+        for index in range(3):
+            create_product(f"Arnica {index}")
+            create_product(f"Detox {index}", model=Treatment)
+
+        self.assertEqual(self.count_queries("/admin/store/product/"), expected)
+
+    def test_changelist_links_the_linked_object(self):
+        product = create_product("Arnica")
+
+        response = self.client.get("/admin/store/product/")
+
+        self.assertContains(
+            response, f'/admin/clinic/medicine/{product.object_id}/change/">Arnica<'
+        )
+
+
+class ProductListTests(QueryCountMixin, APITestCase):
+    def create_products(self, count):
+        for index in range(count):
+            model = Medicine if index % 2 else Treatment
+            create_product(f"{model.__name__} {Product.objects.count()}", model=model)
+
+    def test_linked_objects_load_in_constant_queries(self):
+        self.create_products(2)
+        queries = self.count_queries("/api/store/products/")
+
+        self.create_products(6)
+
+        self.assertEqual(self.count_queries("/api/store/products/"), queries)
+
+    def test_product_url_points_at_the_linked_object(self):
+        product = create_product("Arnica")
+
+        response = self.client.get(f"/api/store/products/{product.slug}/")
+
+        self.assertEqual(
+            response.data["product_url"],
+            f"http://testserver{product.content_obj.get_absolute_url()}",
+        )
+
+
+class CartItemListTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.cart = Cart.objects.get_or_create(user=self.user)[0]
+        self.client.force_authenticate(self.user)
+
+    def add_items(self, count):
+        for _ in range(count):
+            product = create_product(f"Medicine {Product.objects.count()}")
+            CartItem.objects.create(cart=self.cart, product=product)
+
+    def test_cart_items_load_in_constant_queries(self):
+        url = f"/api/store/carts/{self.cart.pk}/items/"
+        self.add_items(1)
+        queries = self.count_queries(url)
+
+        self.add_items(4)
+
+        self.assertEqual(self.count_queries(url), queries)
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        self.product = create_product("Arnica", stock=5)
+        self.url = f"/api/store/products/{self.product.slug}/"
+
+    def test_responses_are_cached_until_a_product_changes(self):
+        self.client.get(self.url)
+        Product.objects.filter(pk=self.product.pk).update(trending=True)
+
+        self.assertFalse(self.client.get(self.url).data["trending"])
+
+        self.product.refresh_from_db()
+        self.product.save()
+        self.assertTrue(self.client.get(self.url).data["trending"])
+
+    def test_cached_responses_read_stock_live(self):
+        self.client.get("/api/store/products/")
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+
+        product = self.client.get("/api/store/products/").data["results"][0]
+
+        self.assertEqual(product["stock"], 0)
+        self.assertFalse(product["is_available"])
+
+
+class StockTests(TestCase):
+    def setUp(self):
+        self.first = create_product("Arnica", stock=5)
+        self.second = create_product("Belladonna", stock=2)
+
+    def test_reserve_stock_decrements_every_line(self):
+        stock.reserve_stock([(self.first, 2), (self.second, 1), (self.first, 1)])
+
+        self.assertEqual(get_stock(self.first), 2)
+        self.assertEqual(get_stock(self.second), 1)
+
+    def test_reserve_stock_reserves_nothing_when_a_line_is_short(self):
+        with self.assertRaises(stock.InsufficientStockError) as raised:
+            stock.reserve_stock([(self.first, 2), (self.second, 3)])
+
+        self.assertEqual(
+            raised.exception.lines,
+            [
+                {
+                    "product_id": self.second.pk,
+                    "name": self.second.name,
+                    "requested": 3,
+                    "available": 2,
+                }
+            ],
+        )
+        self.assertEqual(get_stock(self.first), 5)
+        self.assertEqual(get_stock(self.second), 2)
+
+    def test_products_without_tracking_are_not_decremented(self):
+        untracked = create_product("Calendula", stock=0, track_stock=False)
+
+        stock.reserve_stock([(untracked, 4)])
+        stock.release_stock([(untracked, 4)])
+
+        self.assertEqual(get_stock(untracked), 0)
+
+    def test_release_stock_restores_every_line(self):
+        stock.reserve_stock([(self.first, 5), (self.second, 2)])
+
+        stock.release_stock([(self.first, 3), (self.second, 2)])
+
+        self.assertEqual(get_stock(self.first), 3)
+        self.assertEqual(get_stock(self.second), 2)
+
+
+class ShardedStockTests(TestCase):
+    def setUp(self):
+        self.product = create_product("Arnica", stock=10)
+        stock.shard_stock(self.product, 4)
+
+    def test_shard_stock_spreads_the_total(self):
+        shards = StockShard.objects.filter(product=self.product).order_by("index")
+
+        self.assertEqual([shard.stock for shard in shards], [3, 3, 2, 2])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 0)
+        self.assertEqual(get_stock(self.product), 10)
+
+    def test_reserve_stock_drains_several_shards(self):
+        stock.reserve_stock([(self.product, 9)])
+
+        self.assertEqual(get_stock(self.product), 1)
+        with self.assertRaises(stock.InsufficientStockError):
+            stock.reserve_stock([(self.product, 2)])
+
+    def test_release_stock_counts_towards_the_total(self):
+        stock.reserve_stock([(self.product, 3)])
+
+        stock.release_stock([(self.product, 3)])
+
+        self.assertEqual(get_stock(self.product), 10)
+
+    def test_set_stock_writes_the_total_across_shards(self):
+        stock.set_stock(self.product, 21)
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.shard_count, 4)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(get_stock(product), 21)
+
+    def test_unsharding_folds_stock_back_into_the_row(self):
+        stock.shard_stock(self.product, 0)
+
+        self.assertFalse(StockShard.objects.filter(product=self.product).exists())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 10)
+
+
+class ProductUpdateTests(APITestCase):
+    def setUp(self):
+        self.product = create_product("Arnica", stock=10)
+        stock.shard_stock(self.product, 4)
+        self.url = f"/api/store/products/{self.product.slug}/"
+        self.client.force_authenticate(create_user(is_staff=True))
+
+    def test_stock_is_written_as_the_total(self):
+        response = self.client.patch(self.url, {"stock": 7})
+
+        self.assertEqual(response.data["stock"], 7)
+        self.assertEqual(get_stock(self.product), 7)
+
+    def test_edits_keep_stock_moved_by_checkouts(self):
+        product = create_product("Belladonna", stock=10)
+        stock.reserve_stock([(product, 3)])
+
+        serializer = serializers.ProductSerializer(
+            product, data={"trending": True}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(get_stock(product), 7)
+
+
+class StockHoldTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica", stock=5)
+        self.order = create_order(self.user, self.product, quantity=2)
+        stock.hold_stock(self.order, [(self.product, 2)])
+        self.later = timezone.now() + timedelta(days=1)
+
+    def test_hold_reserves_stock(self):
+        self.assertEqual(get_stock(self.product), 3)
+        self.assertTrue(StockHold.objects.filter(order=self.order).exists())
+
+    def test_expired_holds_of_unpaid_orders_are_released(self):
+        self.assertEqual(stock.release_expired_stock_holds(now=self.later), 1)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, Order.ORDER_STATUS_CANCELLED)
+        self.assertEqual(get_stock(self.product), 5)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_holds_of_paid_orders_keep_their_stock(self):
+        Order.objects.filter(pk=self.order.pk).update(
+            payment_status=Order.PAYMENT_STATUS_SUCCESSFUL
+        )
+
+        stock.release_expired_stock_holds(now=self.later)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, Order.ORDER_STATUS_PROCESSING)
+        self.assertEqual(get_stock(self.product), 3)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_unexpired_holds_are_kept(self):
+        self.assertEqual(stock.release_expired_stock_holds(), 0)
+        self.assertEqual(get_stock(self.product), 3)
+
+    def test_batches_never_split_an_order(self):
+        products = [self.product] + [
+            create_product(name, stock=5) for name in ["Belladonna", "Calendula"]
+        ]
+        order = create_order(self.user, products[1])
+        stock.hold_stock(order, [(product, 1) for product in products])
+
+        self.assertEqual(stock.release_expired_stock_holds(1, now=self.later), 1)
+        self.assertEqual(stock.release_expired_stock_holds(1, now=self.later), 1)
+        self.assertEqual(stock.release_expired_stock_holds(1, now=self.later), 0)
+
+        self.assertEqual([get_stock(product) for product in products], [5, 5, 5])
+        self.assertEqual(
+            Order.objects.filter(order_status=Order.ORDER_STATUS_CANCELLED).count(), 2
+        )
+
+
+@override_settings(RAZORPAY_API_SECRET="secret", TASKS={"EAGER": False})
+class LatePaymentTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica", stock=5)
+        self.order = create_order(
+            self.user, self.product, quantity=2, razorpay_order_id="order_1"
+        )
+        stock.hold_stock(self.order, [(self.product, 2)])
+        stock.release_expired_stock_holds(now=timezone.now() + timedelta(days=1))
+        self.client.force_authenticate(self.user)
+
+    def verify_payment(self):
+        signature = hmac.new(
+            b"secret", b"order_1|pay_1", digestmod=hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            f"/api/store/orders/{self.order.pk}/verify-payment/",
+            {
+                "order_id": self.order.pk,
+                "razorpay_order_id": "order_1",
+                "razorpay_payment_id": "pay_1",
+                "razorpay_signature": signature,
+            },
+        )
+
+    @mock.patch("store.services.refund_payment")
+    def test_payment_verified_after_expiry_is_refunded(self, refund_payment):
+        refund_payment.return_value = {"success": True, "refund": {"id": "rfnd_1"}}
+
+        with self.assertLogs(level="WARNING"):
+            response = self.verify_payment()
+
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_SUCCESSFUL)
+        refund_payment.assert_not_called()
+
+        run_pending_tasks()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, Order.ORDER_STATUS_CANCELLED)
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_REFUNDED)
+        self.assertEqual(self.order.refund_id, "rfnd_1")
+        self.assertEqual(get_stock(self.product), 5)
+
+    @mock.patch("store.services.refund_payment")
+    def test_failed_late_refund_is_recorded_and_retried(self, refund_payment):
+        refund_payment.return_value = {"success": False, "error": "Gateway down"}
+
+        with self.assertLogs(level="WARNING"):
+            self.verify_payment()
+            run_pending_tasks()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.refund_status, Order.REFUND_STATUS_FAILED)
+        job = Task.objects.get()
+        self.assertEqual(job.status, Task.STATUS_QUEUED)
+        self.assertIn("Gateway down", job.last_error)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.products = [create_product(f"Medicine {index}") for index in range(25)]
+
+    def walk(self, params):
+        response = self.client.get("/api/store/products/", params)
+        pages = [response.data]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            pages.append(response.data)
+        return pages
+
+    def ids(self, page):
+        return [product["id"] for product in page["results"]]
+
+    def test_rows_sharing_a_sort_key_are_paged_once(self):
+        for ordering in ["net_price", "-net_price"]:
+            pages = self.walk({"pagination": "cursor", "ordering": ordering})
+
+            ids = [pk for page in pages for pk in self.ids(page)]
+            self.assertEqual(len(ids), 25)
+            self.assertEqual(set(ids), {product.pk for product in self.products})
+
+    def test_previous_link_returns_the_same_page(self):
+        first, second = self.walk({"pagination": "cursor", "ordering": "net_price"})
+
+        previous = self.client.get(second["previous"]).data
+
+        self.assertEqual(self.ids(previous), self.ids(first))
+
+    def test_search_results_are_not_paged_with_a_cursor(self):
+        response = self.client.get(
+            "/api/store/products/", {"pagination": "cursor", "search": "medicine"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_ordered_search_results_are_paged_with_a_cursor(self):
+        pages = self.walk(
+            {"pagination": "cursor", "search": "medicine", "ordering": "net_price"}
+        )
+
+        self.assertEqual(sum(len(page["results"]) for page in pages), 25)
+
+
+class ProductFacetTests(APITestCase):
+    def setUp(self):
+        create_product("Arnica", unit_price=Decimal("50.00"), trending=True)
+        create_product("Belladonna", unit_price=Decimal("150.00"))
+        create_product("Detox", model=Treatment, unit_price=Decimal("300.00"))
+
+    def get_facets(self, **params):
+        response = self.client.get("/api/store/products/facets/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def counts(self, facets, name, key="value"):
+        return {str(bucket[key]): bucket["count"] for bucket in facets[name]}
+
+    def test_unfiltered_counts(self):
+        facets = self.get_facets()
+
+        self.assertEqual(facets["count"], 3)
+        self.assertEqual(self.counts(facets, "type"), {"medicine": 2, "treatment": 1})
+        self.assertEqual(
+            self.counts(facets, "price", "min"),
+            {"0": 1, "100": 1, "250": 1, "500": 0, "1000": 0},
+        )
+        self.assertEqual(self.counts(facets, "trending"), {"True": 1, "False": 2})
+
+    def test_facets_ignore_their_own_filter(self):
+        facets = self.get_facets(type="medicine")
+
+        self.assertEqual(facets["count"], 2)
+        self.assertEqual(self.counts(facets, "type"), {"medicine": 2, "treatment": 1})
+        self.assertEqual(
+            self.counts(facets, "price", "min"),
+            {"0": 1, "100": 1, "250": 0, "500": 0, "1000": 0},
+        )
+        self.assertEqual(self.counts(facets, "trending"), {"True": 1, "False": 1})
+
+    def test_price_filter_narrows_the_other_facets(self):
+        facets = self.get_facets(min_price=100, trending=False)
+
+        self.assertEqual(facets["count"], 2)
+        self.assertEqual(self.counts(facets, "type"), {"medicine": 1, "treatment": 1})
+        self.assertEqual(
+            self.counts(facets, "price", "min"),
+            {"0": 0, "100": 1, "250": 1, "500": 0, "1000": 0},
+        )
+        self.assertEqual(self.counts(facets, "trending"), {"True": 0, "False": 2})
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get("/api/store/products/facets/", {"min_price": "x"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TotalsTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.cart = Cart.objects.create(user=self.user)
+        self.order = Order.objects.create(user=self.user, delivery_charge=Decimal("60"))
+        for name, price, discount, quantity in [
+            ("Arnica", "99.99", 15, 3),
+            ("Belladonna", "45.50", 0, 1),
+            ("Calendula", "10.05", 33, 7),
+        ]:
+            product = create_product(
+                name, unit_price=Decimal(price), discount=Decimal(discount)
+            )
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+            create_order_item(self.order, product, quantity)
+        self.expected = sum(
+            item.product.get_net_price() * item.quantity
+            for item in CartItem.objects.select_related("product")
+        )
+
+    def test_cart_total_matches_python_prices(self):
+        annotated = Cart.objects.with_items_total().get(pk=self.cart.pk)
+
+        self.assertEqual(annotated.total_price, self.expected)
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).total_price, self.expected)
+
+    def test_line_prices_match_python_prices(self):
+        for item in CartItem.objects.with_line_price().select_related("product"):
+            self.assertEqual(item.price, item.product.get_net_price() * item.quantity)
+
+    def test_order_total_adds_the_delivery_charge(self):
+        annotated = Order.objects.with_items_total().get(pk=self.order.pk)
+
+        self.assertEqual(annotated.get_total_price(), self.expected + 60)
+        self.assertEqual(
+            Order.objects.get(pk=self.order.pk).get_total_price(), self.expected + 60
+        )
+
+    def test_cart_endpoint_reports_the_total(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(f"/api/store/carts/{self.cart.pk}/")
+
+        self.assertEqual(Decimal(str(response.data["total_price"])), self.expected)
+
+
+class BulkCartItemTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.cart = Cart.objects.create(user=self.user)
+        self.url = f"/api/store/carts/{self.cart.pk}/items/bulk/"
+        self.first = create_product("Arnica", stock=5)
+        self.second = create_product("Belladonna", stock=5)
+        CartItem.objects.create(cart=self.cart, product=self.first, quantity=2)
+        self.client.force_authenticate(self.user)
+
+    def quantities(self):
+        return dict(
+            CartItem.objects.filter(cart=self.cart).values_list(
+                "product_id", "quantity"
+            )
+        )
+
+    def post(self, items, mode="add"):
+        return self.client.post(self.url, {"mode": mode, "items": items}, format="json")
+
+    def test_add_mode_adds_to_existing_quantities(self):
+        response = self.post(
+            [
+                {"product_id": self.first.pk, "quantity": 1},
+                {"product_id": self.second.pk, "quantity": 2},
+                {"product_id": self.second.pk, "quantity": 1},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.first.pk: 3, self.second.pk: 3})
+
+    def test_set_mode_replaces_quantities_and_zero_removes(self):
+        self.post(
+            [
+                {"product_id": self.first.pk, "quantity": 0},
+                {"product_id": self.second.pk, "quantity": 4},
+            ],
+            mode="set",
+        )
+
+        self.assertEqual(self.quantities(), {self.second.pk: 4})
+
+    def test_stock_covers_what_is_already_in_the_cart(self):
+        response = self.post([{"product_id": self.first.pk, "quantity": 4}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["items"][0]["requested"], "6")
+        self.assertEqual(self.quantities(), {self.first.pk: 2})
+
+    def test_unknown_products_write_nothing(self):
+        response = self.post(
+            [
+                {"product_id": self.second.pk, "quantity": 1},
+                {"product_id": 0, "quantity": 1},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.first.pk: 2})
+
+    def test_other_users_carts_are_not_found(self):
+        self.client.force_authenticate(
+            create_user("intruder", mobile_number="9000000002")
+        )
+
+        response = self.post([{"product_id": self.second.pk, "quantity": 1}])
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(
+            self.client.get(f"/api/store/carts/{self.cart.pk}/items/").status_code,
+            404,
+        )
+        self.assertEqual(self.quantities(), {self.first.pk: 2})
+
+
+@mock.patch("store.services.create_razorpay_order")
+class TwoPhaseCheckoutTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica", stock=5)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.force_authenticate(self.user)
+        self.checkout = {"cart_id": str(cart.pk), "delivery_method": "pickup"}
+
+    def place_order(self):
+        response = self.client.post("/api/store/orders/", self.checkout)
+        self.assertEqual(response.status_code, 200)
+        return Order.objects.get(pk=response.data["id"])
+
+    def test_gateway_order_is_attached_after_commit(self, create_razorpay_order):
+        create_razorpay_order.return_value = {"id": "order_1"}
+
+        order = self.place_order()
+
+        self.assertEqual(order.payment_status, Order.PAYMENT_STATUS_PENDING)
+        self.assertEqual(order.razorpay_order_id, "order_1")
+
+    def test_gateway_failure_keeps_the_committed_order(self, create_razorpay_order):
+        create_razorpay_order.side_effect = ConnectionError("gateway down")
+
+        with self.assertLogs(level="WARNING"):
+            order = self.place_order()
+
+        self.assertEqual(order.payment_status, Order.PAYMENT_STATUS_AWAITING_GATEWAY)
+        self.assertIsNone(order.razorpay_order_id)
+        self.assertEqual(get_stock(self.product), 3)
+        self.assertTrue(StockHold.objects.filter(order=order).exists())
+        self.assertFalse(Cart.objects.filter(pk=self.checkout["cart_id"]).exists())
+
+    def test_recovery_attaches_the_gateway_order(self, create_razorpay_order):
+        create_razorpay_order.side_effect = ConnectionError("gateway down")
+        with self.assertLogs(level="WARNING"):
+            order = self.place_order()
+        create_razorpay_order.side_effect = None
+        create_razorpay_order.return_value = {"id": "order_2"}
+
+        self.assertEqual(services.recover_awaiting_gateway_orders(grace=0), (1, 0))
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, Order.PAYMENT_STATUS_PENDING)
+        self.assertEqual(order.razorpay_order_id, "order_2")
+        self.assertEqual(services.recover_awaiting_gateway_orders(grace=0), (0, 0))
+
+    def test_expired_orders_awaiting_gateway_are_cancelled(self, create_razorpay_order):
+        create_razorpay_order.side_effect = ConnectionError("gateway down")
+        with self.assertLogs(level="WARNING"):
+            order = self.place_order()
+
+        stock.release_expired_stock_holds(now=timezone.now() + timedelta(days=1))
+
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, Order.ORDER_STATUS_CANCELLED)
+        self.assertEqual(get_stock(self.product), 5)
+
+
+class FlakyRefundHandler(FakeGatewayHandler):
+    # Processes the first refund but answers it with a 500.
+    lose_response = False
+
+    def refund(self, body, id):
+        self.lose_response = not self.server.failed
+        self.server.failed = True
+        return super().refund(body, id)
+
+    def respond(self, status, payload):
+        if self.lose_response:
+            status, payload = 500, {"error": {"code": "SERVER_ERROR"}}
+        super().respond(status, payload)
+
+
+class PaymentGatewayTests(TestCase):
+    def start_fake_gateway(self, handler=FakeGatewayHandler, **options):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.latency = 0
+        server.failure_rate = options.pop("failure_rate", 0)
+        server.refunds = {}
+        server.failed = False
+        server.verbose = False
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+        gateway = PaymentGateway(
+            "key",
+            "secret",
+            {
+                **get_gateway_settings(),
+                "BASE_URL": f"http://{host}:{port}",
+                "RETRIES": 0,
+                "FAILURE_THRESHOLD": 2,
+                **options,
+            },
+        )
+        return gateway, server
+
+    def test_orders_and_refunds(self):
+        gateway, _ = self.start_fake_gateway()
+
+        order = gateway.create_order({"amount": 10000, "currency": "INR"})
+        refund = gateway.refund_payment("pay_1", {"amount": 10000})
+
+        self.assertEqual(order["amount"], 10000)
+        self.assertEqual(refund["payment_id"], "pay_1")
+
+    def test_breaker_opens_after_repeated_failures(self):
+        gateway, _ = self.start_fake_gateway(failure_rate=1)
+
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                gateway.create_order({"amount": 10000})
+
+        with self.assertRaises(GatewayUnavailable):
+            gateway.create_order({"amount": 10000})
+
+    def test_retried_refund_is_processed_once(self):
+        gateway, server = self.start_fake_gateway(
+            FlakyRefundHandler, RETRIES=2, BACKOFF_FACTOR=0, BACKOFF_JITTER=0
+        )
+
+        refund = gateway.refund_payment(
+            "pay_1", {"amount": 10000}, idempotency_key="refund-pay_1"
+        )
+
+        self.assertTrue(server.failed)
+        self.assertEqual(list(server.refunds.values()), [refund])
+
+
+@override_settings(TASKS={"EAGER": False})
+class ProductResyncTests(TestCase):
+    def test_renamed_object_is_resynced_in_the_background(self):
+        product = create_product("Arnica", stock=5)
+        medicine = product.content_obj
+
+        medicine.name = "Arnica Montana"
+        medicine.save()
+
+        self.assertEqual(Product.objects.get(pk=product.pk).name, "Arnica")
+        self.assertEqual(Task.objects.get().name, tasks.resync_product.name)
+        run_pending_tasks()
+        self.assertEqual(Product.objects.get(pk=product.pk).name, "Arnica Montana")
+
+    def test_resync_keeps_stock_moved_meanwhile(self):
+        product = create_product("Arnica", stock=5)
+        update_from_content_obj = Product.update_from_content_obj
+
+        def checkout_meanwhile(product):
+            stock.set_stock(product.pk, 2)
+            update_from_content_obj(product)
+
+        with mock.patch.object(Product, "update_from_content_obj", checkout_meanwhile):
+            tasks.resync_product(product.content_type_id, product.object_id)
+
+        self.assertEqual(get_stock(product), 2)
+
+
+class SparseFieldsTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.product = create_product("Arnica", stock=5)
+        shipping_details = ShippingDetail.objects.create(
+            full_name="Buyer",
+            phone="9000000001",
+            address_line="1 Main Road",
+            city="Kochi",
+            state="Kerala",
+            pincode="682001",
+        )
+        self.order = create_order(
+            self.user, self.product, quantity=2, shipping_details=shipping_details
+        )
+
+    def test_products_are_limited_to_the_requested_fields(self):
+        url = "/api/store/products/?fields=id,name,stock"
+        queries = self.count_queries("/api/store/products/")
+
+        response = self.client.get(url)
+
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.product.pk, "name": "Arnica", "stock": 5}],
+        )
+        self.assertLess(self.count_queries(url), queries)
+
+    def test_dotted_paths_reach_into_nested_objects(self):
+        response = self.client.get(
+            "/api/store/orders/?fields=id,order_items.name,order_items.quantity"
+        )
+
+        self.assertEqual(
+            response.data["results"],
+            [
+                {
+                    "id": self.order.pk,
+                    "order_items": [{"name": "Arnica", "quantity": 2}],
+                }
+            ],
+        )
+
+    def test_unexpanded_relations_are_rendered_as_ids(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product)
+        url = f"/api/store/carts/{cart.pk}/items/?fields=product,quantity"
+        queries = self.count_queries(f"{url}&expand=product")
+
+        response = self.client.get(f"{url}&expand=")
+
+        self.assertEqual(
+            response.data["results"], [{"product": self.product.pk, "quantity": 1}]
+        )
+        self.assertLess(self.count_queries(f"{url}&expand="), queries)
+
+    def test_expanded_relations_are_embedded(self):
+        response = self.client.get(
+            "/api/store/orders/?expand=shipping_details&fields=shipping_details.city"
+        )
+
+        self.assertEqual(
+            response.data["results"], [{"shipping_details": {"city": "Kochi"}}]
+        )
+
+    def test_writes_return_the_full_representation(self):
+        self.user.is_staff = True
+        self.client.force_authenticate(self.user)
+
+        response = self.client.patch(
+            f"/api/store/products/{self.product.slug}/?fields=id",
+            {"stock": 4},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("name", response.data)
+        self.assertEqual(response.data["stock"], 4)
+
+
+@mock.patch("store.services.create_razorpay_order", return_value={"id": "order_1"})
+class OrderSnapshotTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product(
+            "Arnica", unit_price=Decimal("200.00"), discount=Decimal("10.00")
+        )
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.force_authenticate(self.user)
+        self.checkout = {"cart_id": str(cart.pk), "delivery_method": "pickup"}
+
+    def test_checkout_copies_the_product_onto_the_line(self, create_razorpay_order):
+        response = self.client.post("/api/store/orders/", self.checkout)
+        self.product.unit_price = Decimal("500.00")
+        self.product.save()
+
+        item = OrderItem.objects.get(order_id=response.data["id"])
+        self.assertEqual(item.name, "Arnica")
+        self.assertEqual(item.slug, self.product.slug)
+        self.assertEqual(item.unit_price, Decimal("200.00"))
+        self.assertEqual(item.net_price, Decimal("180.00"))
+        self.assertEqual(item.price, Decimal("360.00"))
+        order = Order.objects.with_items_total().get(pk=item.order_id)
+        self.assertEqual(order.get_total_price(), Decimal("360.00"))
+
+    def test_order_history_does_not_read_products(self, create_razorpay_order):
+        self.client.post("/api/store/orders/", self.checkout)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/store/orders/")
+
+        self.assertEqual(
+            response.data["results"][0]["order_items"][0]["name"], "Arnica"
+        )
+        self.assertFalse(
+            [query for query in queries if "store_product" in query["sql"]]
+        )
+
+    def test_backfill_copies_current_product_details(self, create_razorpay_order):
+        order = Order.objects.create(user=self.user)
+        item = OrderItem.objects.create(order=order, product=self.product, quantity=3)
+
+        call_command("backfill_order_items", stdout=StringIO())
+
+        item.refresh_from_db()
+        self.assertEqual(item.name, "Arnica")
+        self.assertEqual(item.net_price, Decimal("180.00"))
+        self.assertEqual(item.price, Decimal("540.00"))
+
+
+class RollupTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica")
+        self.today = timezone.localdate()
+
+    def test_recorded_rollups_match_a_rebuild(self):
+        for quantity in [1, 3]:
+            order = create_order(
+                self.user,
+                self.product,
+                quantity=quantity,
+                payment_method=Order.PAYMENT_METHOD_COD,
+                order_status=Order.ORDER_STATUS_DISPATCHED,
+            )
+            order.transition("complete")
+            with self.assertRaises(transitions.InvalidTransition):
+                order.transition("complete")
+        create_order(self.user, self.product).transition("cancel")
+        recorded = rollups.sales_report(self.today, self.today)
+
+        rollups.rebuild_rollups(self.today, self.today)
+
+        self.assertEqual(rollups.sales_report(self.today, self.today), recorded)
+        self.assertEqual(recorded["totals"]["orders"], 2)
+        self.assertEqual(recorded["totals"]["units"], 4)
+        self.assertEqual(recorded["totals"]["revenue"], Decimal("200.00"))
+        self.assertEqual(recorded["totals"]["cancelled_orders"], 1)
+        self.assertEqual(DailySales.objects.count(), 1)
+
+    def test_expired_holds_record_cancellations(self):
+        order = create_order(self.user, self.product, quantity=2)
+        stock.hold_stock(order, [(self.product.pk, 2)])
+
+        now = timezone.now() + timedelta(days=1)
+
+        stock.release_expired_stock_holds(now=now)
+
+        day = timezone.localdate(now)
+        report = rollups.sales_report(day, day, group_by="product")
+        self.assertEqual(report["results"][0]["product_id"], self.product.pk)
+        self.assertEqual(report["results"][0]["cancelled_units"], 2)
+
+    def test_report_is_for_staff_only(self):
+        create_order(
+            self.user,
+            self.product,
+            payment_status=Order.PAYMENT_STATUS_SUCCESSFUL,
+            order_status=Order.ORDER_STATUS_SHIPPED,
+        ).transition("complete")
+        url = f"/api/store/reports/sales/?start={self.today}&end={self.today}"
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.is_staff = True
+        response = self.client.get(f"{url}&group_by=method")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["results"][0]["payment_method"],
+            Order.PAYMENT_METHOD_RAZORPAY,
+        )
+        self.assertEqual(response.data["totals"]["orders"], 1)
+
+
+class BulkOrderTransitionTests(APITestCase):
+    def setUp(self):
+        self.user = create_user(is_staff=True)
+        self.product = create_product("Arnica")
+        self.client.force_authenticate(self.user)
+
+    def transition(self, transition, order_ids):
+        return self.client.post(
+            "/api/store/orders/transitions/",
+            {"transition": transition, "order_ids": order_ids},
+            format="json",
+        )
+
+    def test_each_order_gets_a_result(self):
+        paid = create_order(
+            self.user, self.product, payment_status=Order.PAYMENT_STATUS_SUCCESSFUL
+        )
+        cod = create_order(
+            self.user, self.product, payment_method=Order.PAYMENT_METHOD_COD
+        )
+        unpaid = create_order(self.user, self.product)
+        shipped = create_order(
+            self.user,
+            self.product,
+            payment_method=Order.PAYMENT_METHOD_COD,
+            order_status=Order.ORDER_STATUS_SHIPPED,
+        )
+
+        response = self.transition(
+            "dispatch", [paid.pk, cod.pk, unpaid.pk, shipped.pk, 0, paid.pk]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual(
+            [result["id"] for result in results],
+            [paid.pk, cod.pk, unpaid.pk, shipped.pk, 0],
+        )
+        self.assertEqual(results[0]["order_status"], Order.ORDER_STATUS_DISPATCHED)
+        self.assertEqual(results[1]["order_status"], Order.ORDER_STATUS_DISPATCHED)
+        self.assertEqual(results[2]["error"], "Payment is pending")
+        self.assertIn("Cannot dispatch", results[3]["error"])
+        self.assertEqual(results[4]["error"], "Order not found")
+        self.assertEqual(
+            set(
+                Order.objects.filter(
+                    order_status=Order.ORDER_STATUS_DISPATCHED
+                ).values_list("pk", flat=True)
+            ),
+            {paid.pk, cod.pk},
+        )
+
+    def test_completed_orders_are_added_to_the_rollups(self):
+        orders = [
+            create_order(
+                self.user,
+                self.product,
+                payment_method=Order.PAYMENT_METHOD_COD,
+                order_status=Order.ORDER_STATUS_OUT_FOR_DELIVERY,
+            )
+            for _ in range(2)
+        ]
+
+        response = self.transition("complete", [order.pk for order in orders])
+
+        delivered_at = {result["delivered_at"] for result in response.data["results"]}
+        self.assertEqual(len(delivered_at), 1)
+        today = timezone.localdate()
+        self.assertEqual(rollups.sales_report(today, today)["totals"]["orders"], 2)
+
+    def test_customers_cannot_transition_orders(self):
+        order = create_order(
+            self.user, self.product, payment_method=Order.PAYMENT_METHOD_COD
+        )
+        self.user.is_staff = False
+
+        response = self.transition("dispatch", [order.pk])
+
+        self.assertEqual(response.status_code, 403)
+
+
+class TransitionTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica")
+
+    def create_order(self, **fields):
+        fields.setdefault("payment_status", Order.PAYMENT_STATUS_SUCCESSFUL)
+        return create_order(self.user, self.product, **fields)
+
+    def test_stale_version_raises_conflict(self):
+        order = self.create_order()
+        Order.objects.filter(pk=order.pk).update(version=5)
+
+        with self.assertRaises(transitions.OrderConflict):
+            order.transition("dispatch")
+
+    def test_unpaid_online_orders_cannot_be_dispatched(self):
+        order = self.create_order(payment_status=Order.PAYMENT_STATUS_PENDING)
+
+        with self.assertRaises(transitions.InvalidTransition):
+            order.transition("dispatch")
+
+    def test_bulk_complete_skips_processing_orders(self):
+        processing = self.create_order()
+        shipped = self.create_order(order_status=Order.ORDER_STATUS_SHIPPED)
+
+        results = services.transition_orders([processing.pk, shipped.pk], "complete")
+
+        self.assertIn("error", results[0])
+        self.assertEqual(results[1]["order_status"], Order.ORDER_STATUS_COMPLETED)
+        processing.refresh_from_db()
+        shipped.refresh_from_db()
+        self.assertEqual(processing.order_status, Order.ORDER_STATUS_PROCESSING)
+        self.assertIsNotNone(shipped.delivered_at)
+
+    def test_bulk_transition_reports_orders_changed_meanwhile(self):
+        first = self.create_order(order_status=Order.ORDER_STATUS_DISPATCHED)
+        second = self.create_order(order_status=Order.ORDER_STATUS_DISPATCHED)
+        compare_and_swap = transitions.compare_and_swap
+
+        def racing(states, changes):
+            # Another request changes the second order after it was read.
+            if any(state["pk"] == second.pk for state in states):
+                Order.objects.filter(pk=second.pk).update(version=F("version") + 1)
+            return compare_and_swap(states, changes)
+
+        with mock.patch.object(transitions, "compare_and_swap", racing):
+            errors, applied, _ = transitions.apply_many([first.pk, second.pk], "ship")
+
+        self.assertEqual(errors, {second.pk: transitions.OrderConflict.default_detail})
+        self.assertEqual(applied, [first.pk])
+        second.refresh_from_db()
+        self.assertEqual(second.order_status, Order.ORDER_STATUS_DISPATCHED)
+
+
+class PaymentTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica", stock=5)
+        self.order = create_order(
+            self.user, self.product, quantity=2, razorpay_order_id="order_1"
+        )
+        stock.hold_stock(self.order, [(self.product, 2)])
+
+    def test_capture_settles_the_order(self):
+        self.assertTrue(services.capture_payment(self.order, "pay_1"))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_SUCCESSFUL)
+        self.assertEqual(self.order.razorpay_payment_id, "pay_1")
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(get_stock(self.product), 3)
+
+    def test_capture_after_a_failed_attempt_settles_the_order(self):
+        self.order.transition("fail_payment")
+
+        self.assertTrue(services.capture_payment(self.order, "pay_1"))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_SUCCESSFUL)
+
+    def test_repeated_capture_is_a_no_op(self):
+        services.capture_payment(self.order, "pay_1")
+
+        self.assertFalse(services.capture_payment(self.order, "pay_1"))
+
+    def test_digital_orders_complete_once_paid(self):
+        Product.objects.filter(pk=self.product.pk).update(is_digital=True)
+
+        services.capture_payment(self.order, "pay_1")
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, Order.ORDER_STATUS_COMPLETED)
+
+    @override_settings(RAZORPAY_API_SECRET="secret")
+    def test_invalid_signature_fails_the_payment(self):
+        data = {
+            "razorpay_order_id": "order_1",
+            "razorpay_payment_id": "pay_1",
+            "razorpay_signature": "forged",
+        }
+
+        self.assertFalse(services.verify_razorpay_signature(data, self.order))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_UNSUCCESSFUL)
+
+
+@override_settings(TASKS={"EAGER": False})
+@mock.patch("store.services.refund_payment")
+class CancelOrderTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica", stock=5)
+        self.client.force_authenticate(self.user)
+
+    def cancel(self, order):
+        return self.client.post(f"/api/store/orders/{order.pk}/cancel/")
+
+    def test_paid_orders_are_refunded_once_cancelled(self, refund_payment):
+        refund_payment.return_value = {"success": True, "refund": {"id": "rfnd_1"}}
+        order = create_order(
+            self.user,
+            self.product,
+            quantity=2,
+            payment_status=Order.PAYMENT_STATUS_SUCCESSFUL,
+            razorpay_payment_id="pay_1",
+        )
+
+        response = self.cancel(order)
+
+        self.assertEqual(response.status_code, 200)
+        refund_payment.assert_not_called()
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, Order.ORDER_STATUS_CANCELLED)
+        self.assertEqual(get_stock(self.product), 7)
+
+        run_pending_tasks()
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, Order.PAYMENT_STATUS_REFUNDED)
+        self.assertEqual(order.refund_id, "rfnd_1")
+
+    def test_failed_refunds_are_retried(self, refund_payment):
+        refund_payment.return_value = {"success": False, "error": "Gateway down"}
+        order = create_order(
+            self.user, self.product, payment_status=Order.PAYMENT_STATUS_SUCCESSFUL
+        )
+
+        self.assertEqual(self.cancel(order).status_code, 200)
+        with self.assertLogs(level="WARNING"):
+            run_pending_tasks()
+
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, Order.ORDER_STATUS_CANCELLED)
+        self.assertEqual(order.refund_status, Order.REFUND_STATUS_FAILED)
+        self.assertEqual(Task.objects.get().status, Task.STATUS_QUEUED)
+
+    def test_unpaid_orders_are_cancelled_without_a_refund(self, refund_payment):
+        order = create_order(self.user, self.product)
+
+        self.assertEqual(self.cancel(order).status_code, 200)
+
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, Order.ORDER_STATUS_CANCELLED)
+        self.assertEqual(order.payment_status, Order.PAYMENT_STATUS_UNSUCCESSFUL)
+        self.assertFalse(Task.objects.exists())
+
+    def test_closed_orders_cannot_be_cancelled(self, refund_payment):
+        order = create_order(
+            self.user, self.product, order_status=Order.ORDER_STATUS_DISPATCHED
+        )
+
+        response = self.cancel(order)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Order can not be cancelled now"})
+        with self.assertRaises(ValidationError):
+            order.cancel()
+
+
+class OrderUpdateTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(create_user(is_staff=True))
+        self.order = create_order(
+            create_user("buyer2", "9000000002"),
+            create_product("Arnica"),
+            payment_method=Order.PAYMENT_METHOD_COD,
+        )
+
+    def patch(self, data):
+        return self.client.patch(
+            f"/api/store/orders/{self.order.pk}/", data, format="json"
+        )
+
+    def test_staff_move_orders_along_transitions(self):
+        response = self.patch({"transition": "dispatch", "version": 0})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["order_status"], Order.ORDER_STATUS_DISPATCHED)
+        self.assertEqual(response.data["version"], 1)
+
+    def test_statuses_cannot_be_written_directly(self):
+        response = self.patch({"order_status": Order.ORDER_STATUS_COMPLETED})
+
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, Order.ORDER_STATUS_PROCESSING)
+
+    def test_transitions_that_do_not_apply_are_rejected(self):
+        self.assertEqual(self.patch({"transition": "ship"}).status_code, 400)
+
+    def test_stale_version_is_a_conflict(self):
+        self.order.transition("collect_cash")
+
+        response = self.patch({"transition": "dispatch", "version": 0})
+
+        self.assertEqual(response.status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, Order.ORDER_STATUS_PROCESSING)
+
+
+# Database sessions would be deleted on login, which the product deletion
+# guard in store.signals cannot handle on SQLite.
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+class OrderAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            create_user("admin", "9000000009", is_staff=True, is_superuser=True)
+        )
+        self.order = Order.objects.create(
+            user=create_user(), total_price=Decimal("100.00")
+        )
+
+    def edit(self, version, **fields):
+        data = {
+            "user": self.order.user_id,
+            "total_price": "100.00",
+            "delivery_charge": "0.00",
+            "delivery_method": Order.DELIVERY_METHOD_PICKUP,
+            "shipping_details": "",
+            "version": version,
+            "order_items-TOTAL_FORMS": 0,
+            "order_items-INITIAL_FORMS": 0,
+            **fields,
+        }
+        return self.client.post(
+            f"/admin/store/order/{self.order.pk}/change/", data, follow=True
+        )
+
+    def test_edits_save_the_changed_columns(self):
+        self.edit(self.order.version)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.delivery_method, Order.DELIVERY_METHOD_PICKUP)
+        self.assertEqual(self.order.version, 1)
+
+    def test_edits_of_a_changed_order_are_rejected(self):
+        version = self.order.version
+        self.order.transition("cancel")
+
+        response = self.edit(version)
+
+        self.assertContains(response, "changed by another request")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, Order.ORDER_STATUS_CANCELLED)
+        self.assertEqual(self.order.delivery_method, Order.DELIVERY_METHOD_HOME)
+
+
+@override_settings(TASKS={"EAGER": False})
+class PaymentEventTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.product = create_product("Arnica", stock=5)
+        self.order = create_order(
+            self.user, self.product, quantity=2, razorpay_order_id="order_1"
+        )
+        stock.hold_stock(self.order, [(self.product, 2)])
+        patcher = mock.patch("store.services.get_gateway")
+        self.gateway = patcher.start().return_value
+        self.gateway.refund_payment.return_value = {"id": "rfnd_1"}
+        self.addCleanup(patcher.stop)
+
+    def create_event(self, event, payment_id="pay_1", order_id="order_1"):
+        if event.startswith("refund."):
+            entity = {"refund": {"entity": {"id": "rfnd_1", "payment_id": payment_id}}}
+        else:
+            entity = {"payment": {"entity": {"id": payment_id, "order_id": order_id}}}
+        return PaymentEvent.objects.create(
+            event_id=f"evt_{PaymentEvent.objects.count()}",
+            event=event,
+            payload={"event": event, "payload": entity},
+        )
+
+    def get_statuses(self):
+        return list(
+            PaymentEvent.objects.order_by("pk").values_list("status", flat=True)
+        )
+
+    def expire_order(self):
+        stock.release_expired_stock_holds(now=timezone.now() + timedelta(days=1))
+
+    def test_capture_after_a_failed_payment_is_applied(self):
+        self.create_event("payment.failed")
+        self.create_event("payment.captured")
+
+        self.assertEqual(services.process_payment_events(), 2)
+
+        self.assertEqual(self.get_statuses(), ["D", "D"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_SUCCESSFUL)
+        self.assertEqual(get_stock(self.product), 3)
+
+    def test_redelivered_capture_is_ignored(self):
+        self.create_event("payment.captured")
+        self.create_event("order.paid")
+
+        services.process_payment_events()
+
+        self.assertEqual(self.get_statuses(), ["D", "I"])
+
+    def test_a_second_payment_for_a_paid_order_is_flagged(self):
+        self.create_event("payment.captured")
+        self.create_event("payment.captured", payment_id="pay_2")
+
+        with self.assertLogs(level="ERROR"):
+            services.process_payment_events()
+
+        self.assertEqual(self.get_statuses(), ["D", "F"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.razorpay_payment_id, "pay_1")
+
+    def test_capture_for_an_unknown_order_is_flagged(self):
+        self.create_event("payment.captured", order_id="order_unknown")
+
+        with self.assertLogs(level="ERROR"):
+            services.process_payment_events()
+
+        self.assertEqual(self.get_statuses(), ["F"])
+
+    def test_capture_after_expiry_is_refunded_after_the_batch(self):
+        self.expire_order()
+        self.create_event("payment.captured")
+
+        with self.assertLogs(level="WARNING"):
+            services.process_payment_events()
+
+        self.assertEqual(self.get_statuses(), ["D"])
+        self.gateway.refund_payment.assert_not_called()
+
+        run_pending_tasks()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_REFUNDED)
+        self.gateway.refund_payment.assert_called_once_with(
+            "pay_1", {"amount": 10000}, idempotency_key="refund-pay_1"
+        )
+
+    def test_failed_refunds_of_late_captures_are_retried(self):
+        self.gateway.refund_payment.side_effect = Exception("Gateway down")
+        self.expire_order()
+        self.create_event("payment.captured")
+
+        with self.assertLogs(level="WARNING"):
+            services.process_payment_events()
+            run_pending_tasks()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_SUCCESSFUL)
+        self.assertEqual(self.order.refund_status, Order.REFUND_STATUS_FAILED)
+        self.assertEqual(Task.objects.get().status, Task.STATUS_QUEUED)
+
+    def test_refund_event_settles_a_queued_refund(self):
+        self.expire_order()
+        self.create_event("payment.captured")
+        self.create_event("refund.processed")
+
+        with self.assertLogs(level="WARNING"):
+            services.process_payment_events()
+        run_pending_tasks()
+
+        self.assertEqual(self.get_statuses(), ["D", "D"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_REFUNDED)
+        self.gateway.refund_payment.assert_not_called()
+
+    def test_events_are_committed_one_by_one(self):
+        create_order(self.user, self.product, razorpay_order_id="order_2")
+        self.create_event("payment.captured")
+        self.create_event("payment.captured", payment_id="pay_2", order_id="order_2")
+        capture_payment = services.capture_payment
+
+        def failing(order, payment_id, **fields):
+            if payment_id == "pay_2":
+                raise RuntimeError("Worker died")
+            return capture_payment(order, payment_id, **fields)
+
+        with mock.patch.object(services, "capture_payment", failing):
+            with self.assertRaises(RuntimeError):
+                services.process_payment_events()
+
+        self.assertEqual(self.get_statuses(), ["D", "P"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_STATUS_SUCCESSFUL)
+
+    def test_events_losing_a_race_stay_pending(self):
+        self.create_event("payment.captured")
+
+        with mock.patch.object(
+            services, "capture_payment", side_effect=transitions.OrderConflict
+        ):
+            services.process_payment_events()
+
+        self.assertEqual(self.get_statuses(), ["P"])
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET="whsec")
+class RazorpayWebhookTests(APITestCase):
+    url = "/api/store/payments/razorpay/webhook/"
+
+    def post(self, payload, event_id="evt_1", secret="whsec"):
+        body = json.dumps(payload).encode("utf-8")
+        signature = hmac.new(secret.encode("utf-8"), body, hashlib.sha256)
+        return self.client.generic(
+            "POST",
+            self.url,
+            body,
+            content_type="application/json",
+            HTTP_X_RAZORPAY_SIGNATURE=signature.hexdigest(),
+            HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def test_events_are_stored_once(self):
+        payload = {"event": "payment.captured", "payload": {}}
+
+        self.assertEqual(self.post(payload).status_code, 200)
+        self.assertEqual(self.post(payload).status_code, 200)
+
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+    def test_unsigned_events_are_rejected(self):
+        response = self.post({"event": "payment.captured"}, secret="forged")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
@@ -0,0 +1,286 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import Order
+from .rollups import CANCELLED, COMPLETED, REFUNDED, record_orders
+
+P = Order.ORDER_STATUS_PROCESSING
+D = Order.ORDER_STATUS_DISPATCHED
+S = Order.ORDER_STATUS_SHIPPED
+O = Order.ORDER_STATUS_OUT_FOR_DELIVERY
+C = Order.ORDER_STATUS_COMPLETED
+X = Order.ORDER_STATUS_CANCELLED
+
+# Columns transitions are checked against.
+STATE_FIELDS = [
+    "order_status",
+    "payment_status",
+    "payment_method",
+    "refund_status",
+    "version",
+]
+
+
+class InvalidTransition(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "The order cannot make this transition."
+    default_code = "invalid_transition"
+
+
+class OrderConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The order was changed by another request, reload it."
+    default_code = "conflict"
+
+
+class Transition:
+    """
+    One edge of the order state machine: the values ``sources`` allows for
+    each state column, the columns it sets, the timestamp it stamps and the
+    sales event it records. ``paid`` also requires online orders to be paid.
+    """
+
+    def __init__(self, sources, changes, timestamp=None, event=None, paid=False):
+        self.sources = sources
+        self.changes = changes
+        self.timestamp = timestamp
+        self.event = event
+        self.paid = paid
+
+    def check(self, name, state):
+        """Error message when an order in ``state`` cannot take this edge."""
+        for field, allowed in self.sources.items():
+            if state[field] not in allowed:
+                return f"Cannot {name} an order with {field} '{state[field]}'"
+        if (
+            self.paid
+            and state["payment_method"] == Order.PAYMENT_METHOD_RAZORPAY
+            and state["payment_status"] != Order.PAYMENT_STATUS_SUCCESSFUL
+        ):
+            return "Payment is pending"
+        return None
+
+    def get_changes(self, now, fields):
+        changes = {**self.changes, **fields}
+        if self.timestamp:
+            changes[self.timestamp] = now
+        return changes
+
+
+TRANSITIONS = {
+    "attach_gateway": Transition(
+        {"payment_status": [Order.PAYMENT_STATUS_AWAITING_GATEWAY]},
+        {"payment_status": Order.PAYMENT_STATUS_PENDING},
+    ),
+    "retry_payment": Transition(
+        {
+            "order_status": [P],
+            "payment_status": [
+                Order.PAYMENT_STATUS_AWAITING_GATEWAY,
+                Order.PAYMENT_STATUS_PENDING,
+            ],
+        },
+        {"payment_status": Order.PAYMENT_STATUS_PENDING},
+    ),
+    # A failed attempt may be followed by a successful retry on the same
+    # gateway order.
+    "pay": Transition(
+        {
+            "order_status": [P],
+            "payment_status": [
+                Order.PAYMENT_STATUS_PENDING,
+                Order.PAYMENT_STATUS_UNSUCCESSFUL,
+            ],
+        },
+        {"payment_status": Order.PAYMENT_STATUS_SUCCESSFUL},
+    ),
+    # A capture that arrives after the order was cancelled, e.g. by the
+    # expired stock hold sweeper; a refund is queued right after.
+    "pay_late": Transition(
+        {
+            "order_status": [X],
+            "payment_status": [
+                Order.PAYMENT_STATUS_AWAITING_GATEWAY,
+                Order.PAYMENT_STATUS_PENDING,
+                Order.PAYMENT_STATUS_UNSUCCESSFUL,
+            ],
+        },
+        {"payment_status": Order.PAYMENT_STATUS_SUCCESSFUL},
+    ),
+    "fail_payment": Transition(
+        {
+            "payment_status": [
+                Order.PAYMENT_STATUS_AWAITING_GATEWAY,
+                Order.PAYMENT_STATUS_PENDING,
+            ]
+        },
+        {"payment_status": Order.PAYMENT_STATUS_UNSUCCESSFUL},
+    ),
+    "dispatch": Transition({"order_status": [P]}, {"order_status": D}, paid=True),
+    "ship": Transition({"order_status": [D]}, {"order_status": S}, paid=True),
+    "out_for_delivery": Transition(
+        {"order_status": [S]}, {"order_status": O}, paid=True
+    ),
+    "complete": Transition(
+        {"order_status": [D, S, O]},
+        {"order_status": C},
+        timestamp="delivered_at",
+        event=COMPLETED,
+        paid=True,
+    ),
+    # Digital orders are delivered as soon as they are paid.
+    "complete_digital": Transition(
+        {"order_status": [P]},
+        {"order_status": C},
+        timestamp="delivered_at",
+        event=COMPLETED,
+        paid=True,
+    ),
+    # The customer confirming receipt, possibly of an order still processing
+    # such as a store pickup.
+    "accept": Transition(
+        {"order_status": [P, D, S, O]},
+        {"order_status": C},
+        timestamp="delivered_at",
+        event=COMPLETED,
+        paid=True,
+    ),
+    "cancel": Transition(
+        {"order_status": [P]},
+        {"order_status": X},
+        timestamp="cancelled_at",
+        event=CANCELLED,
+    ),
+    "expire": Transition(
+        {
+            "order_status": [P],
+            "payment_status": [
+                Order.PAYMENT_STATUS_AWAITING_GATEWAY,
+                Order.PAYMENT_STATUS_PENDING,
+                Order.PAYMENT_STATUS_UNSUCCESSFUL,
+            ],
+        },
+        {"order_status": X, "payment_status": Order.PAYMENT_STATUS_UNSUCCESSFUL},
+        timestamp="cancelled_at",
+        event=CANCELLED,
+    ),
+    "refund": Transition(
+        {
+            "payment_method": [Order.PAYMENT_METHOD_RAZORPAY],
+            "payment_status": [Order.PAYMENT_STATUS_SUCCESSFUL],
+        },
+        {
+            "payment_status": Order.PAYMENT_STATUS_REFUNDED,
+            "refund_status": Order.REFUND_STATUS_SUCCESSFUL,
+        },
+        timestamp="refunded_at",
+        event=REFUNDED,
+    ),
+    # Cash collected on delivery.
+    "collect_cash": Transition(
+        {
+            "payment_method": [Order.PAYMENT_METHOD_COD],
+            "payment_status": [Order.PAYMENT_STATUS_PENDING],
+        },
+        {"payment_status": Order.PAYMENT_STATUS_SUCCESSFUL},
+    ),
+    "refund_failed": Transition(
+        {"payment_status": [Order.PAYMENT_STATUS_SUCCESSFUL]},
+        {"refund_status": Order.REFUND_STATUS_FAILED},
+    ),
+}
+# Steps staff move orders through in bulk.
+FULFILLMENT_TRANSITIONS = ["dispatch", "ship", "out_for_delivery", "complete"]
+# Transitions staff may apply to a single order.
+STAFF_TRANSITIONS = FULFILLMENT_TRANSITIONS + ["collect_cash"]
+
+
+def apply(order, name, **fields):
+    """
+    Move ``order`` along transition ``name``, also setting ``fields``. The
+    UPDATE writes only the changed columns and only matches the version the
+    order was read at, so a concurrent change raises OrderConflict instead of
+    being overwritten. The instance is updated in place.
+    """
+    transition = TRANSITIONS[name]
+    state = {field: getattr(order, field) for field in STATE_FIELDS}
+    error = transition.check(name, state)
+    if error:
+        raise InvalidTransition(error)
+    changes = transition.get_changes(timezone.now(), fields)
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, version=order.version).update(
+            **changes, version=F("version") + 1
+        )
+        if not updated:
+            raise OrderConflict()
+        if transition.event:
+            record_orders([order.pk], transition.event)
+    for field, value in changes.items():
+        setattr(order, field, value)
+    order.version += 1
+    return order
+
+
+def compare_and_swap(states, changes):
+    # Rows of each version share one condition: (version = v AND pk IN (...)).
+    by_version = defaultdict(list)
+    for state in states:
+        by_version[state["version"]].append(state["pk"])
+    condition = reduce(
+        or_, [Q(version=version, pk__in=pks) for version, pks in by_version.items()]
+    )
+    return Order.objects.filter(condition).update(**changes, version=F("version") + 1)
+
+
+class PartialUpdate(Exception):
+    pass
+
+
+def apply_many(order_ids, name, now=None, **fields):
+    """
+    Move many orders along transition ``name`` without locking them. Their
+    states are read in one query and every eligible order is swapped in one
+    UPDATE; if a concurrent change made some rows miss, that UPDATE is rolled
+    back and the orders are swapped one by one to tell which ones conflicted.
+    Returns ({order_id: error}, applied ids, changes).
+    """
+    transition = TRANSITIONS[name]
+    changes = transition.get_changes(now or timezone.now(), fields)
+    states = {
+        state["pk"]: state
+        for state in Order.objects.filter(pk__in=order_ids).values("pk", *STATE_FIELDS)
+    }
+    errors = {}
+    eligible = []
+    for order_id in dict.fromkeys(order_ids):
+        state = states.get(order_id)
+        error = "Order not found" if state is None else transition.check(name, state)
+        if error:
+            errors[order_id] = error
+        else:
+            eligible.append(state)
+    if not eligible:
+        return errors, [], changes
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                if compare_and_swap(eligible, changes) != len(eligible):
+                    raise PartialUpdate()
+            applied = [state["pk"] for state in eligible]
+        except PartialUpdate:
+            applied = []
+            for state in eligible:
+                if compare_and_swap([state], changes):
+                    applied.append(state["pk"])
+                else:
+                    errors[state["pk"]] = OrderConflict.default_detail
+        if transition.event:
+            record_orders(applied, transition.event)
+    return errors, applied, changes
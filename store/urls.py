@@ -51,4 +51,14 @@ urlpatterns += [
         views.DispatchOrderView.as_view(),
         name="dispatch-order",
     ),
+    path(
+        "payments/razorpay/webhook/",
+        views.RazorpayWebhookView.as_view(),
+        name="razorpay-webhook",
+    ),
+    path(
+        "reports/sales/",
+        views.SalesReportView.as_view(),
+        name="sales-report",
+    ),
 ]
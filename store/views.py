@@ -1,18 +1,45 @@
+import json
 from django.db import transaction
+from django.db.models import Prefetch
 from django.conf import settings
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, views
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from rest_framework.filters import OrderingFilter, SearchFilter
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
-
-from . import models, serializers, permissions, pagination, filters, services
-
-
-class ProductViewSet(viewsets.ModelViewSet):
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+
+from . import (
+    models,
+    serializers,
+    permissions,
+    pagination,
+    filters,
+    services,
+    stock,
+    tasks,
+)
+from .rollups import sales_report
+from core.compiled import CompiledListMixin
+from core.conditional import ConditionalGetMixin
+from core.sparse import SparseFieldsViewMixin
+from search.filters import IndexedSearchFilter
+from .cache import CatalogCacheMixin
+from .facets import get_facet_conditions, get_product_facets
+from .gateway import GatewayUnavailable
+
+
+class ProductViewSet(
+    ConditionalGetMixin,
+    CatalogCacheMixin,
+    SparseFieldsViewMixin,
+    CompiledListMixin,
+    viewsets.ModelViewSet,
+):
     pagination_class = pagination.DefaultPagination
     permission_classes = [permissions.IsAdminOrReadOnly]
-    filter_backends = [OrderingFilter, SearchFilter, DjangoFilterBackend]
+    filter_backends = [OrderingFilter, IndexedSearchFilter, DjangoFilterBackend]
     filterset_class = filters.ProductFilter
 
     search_fields = ["name"]
@@ -20,8 +47,38 @@ class ProductViewSet(viewsets.ModelViewSet):
     ordering = ["created_at", "net_price"]
     lookup_field = "slug"
 
+    # Checkouts and cancellations move stock all the time.
+    live_fields = ["stock", "is_available"]
+    # Cached responses are cheap, and hashing them also covers the live stock
+    # values, which change without bumping the catalog version.
+    conditional_etag_from_data = True
+
     def get_queryset(self):
-        return models.Product.objects.all()
+        return models.Product.objects.for_fields(self.requested_fields())
+
+    def get_live_values(self, ids):
+        return {
+            pk: {"stock": stock, "is_available": stock > 0}
+            for pk, stock in models.Product.objects.with_stock_totals()
+            .filter(pk__in=ids)
+            .values_list("pk", "stock_total")
+        }
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        def build_response():
+            # Facet filters are left out here and applied per facet instead.
+            queryset = IndexedSearchFilter().filter_queryset(
+                request, models.Product.objects.all(), self
+            )
+            filterset = filters.ProductFilter(request.query_params, queryset=queryset)
+            if not filterset.is_valid():
+                raise ValidationError(filterset.errors)
+            return Response(
+                get_product_facets(queryset, get_facet_conditions(filterset))
+            )
+
+        return self.cached_response("facets", request, build_response)
 
     def get_serializer_class(self):
         if self.request.method in ["POST", "PUT"]:
@@ -32,31 +89,69 @@ class ProductViewSet(viewsets.ModelViewSet):
         return {"request": self.request}
 
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = serializers.CartSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = pagination.DefaultPagination
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return (
-                models.Cart.objects.prefetch_related("cart_items__product")
-                .all()
-                .order_by("user__id")
+        queryset = models.Cart.objects.all()
+        if self.field_requested("total_price"):
+            queryset = queryset.with_items_total()
+        if self.field_requested("cart_items"):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "cart_items", queryset=models.CartItem.objects.with_line_price()
+                )
             )
-        return models.Cart.objects.prefetch_related("cart_items__product").filter(
-            user_id=self.request.user.id
-        )
+        if self.field_expanded("cart_items.product"):
+            queryset = queryset.prefetch_related(
+                models.prefetch_products(
+                    "cart_items__product", self.requested_fields("cart_items.product")
+                )
+            )
+        if self.request.user.is_staff:
+            return queryset.all().order_by("user__id")
+        return queryset.filter(user_id=self.request.user.id)
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete"]
+    permission_classes = [IsAuthenticated]
     pagination_class = pagination.DefaultPagination
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Cart ids are handed to the browser, so knowing one must not be
+        # enough to read or change someone else's cart.
+        if not models.Cart.objects.filter(
+            pk=self.kwargs["cart_pk"], user=request.user
+        ).exists():
+            raise NotFound("Cart not found")
+
     def get_queryset(self):
-        return models.CartItem.objects.select_related("product").filter(
+        queryset = models.CartItem.objects.with_line_price().filter(
             cart_id=self.kwargs["cart_pk"]
         )
+        if self.field_expanded("product"):
+            queryset = queryset.prefetch_related(
+                models.prefetch_products("product", self.requested_fields("product"))
+            )
+        return queryset
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request, *args, **kwargs):
+        serializer = serializers.BulkCartItemSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        items = serializers.CartItemSerializer(
+            self.get_queryset().order_by("pk"),
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(items.data)
 
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -69,7 +164,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
         return {"cart_id": self.kwargs["cart_pk"], "request": self.request}
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SparseFieldsViewMixin, CompiledListMixin, viewsets.ModelViewSet):
     http_method_names = ["get", "post", "patch", "head", "options"]
     pagination_class = pagination.DefaultPagination
     filter_backends = [OrderingFilter, DjangoFilterBackend]
@@ -95,12 +190,15 @@ class OrderViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     def get_queryset(self):
-        queryset = (
-            models.Order.objects.prefetch_related("order_items__product")
-            .select_related("shipping_details")
-            .all()
-            .order_by("-placed_at")
-        )
+        queryset = models.Order.objects.all().order_by("-placed_at")
+        if self.field_requested("order_items"):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "order_items", queryset=models.OrderItem.objects.with_line_price()
+                )
+            )
+        if self.field_expanded("shipping_details"):
+            queryset = queryset.select_related("shipping_details")
         if self.request.user.is_staff:
             return queryset
         return queryset.filter(user_id=self.request.user.id)
@@ -112,8 +210,16 @@ class OrderViewSet(viewsets.ModelViewSet):
             return serializers.UpdateOrderSerializer
         return serializers.OrderSerializer
 
+    @action(detail=False, methods=["post"])
+    def transitions(self, request, *args, **kwargs):
+        serializer = serializers.BulkOrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(
+            {"results": services.transition_orders(**serializer.validated_data)}
+        )
+
     def get_permissions(self):
-        if self.request.method in ["PATCH", "DELETE"]:
+        if self.action == "transitions" or self.request.method in ["PATCH", "DELETE"]:
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
@@ -145,7 +251,7 @@ class DispatchOrderView(views.APIView):
                 status=400,
             )
 
-        order.update_order_status(models.Order.ORDER_STATUS_DISPATCHED)
+        order.transition("dispatch")
         return Response({"message": "Order has been dispatched"}, status=200)
 
 
@@ -165,21 +271,26 @@ class CancelOrderView(views.APIView):
             return Response({"error": "Order can not be cancelled now"}, status=400)
 
         with transaction.atomic():
-            if order.can_be_refunded():
-                response = services.refund_payment(order)
-                if not response["success"]:
-                    order.mark_refund_failed()
-                    return Response({{"error": "Cancellation failed"}}, status=500)
-
-                refund_id = response["refund"]["id"]
-                order.mark_as_refunded(refund_id)
-            elif order.payment_status == models.Order.PAYMENT_STATUS_PENDING:
+            if order.payment_status in [
+                models.Order.PAYMENT_STATUS_AWAITING_GATEWAY,
+                models.Order.PAYMENT_STATUS_PENDING,
+            ]:
                 order.mark_payment_as_failed()
             order.cancel()
-            order_items = models.OrderItem.objects.filter(order=order)
-            for item in order_items:
-                item.product.restore_stock(item.quantity)
-            return Response({"message": "Order cancelled"}, status=200)
+            models.StockHold.objects.filter(order=order).delete()
+            stock.release_stock(
+                models.OrderItem.objects.filter(order=order).values_list(
+                    "product_id", "quantity"
+                )
+            )
+            # The gateway is only called once the cancellation has committed.
+            if order.can_be_refunded():
+                tasks.refund_order.delay(order.pk)
+                return Response(
+                    {"message": "Order cancelled, the payment will be refunded"},
+                    status=200,
+                )
+        return Response({"message": "Order cancelled"}, status=200)
 
 
 class RazorpayPaymentVerifyView(views.APIView):
@@ -199,7 +310,17 @@ class RazorpayPaymentVerifyView(views.APIView):
                 {"error": "You do not have permission to verify this order"}, status=403
             )
 
-        if order.payment_status != models.Order.PAYMENT_STATUS_PENDING:
+        if (
+            order.payment_status == models.Order.PAYMENT_STATUS_SUCCESSFUL
+            and order.razorpay_payment_id == data["razorpay_payment_id"]
+        ):
+            # The payment webhook, or an earlier verification, got here first.
+            return Response({"message": "Payment verified successfully"}, status=200)
+
+        if order.payment_status not in [
+            models.Order.PAYMENT_STATUS_PENDING,
+            models.Order.PAYMENT_STATUS_UNSUCCESSFUL,
+        ]:
             return Response(
                 {"error": "Payment for this order has already been verified or failed"},
                 status=400,
@@ -207,20 +328,59 @@ class RazorpayPaymentVerifyView(views.APIView):
 
         is_verified = services.verify_razorpay_signature(data, order)
 
+        if is_verified and order.order_status == models.Order.ORDER_STATUS_CANCELLED:
+            # Expired holds cancel unpaid orders and release their stock, so a
+            # payment that still went through is refunded rather than kept.
+            return Response(
+                {
+                    "error": "This order was cancelled before the payment arrived, "
+                    "the payment is being refunded"
+                },
+                status=400,
+            )
         if is_verified:
-            order_items = models.OrderItem.objects.filter(order=order)
-            delivered = True
-            for item in order_items:
-                if not item.product.is_digital:
-                    delivered = False
-                    break
-            if delivered:
-                order.mark_as_completed()
             return Response({"message": "Payment verified successfully"}, status=200)
         else:
             return Response({"error": "Payment verification failed"}, status=400)
 
 
+class RazorpayWebhookView(views.APIView):
+    """
+    Stores each signed Razorpay event once and acknowledges it right away;
+    `manage.py process_payment_events` applies them to the orders.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        body = request.body
+        signature = request.headers.get("X-Razorpay-Signature")
+        if not services.verify_webhook_signature(body, signature):
+            return Response({"error": "Invalid signature"}, status=400)
+
+        event_id = request.headers.get("X-Razorpay-Event-Id")
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if not event_id or not isinstance(payload, dict):
+            return Response({"error": "Invalid event"}, status=400)
+
+        # Redeliveries hit the unique event_id and are dropped by the insert.
+        models.PaymentEvent.objects.bulk_create(
+            [
+                models.PaymentEvent(
+                    event_id=event_id,
+                    event=str(payload.get("event", "")),
+                    payload=payload,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        return Response(status=200)
+
+
 class RetryRazorpayPaymentView(views.APIView):
     def post(self, request, id):
         try:
@@ -228,7 +388,10 @@ class RetryRazorpayPaymentView(views.APIView):
         except models.Order.DoesNotExist:
             return Response({"error": "Order not found"}, status=404)
 
-        if order.payment_status != order.PAYMENT_STATUS_PENDING:
+        if order.payment_status not in [
+            order.PAYMENT_STATUS_AWAITING_GATEWAY,
+            order.PAYMENT_STATUS_PENDING,
+        ]:
             return Response({"error": "Order is not eligible for retry"}, status=400)
 
         if order.payment_method != order.PAYMENT_METHOD_RAZORPAY:
@@ -236,10 +399,15 @@ class RetryRazorpayPaymentView(views.APIView):
                 {"error": "Only online payments can be retried"}, status=400
             )
 
-        razorpay_order = services.create_razorpay_order(order)
-        order.razorpay_order_id = razorpay_order["id"]
-        order.payment_status = models.Order.PAYMENT_STATUS_PENDING
-        order.save()
+        try:
+            razorpay_order = services.create_razorpay_order(order)
+        except GatewayUnavailable:
+            return Response(
+                {"error": "Payment gateway is unavailable, please try again later"},
+                status=503,
+            )
+        order.transition("retry_payment", razorpay_order_id=razorpay_order["id"])
+        stock.extend_stock_holds(order)
 
         return Response(
             {
@@ -276,8 +444,17 @@ class AcceptOrderView(views.APIView):
                 status=400,
             )
 
-        order.mark_as_completed()
+        order.transition("accept")
 
         return Response(
             {"message": "Your order was completed successfully"}, status=200
         )
+
+
+class SalesReportView(views.APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        serializer = serializers.SalesReportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(sales_report(**serializer.validated_data))